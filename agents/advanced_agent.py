@@ -1,41 +1,57 @@
-from langchain_anthropic import ChatAnthropic
+import asyncio
+import os
+
 from langchain.agents import initialize_agent, AgentType
 from langchain.prompts import MessagesPlaceholder
-from langchain.memory import ConversationBufferMemory
 from langchain.tools import Tool
 
 from tools.weather_tool import WeatherTool
 from tools.hotel_tool import HotelTool
-from utils.helpers import UserProfile
+from utils.helpers import UserProfile, create_memory
+from utils.intent_router import get_intent_router, parse_nightly_yen
+from utils.model_router import create_tiered_llm, llm_for_role
+from utils.tracing import AGENT_ROLE_KEY
+from utils.preference_extractor import get_preference_extractor
+from utils.prefetch import TurnPrefetch, prefetch_enabled
 
 class AdvancedTravelAgent:
-    def __init__(self, api_key):
-        """高度な旅行エージェントの初期化（Claude用）"""
-        self.llm = ChatAnthropic(
-            api_key=api_key,
-            model="claude-3-haiku-20240307",
-            temperature=0.7
-        )
+    # 応答はReAct形式（"action": "Final Answer"）で生成される
+    react_output = True
+    # ユーザープロファイルを使う
+    uses_user_profile = True
+    # 単純な問い合わせはLLMを呼ばずにツールで直接答える（utils.intent_router）
+    uses_intent_router = True
+    
+    def __init__(self, api_key, memory_mode=None, user_profile=None, llm=None, model_routes=None, compact_payloads=None):
+        """高度な旅行エージェントの初期化（Claude用）
+
+        model_routes: 役割ごとのモデルの階層の割り当て（未指定かつ環境変数MODEL_ROUTESも未設定なら振り分けない）
+        compact_payloads: ReActで使うツールの結果を簡潔な形式で返すか（既定は環境変数COMPACT_PAYLOADS、未設定ならon）
+        """
+        self.llm = llm or create_tiered_llm(api_key, model_routes)
         
-        # ユーザープロファイルの初期化
-        self.user_profile = UserProfile()
+        # ユーザープロファイルの初期化（指定されなければ保存しない空のプロファイル）
+        self.user_profile = user_profile or UserProfile()
         
         # メモリの初期化
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        self.memory = create_memory(self.llm, mode=memory_mode)
         
-        # ツールの初期化
+        # ツールの初期化（モデルが読む結果は簡潔な形式で返す）
+        if compact_payloads is None:
+            compact_payloads = os.getenv("COMPACT_PAYLOADS", "on") != "off"
+        self.weather_tool = WeatherTool(compact=compact_payloads)
+        self.hotel_tool = HotelTool(compact=compact_payloads)
         self.tools = [
             Tool(
                 name="WeatherTool",
-                func=WeatherTool()._run,
+                func=self.weather_tool._run,
+                coroutine=self.weather_tool._arun,
                 description="旅行先の天気情報を取得するツール。引数として都市名を指定してください。"
             ),
             Tool(
                 name="HotelTool",
-                func=HotelTool()._run,
+                func=self.hotel_tool._run,
+                coroutine=self.hotel_tool._arun,
                 description="旅行先のホテル情報を検索するツール。引数として「都市名,予算(円)」の形式で指定してください。例: 東京,15000"
             ),
             Tool(
@@ -49,20 +65,32 @@ class AdvancedTravelAgent:
                 description="ユーザープロファイルの情報を取得するツール。引数は必要ありません。"
             )
         ]
+        # 単純な問い合わせにReActを経ずに答えるときに使うツール（結果がそのまま応答になるため文章で返す）
+        text_weather_tool, text_hotel_tool = WeatherTool(), HotelTool()
+        self.fast_path_tools = {
+            "weather": self.tools[0].model_copy(update={"func": text_weather_tool._run, "coroutine": text_weather_tool._arun}),
+            "hotel": self.tools[1].model_copy(update={"func": text_hotel_tool._run, "coroutine": text_hotel_tool._arun})
+        }
         
         # エージェントの初期化
         self.agent = initialize_agent(
             tools=self.tools,
-            llm=self.llm,
+            llm=llm_for_role(self.llm, "advanced"),
             agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
             memory=self.memory,
+            metadata={AGENT_ROLE_KEY: "advanced"},
             agent_kwargs={
-                "system_message": """あなたは旅行プランニングの専門家です。ユーザーの質問に答え、旅行プランを提案してください。
-                ユーザーの好みや過去の旅行履歴を学習し、パーソナライズされた提案をしてください。
-                必要に応じて、天気情報やホテル情報などのツールを使用してください。
-                ユーザーの好みや過去の旅行情報は、UpdateUserProfileツールを使って更新し、GetUserProfileツールで取得できます。
-                """,
-                "extra_prompt_messages": [MessagesPlaceholder(variable_name="chat_history")]
+                # 変わらない指示とツールの説明をシステムメッセージとして先頭に置き、会話履歴はその後に続ける
+                # （接頭辞がプロンプトキャッシュの対象になる）
+                "prefix": (
+                    "あなたは旅行プランニングの専門家です。ユーザーの質問に答え、旅行プランを提案してください。\n"
+                    "ユーザーの好みや過去の旅行履歴を学習し、パーソナライズされた提案をしてください。\n"
+                    "必要に応じて、天気情報やホテル情報などのツールを使用してください。\n"
+                    "ユーザーの好みや過去の旅行情報は、UpdateUserProfileツールを使って更新し、GetUserProfileツールで取得できます。\n"
+                    "次のツールを使用できます:"
+                ),
+                "memory_prompts": [MessagesPlaceholder(variable_name="chat_history")],
+                "input_variables": ["input", "chat_history", "agent_scratchpad"]
             },
             verbose=True
         )
@@ -103,53 +131,51 @@ class AdvancedTravelAgent:
         """ユーザープロファイルを取得するツール"""
         return self.user_profile.get_profile_summary()
     
-    def get_response(self, user_input):
+    def get_response(self, user_input, callbacks=None):
         """ユーザー入力に対する応答を取得"""
-        response = self.agent.run(user_input)
+        # 天気やホテルだけを尋ねる単純な問い合わせは、ツールで直接答える
+        intent = get_intent_router().route(user_input)
+        if intent is not None:
+            response = get_intent_router().answer(intent, self.fast_path_tools, self.memory, user_input, callbacks)
+        else:
+            with self._start_prefetch(user_input).activate():
+                response = self.agent.run(user_input, callbacks=callbacks)
         
         # ユーザーの好みを自動的に抽出して更新
         self._extract_preferences(user_input)
         
         return response
     
-    def _extract_preferences(self, user_input):
-        """ユーザー入力から好みを抽出して更新（簡易的な実装）"""
-        # 実際のアプリケーションでは、より高度なNLPを使用することをお勧めします
+    async def aget_response(self, user_input, callbacks=None):
+        """ユーザー入力に対する応答を非同期で取得"""
+        intent = get_intent_router().route(user_input)
+        if intent is not None:
+            response = await get_intent_router().aanswer(intent, self.fast_path_tools, self.memory, user_input, callbacks)
+        else:
+            with self._start_prefetch(user_input).activate():
+                response = await self.agent.arun(user_input, callbacks=callbacks)
         
-        # 旅行先の抽出（簡易的）
-        destinations = ["東京", "大阪", "京都", "札幌", "那覇", "沖縄", "北海道", "福岡", "名古屋", "広島"]
-        for dest in destinations:
-            if dest in user_input:
-                self.user_profile.update_preference("destinations", dest)
+        # ユーザーの好みを自動的に抽出して更新（プロファイルの保存先への書き込みは別スレッドで行う）
+        await asyncio.to_thread(self._extract_preferences, user_input)
         
-        # アクティビティの抽出（簡易的）
-        activities = ["観光", "グルメ", "ショッピング", "温泉", "ハイキング", "ビーチ", "美術館", "博物館"]
-        for act in activities:
-            if act in user_input:
-                self.user_profile.update_preference("activities", act)
-        
-        # 予算の抽出（簡易的）
-        import re
-        budget_match = re.search(r'予算[は]?(\d+)万?円', user_input)
-        if budget_match:
-            budget = int(budget_match.group(1))
-            if "万" in budget_match.group(0):
-                budget *= 10000
-            else:
-                budget *= 1000
-            self.user_profile.update_preference("budget", budget)
-        
-        # 旅行スタイルの抽出（簡易的）
-        styles = {
-            "贅沢": ["贅沢", "高級", "ラグジュアリー"],
-            "節約": ["節約", "安い", "格安", "バジェット"],
-            "アドベンチャー": ["アドベンチャー", "冒険", "アクティブ"],
-            "リラックス": ["リラックス", "のんびり", "ゆっくり"],
-            "文化体験": ["文化", "歴史", "伝統"]
-        }
-        
-        for style, keywords in styles.items():
-            for keyword in keywords:
-                if keyword in user_input:
-                    self.user_profile.update_preference("travel_style", style)
-                    break
\ No newline at end of file
+        return response
+    
+    def _start_prefetch(self, user_input):
+        """入力にある旅行先の天気とホテルの取得を、最初のLLM呼び出しと並行して始める
+
+        ホテルは入力に1泊あたりの予算がある場合だけ、エージェントがHotelToolに渡す「都市名,予算」と同じ条件で検索しておく
+        （抽出した予算やプロファイルの予算は旅行全体の予算のため、HotelToolの引数とは一致しない）。
+        """
+        turn = TurnPrefetch()
+        if prefetch_enabled():
+            cities = get_preference_extractor().extract(user_input)["destinations"]
+            if cities:
+                self.weather_tool.prefetch(cities, turn)
+                budget = parse_nightly_yen(user_input)
+                if budget:
+                    self.hotel_tool.prefetch(cities, budget, turn)
+        return turn
+    
+    def _extract_preferences(self, user_input):
+        """ユーザー入力から好みを抽出して更新"""
+        return get_preference_extractor().apply(self.user_profile, user_input)
@@ -1,41 +1,48 @@
-from langchain_anthropic import ChatAnthropic
 from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from utils.helpers import create_memory
+from utils.model_router import create_tiered_llm, llm_for_role
+from utils.tracing import AGENT_ROLE_KEY
 
 class BasicTravelAgent:
-    def __init__(self, api_key):
-        """基本的な旅行エージェントの初期化（Claude用）"""
-        self.llm = ChatAnthropic(
-            api_key=api_key,
-            model="claude-3-haiku-20240307",  # Claudeのモデル名例
-            temperature=0.7
-        )
+    # 応答はReAct形式ではなくそのまま回答文として生成される
+    react_output = False
+    # ユーザープロファイルは使わない
+    uses_user_profile = False
+    # すべての入力をLLMで答える
+    uses_intent_router = False
+    
+    def __init__(self, api_key, memory_mode=None, llm=None, model_routes=None):
+        """基本的な旅行エージェントの初期化（Claude用）
+
+        model_routes: 役割ごとのモデルの階層の割り当て（未指定かつ環境変数MODEL_ROUTESも未設定なら振り分けない）
+        """
+        self.llm = llm or create_tiered_llm(api_key, model_routes)
         
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        self.memory = create_memory(self.llm, mode=memory_mode)
         
-        self.prompt = PromptTemplate(
-            input_variables=["chat_history", "input"],
-            template="""あなたは旅行プランニングの専門家です。ユーザーの質問に答え、旅行プランを提案してください。
-            
-            これまでの会話:
-            {chat_history}
-            
-            ユーザー: {input}
-            旅行アドバイザー:"""
-        )
+        # 変わらない指示を先頭に置き、会話履歴と入力はその後に続ける（接頭辞がプロンプトキャッシュの対象になる）
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", "あなたは旅行プランニングの専門家です。ユーザーの質問に答え、旅行プランを提案してください。"),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", "{input}")
+        ])
         
+        # 応答は1回の呼び出しでそのまま回答になるため、最終回答の階層を使う
         self.chain = LLMChain(
-            llm=self.llm,
+            llm=llm_for_role(self.llm, "basic", final_only=True),
             prompt=self.prompt,
             memory=self.memory,
+            metadata={AGENT_ROLE_KEY: "basic"},
             verbose=True
         )
     
-    def get_response(self, user_input):
+    def get_response(self, user_input, callbacks=None):
         """ユーザー入力に対する応答を取得"""
-        response = self.chain.predict(input=user_input)
+        response = self.chain.predict(input=user_input, callbacks=callbacks)
+        return response
+    
+    async def aget_response(self, user_input, callbacks=None):
+        """ユーザー入力に対する応答を非同期で取得"""
+        response = await self.chain.apredict(input=user_input, callbacks=callbacks)
         return response
\ No newline at end of file
@@ -0,0 +1,107 @@
+import importlib
+import os
+import threading
+import weakref
+
+from utils.helpers import UserProfile
+from utils.startup import startup_timings
+
+# エージェント種別と実装（モジュール, クラス名）の対応
+# モジュールは初めて使われたときに読み込む（使わない種別のLangChainの初期化を起動時に払わない）
+AGENT_MODULES = {
+    "basic": ("agents.basic_agent", "BasicTravelAgent"),
+    "advanced": ("agents.advanced_agent", "AdvancedTravelAgent"),
+    "multi": ("agents.multi_agent_system", "MultiAgentSystem"),
+}
+
+AGENT_TYPES = tuple(AGENT_MODULES)
+
+DEFAULT_AGENT_TYPE = "advanced"
+
+_agent_classes = {}
+_agent_classes_lock = threading.Lock()
+
+def resolve_agent_type(agent_type):
+    """未知のエージェント種別をデフォルトに丸める"""
+    return agent_type if agent_type in AGENT_MODULES else DEFAULT_AGENT_TYPE
+
+def get_agent_class(agent_type):
+    """エージェントのクラスを取得する（初回のみモジュールを読み込む）"""
+    agent_type = resolve_agent_type(agent_type)
+    agent_class = _agent_classes.get(agent_type)
+    if agent_class is None:
+        with _agent_classes_lock:
+            agent_class = _agent_classes.get(agent_type)
+            if agent_class is None:
+                module_name, class_name = AGENT_MODULES[agent_type]
+                with startup_timings.measure_import(module_name):
+                    module = importlib.import_module(module_name)
+                agent_class = _agent_classes[agent_type] = getattr(module, class_name)
+    return agent_class
+
+def create_agent(agent_type, api_key, **options):
+    """指定された種別のエージェントを新しく作成する（optionsはエージェントのコンストラクタに渡す）"""
+    agent_type = resolve_agent_type(agent_type)
+    agent_class = get_agent_class(agent_type)
+    with startup_timings.measure_construction(agent_type):
+        return agent_class(api_key, **options)
+
+def needs_llm(agent_type, user_input):
+    """この種別のエージェントが入力に答えるのにLLMを呼ぶか（ツールで直接答える単純な問い合わせはFalse）"""
+    if not get_agent_class(agent_type).uses_intent_router:
+        return True
+    from utils.intent_router import get_intent_router
+    return get_intent_router().match(user_input) is None
+
+def warm_up(agent_types, api_key=None):
+    """指定された種別のモジュールを読み込んでおく
+
+    api_keyを指定すると、エージェントを1つずつ作成して捨て、ツールの索引や抽出器など
+    プロセス内で共有される初期化も済ませる。
+    """
+    for agent_type in agent_types:
+        get_agent_class(agent_type)
+        if api_key:
+            create_agent(agent_type, api_key)
+
+
+def mode_model_routes():
+    """エージェント種別ごとのモデルの階層の割り当てを環境変数MODEL_ROUTES_<種別>（例: MODEL_ROUTES_MULTI）から読む
+
+    値は'coordinator=fast/strong,researcher=fast'の形式で、エージェントの作成時に解釈する
+    （ここではLangChainを読み込まない）。
+    """
+    routes = {}
+    for agent_type in AGENT_TYPES:
+        spec = os.getenv(f"MODEL_ROUTES_{agent_type.upper()}")
+        if spec:
+            routes[agent_type] = spec
+    return routes
+
+
+def make_session_agent_factory(api_key, profile_store=None, model_routes=None):
+    """セッションごとのエージェントを作成する関数を返す
+
+    user_idが指定されると、プロファイルを使うエージェントには保存先から読み込んだプロファイルを渡す。
+    同じuser_idのセッション（エージェント種別が異なる場合も）には同じプロファイルを渡し、
+    どのセッションの更新も失われないようにする（使うセッションがなくなれば破棄する）。
+    model_routesはエージェント種別ごとのモデルの階層の割り当て（{"multi": {"planner": ("fast", "strong")}}など）。
+    """
+    profiles = weakref.WeakValueDictionary()
+    profiles_lock = threading.Lock()
+
+    def shared_profile(user_id):
+        with profiles_lock:
+            profile = profiles.get(user_id)
+            if profile is None:
+                profile = profiles[user_id] = UserProfile.load(user_id, profile_store)
+            return profile
+
+    def factory(agent_type, user_id=None, **options):
+        agent_type = resolve_agent_type(agent_type)
+        if model_routes and agent_type in model_routes:
+            options.setdefault("model_routes", model_routes[agent_type])
+        if profile_store is not None and user_id and get_agent_class(agent_type).uses_user_profile:
+            options["user_profile"] = shared_profile(user_id)
+        return create_agent(agent_type, api_key, **options)
+    return factory
@@ -1,47 +1,149 @@
-from langchain_anthropic import ChatAnthropic
+import asyncio
+import functools
+import os
+import re
+
 from langchain.agents import initialize_agent, AgentType, Tool
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import MessagesPlaceholder
-from langchain.schema import SystemMessage
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import BaseTool
+from langchain_core.output_parsers import StrOutputParser
 
 from tools.weather_tool import WeatherTool
 from tools.hotel_tool import HotelTool
-from utils.helpers import UserProfile
+from utils.artifacts import ArtifactStore
+from utils.helpers import UserProfile, compact_text, create_memory
+from utils.intent_router import get_intent_router, parse_nightly_yen
+from utils.model_router import create_tiered_llm, llm_for_role
+from utils.llm_scheduler import LLMOverloaded
+from utils.tracing import AGENT_ROLE_KEY, trace_event
+from utils.preference_extractor import get_preference_extractor
+from utils.prefetch import TurnPrefetch, prefetch_enabled
+from utils.task_scheduler import TaskScheduler
+
+# 会話で1泊あたりの予算が指定されていない場合にホテル検索で使う1泊あたりの上限（円）
+# （プロファイルの予算は旅行全体の予算のため、1泊の上限には使わない）
+DEFAULT_HOTEL_BUDGET = 30000
+
+# 共有メモリの成果物と、その入力（他の成果物、またはユーザープロファイルと会話から分かる事実）
+# ユーザープロファイルが変わったときは、入力が変わった成果物とその後続だけを作り直す
+# エージェントが作る成果物は依頼文（task）も入力に含め、依頼文が変われば作り直す
+ARTIFACT_DEPENDENCIES = {
+    "research_results": ("destinations", "dates"),
+    "hotel_options": ("destinations", "nightly_budget"),
+    "travel_plan": ("research_results", "hotel_options", "profile"),
+    "budget_analysis": ("travel_plan", "budget"),
+}
+
+# エージェント間で渡す成果物の長さの上限（受け取る役割ごとのトークン数の目安）
+PAYLOAD_TOKEN_BUDGETS = {"coordinator": 1200, "planner": 600, "budget_manager": 500}
+
+# 旅行の日程（「2泊3日」「3日間」「8月10日〜12日」など）
+_TRIP_DATES = re.compile(r"\d+泊\d+日|\d+日間|\d+月\d+日(?:\s*(?:〜|～|~|-|から)\s*(?:\d+月)?\d+日)?")
+
+# 実行モード
+#   coordinator: コーディネーターがReActで各エージェントにタスクを割り当てる
+#   pipeline:    リサーチ→プラン→予算を決まった順に実行し、最後に1回だけ結果を統合する
+EXECUTION_MODES = ("coordinator", "pipeline")
+
+# pipelineモードの各段階のプロンプト（システムメッセージ, 入力）
+# ユーザープロファイルと前段の結果はツールで取得させず、プロンプトに直接埋め込む
+PIPELINE_PROMPTS = {
+    "researcher": (
+        "あなたは旅行先の情報を収集するリサーチエージェントです。ユーザープロファイルと天気情報を踏まえ、ユーザーの好みに合った観光スポット、グルメ、アクティビティ、ベストシーズンなどを、詳細かつ構造化された形式でまとめてください。",
+        "【ユーザープロファイル】\n{profile}\n\n【天気情報】\n{weather}\n\n【依頼】\n{task}"
+    ),
+    "planner": (
+        "あなたは旅行プランを作成するプランナーエージェントです。ユーザープロファイル、リサーチ結果、ホテル候補をもとに、日程ごとの詳細なスケジュール、宿泊施設、交通手段などを含む旅行プランを構造化された形式で作成してください。",
+        "【ユーザープロファイル】\n{profile}\n\n【リサーチ結果】\n{research}\n\n【ホテル候補】\n{hotels}\n\n【依頼】\n{task}"
+    ),
+    "budget_manager": (
+        "あなたは旅行の予算を管理する予算管理エージェントです。ユーザープロファイルと旅行プランをもとに、宿泊費、交通費、食費、アクティビティ費、その他の費用の内訳と、予算を節約・活用するための提案をまとめてください。",
+        "【ユーザープロファイル】\n{profile}\n\n【旅行プラン】\n{plan}\n\n【依頼】\n{task}"
+    ),
+    "coordinator": (
+        "あなたは旅行プランニングシステムのコーディネーターです。リサーチ結果、旅行プラン、予算分析を統合して、ユーザーに最適な旅行プランを提案してください。",
+        "{input}\n\n【リサーチ結果】\n{research}\n\n【旅行プラン】\n{plan}\n\n【予算分析】\n{budget}"
+    ),
+}
 
 class MultiAgentSystem:
-    def __init__(self, api_key):
-        """マルチエージェントシステムの初期化（Claude用）"""
-        # 共通のLLM
-        self.llm = ChatAnthropic(
-            api_key=api_key,
-            model="claude-3-haiku-20240307",
-            temperature=0.7
-        )
+    # ユーザープロファイルを使う
+    uses_user_profile = True
+    # 単純な問い合わせはLLMを呼ばずにツールで直接答える（utils.intent_router）
+    uses_intent_router = True
+    
+    def __init__(self, api_key, memory_mode=None, user_profile=None, llm=None, execution_mode=None, model_routes=None,
+                 compact_payloads=None):
+        """マルチエージェントシステムの初期化（Claude用）
+
+        execution_mode: coordinator（既定は環境変数MULTI_AGENT_MODE）または pipeline
+        model_routes: 役割（coordinator, researcher, planner, budget_manager）ごとのモデルの階層の割り当て
+            （例: {"planner": ("fast", "strong")}。未指定かつ環境変数MODEL_ROUTESも未設定なら振り分けない）
+        compact_payloads: ツールの結果を簡潔な形式で返し、エージェント間で渡す成果物を受け取る役割ごとの
+            上限（PAYLOAD_TOKEN_BUDGETS）に切り詰めるか（既定は環境変数COMPACT_PAYLOADS、未設定ならon）
+        """
+        # 共通のLLM（各エージェントには役割に応じた階層に振り分けるモデルを渡す）
+        self.llm = llm or create_tiered_llm(api_key, model_routes)
+        
+        self.execution_mode = execution_mode or os.getenv("MULTI_AGENT_MODE", "coordinator")
+        if self.execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"不明な実行モード'{self.execution_mode}'です。coordinator または pipeline を指定してください。")
+        # coordinatorモードの応答はReAct形式（"action": "Final Answer"）、pipelineモードは文章をそのまま返す
+        self.react_output = self.execution_mode != "pipeline"
+        
+        # ユーザープロファイル（指定されなければ保存しない空のプロファイル）
+        self.user_profile = user_profile or UserProfile()
         
-        # ユーザープロファイル
-        self.user_profile = UserProfile()
+        # 各エージェントのメモリの種類
+        self.memory_mode = memory_mode
         
-        # 共通ツール
-        self.weather_tool = WeatherTool()
-        self.hotel_tool = HotelTool()
+        if compact_payloads is None:
+            compact_payloads = os.getenv("COMPACT_PAYLOADS", "on") != "off"
+        self.compact_payloads = compact_payloads
+        
+        # 共通ツール（エージェントが読む結果は簡潔な形式で返す）
+        self.weather_tool = WeatherTool(compact=compact_payloads)
+        self.hotel_tool = HotelTool(compact=compact_payloads)
+        # サブエージェントが使うツール
+        self.agent_tools = self._travel_tools(self.weather_tool, self.hotel_tool)
+        # 単純な問い合わせにコーディネーターを経ずに直接使うツール（結果がそのまま応答になるため文章で返す）
+        self.fast_path_tools = self._travel_tools(WeatherTool(), HotelTool())
         
         # エージェントの初期化
         self.coordinator = self._create_coordinator()
         self.researcher = self._create_researcher()
         self.planner = self._create_planner()
         self.budget_manager = self._create_budget_manager()
+        self.pipeline = self._create_pipeline()
+        
+        # 会話で指定された旅行の日程（リサーチの入力）と1泊あたりの予算（ホテル候補の入力）
+        self.trip_dates = None
+        self.nightly_budget = None
         
-        # エージェント間の通信用メモリ
-        self.shared_memory = {
-            "research_results": "",
-            "travel_plan": "",
-            "budget_analysis": ""
+        # エージェント間の通信用メモリ（入力が変わっていない成果物は作り直さずに再利用する）
+        self.shared_memory = ArtifactStore(ARTIFACT_DEPENDENCIES, self._planning_facts)
+    
+    def _travel_tools(self, weather_tool, hotel_tool):
+        """天気とホテルのツールをエージェント用のToolにする"""
+        return {
+            "weather": Tool(
+                name="WeatherTool",
+                func=weather_tool._run,
+                coroutine=weather_tool._arun,
+                description="旅行先の天気情報を取得するツール。引数として都市名を指定してください。"
+            ),
+            "hotel": Tool(
+                name="HotelTool",
+                func=hotel_tool._run,
+                coroutine=hotel_tool._arun,
+                description="旅行先のホテル情報を検索するツール。引数として「都市名,予算(円)」の形式で指定してください。例: 東京,15000"
+            )
         }
     
     def _create_coordinator(self):
         """コーディネーターエージェントの作成"""
-        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        # コーディネーターの会話履歴がユーザーとの会話になる
+        self.memory = create_memory(self.llm, mode=self.memory_mode)
         
         tools = [
             Tool(
@@ -57,18 +159,27 @@ class MultiAgentSystem:
             Tool(
                 name="AssignResearchTask",
                 func=self._assign_research_task,
+                coroutine=self._aassign_research_task,
                 description="リサーチエージェントにタスクを割り当てるツール。引数として調査すべき内容を指定してください。"
             ),
             Tool(
                 name="AssignPlanningTask",
                 func=self._assign_planning_task,
+                coroutine=self._aassign_planning_task,
                 description="プランナーエージェントにタスクを割り当てるツール。引数として計画すべき内容を指定してください。"
             ),
             Tool(
                 name="AssignBudgetTask",
                 func=self._assign_budget_task,
+                coroutine=self._aassign_budget_task,
                 description="予算管理エージェントにタスクを割り当てるツール。引数として予算分析すべき内容を指定してください。"
             ),
+            Tool(
+                name="RunPlanningWorkflow",
+                func=self._run_planning_workflow,
+                coroutine=self._arun_planning_workflow,
+                description="リサーチ、ホテル検索、旅行プラン作成、予算分析をまとめて実行するツール。互いに依存しない作業は並列に実行されます。引数として旅行の要望を指定してください。"
+            ),
             Tool(
                 name="GetResearchResults",
                 func=self._get_research_results,
@@ -88,32 +199,35 @@ class MultiAgentSystem:
         
         return initialize_agent(
             tools=tools,
-            llm=self.llm,
+            llm=llm_for_role(self.llm, "coordinator"),
             agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-            memory=memory,
+            memory=self.memory,
+            metadata={AGENT_ROLE_KEY: "coordinator"},
             agent_kwargs={
-                "system_message": SystemMessage(content="""あなたは旅行プランニングシステムのコーディネーターです。
-                ユーザーの要望を理解し、適切なエージェントにタスクを割り当ててください。
-                まず、ユーザーの好みや要望を理解し、必要に応じてユーザープロファイルを更新してください。
-                次に、リサーチエージェントに旅行先の情報収集を依頼し、その結果を取得してください。
-                その後、プランナーエージェントに旅行プランの作成を依頼し、予算管理エージェントに予算の分析を依頼してください。
-                最後に、すべての情報を統合して、ユーザーに最適な旅行プランを提案してください。
-                """),
-                "extra_prompt_messages": [MessagesPlaceholder(variable_name="chat_history")]
+                # 変わらない指示とツールの説明をシステムメッセージとして先頭に置き、会話履歴はその後に続ける
+                "prefix": (
+                    "あなたは旅行プランニングシステムのコーディネーターです。\n"
+                    "ユーザーの要望を理解し、適切なエージェントにタスクを割り当ててください。\n"
+                    "まず、ユーザーの好みや要望を理解し、必要に応じてユーザープロファイルを更新してください。\n"
+                    "次に、リサーチエージェントに旅行先の情報収集を依頼し、その結果を取得してください。\n"
+                    "その後、プランナーエージェントに旅行プランの作成を依頼し、予算管理エージェントに予算の分析を依頼してください。\n"
+                    "旅行プラン全体を作成する場合は、RunPlanningWorkflowツールでリサーチからの一連の作業をまとめて実行できます。\n"
+                    "各エージェントの結果は、旅行先・日程・予算などの入力が変わっていなければ再実行せずに再利用されます。\n"
+                    "最後に、すべての情報を統合して、ユーザーに最適な旅行プランを提案してください。\n"
+                    "次のツールを使用できます:"
+                ),
+                "memory_prompts": [MessagesPlaceholder(variable_name="chat_history")],
+                "input_variables": ["input", "chat_history", "agent_scratchpad"]
             },
             verbose=True
         )
     
     def _create_researcher(self):
         """リサーチエージェントの作成"""
-        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        memory = create_memory(self.llm, mode=self.memory_mode)
         
         tools = [
-            Tool(
-                name="WeatherTool",
-                func=self.weather_tool._run,
-                description="旅行先の天気情報を取得するツール。引数として都市名を指定してください。"
-            ),
+            self.agent_tools["weather"],
             Tool(
                 name="GetUserProfile",
                 func=self._get_user_profile,
@@ -123,24 +237,21 @@ class MultiAgentSystem:
         
         return initialize_agent(
             tools=tools,
-            llm=self.llm,
+            llm=llm_for_role(self.llm, "researcher"),
             agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
             memory=memory,
+            metadata={AGENT_ROLE_KEY: "researcher"},
             agent_kwargs={
-                "system_message": """あなたは旅行先の情報を収集するリサーチエージェントです。与えられたタスクに基づいて、旅行先の情報を収集してください。天気情報ツールを使用して、旅行先の天気情報を取得できます。また、ユーザープロファイルを参照して、ユーザーの好みに合った情報を収集してください。収集した情報は、観光スポット、グルメ、アクティビティ、ベストシーズンなどを含む、詳細かつ構造化された形式で提供してください。"""
+                "prefix": """あなたは旅行先の情報を収集するリサーチエージェントです。与えられたタスクに基づいて、旅行先の情報を収集してください。天気情報ツールを使用して、旅行先の天気情報を取得できます。また、ユーザープロファイルを参照して、ユーザーの好みに合った情報を収集してください。収集した情報は、観光スポット、グルメ、アクティビティ、ベストシーズンなどを含む、詳細かつ構造化された形式で提供してください。次のツールを使用できます:"""
             }
         )
     
     def _create_planner(self):
         """プランナーエージェントの作成"""
-        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        memory = create_memory(self.llm, mode=self.memory_mode)
         
         tools = [
-            Tool(
-                name="HotelTool",
-                func=self.hotel_tool._run,
-                description="旅行先のホテル情報を検索するツール。引数として「都市名,予算(円)」の形式で指定してください。例: 東京,15000"
-            ),
+            self.agent_tools["hotel"],
             Tool(
                 name="GetUserProfile",
                 func=self._get_user_profile,
@@ -148,24 +259,25 @@ class MultiAgentSystem:
             ),
             Tool(
                 name="GetResearchResults",
-                func=self._get_research_results,
+                func=functools.partial(self._get_research_results, role="planner"),
                 description="リサーチエージェントの調査結果を取得するツール。引数は必要ありません。"
             )
         ]
         
         return initialize_agent(
             tools=tools,
-            llm=self.llm,
+            llm=llm_for_role(self.llm, "planner"),
             agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
             memory=memory,
+            metadata={AGENT_ROLE_KEY: "planner"},
             agent_kwargs={
-                "system_message": """あなたは旅行プランを作成するプランナーエージェントです。与えられたタスクに基づいて、詳細な旅行プランを作成してください。ホテル検索ツールを使用して、適切な宿泊施設を提案できます。また、ユーザープロファイルとリサーチ結果を参照して、ユーザーの好みに合ったプランを作成してください。作成したプランは、日程ごとの詳細なスケジュール、宿泊施設、交通手段などを含む、構造化された形式で提供してください。"""
+                "prefix": """あなたは旅行プランを作成するプランナーエージェントです。与えられたタスクに基づいて、詳細な旅行プランを作成してください。ホテル検索ツールを使用して、適切な宿泊施設を提案できます。また、ユーザープロファイルとリサーチ結果を参照して、ユーザーの好みに合ったプランを作成してください。作成したプランは、日程ごとの詳細なスケジュール、宿泊施設、交通手段などを含む、構造化された形式で提供してください。次のツールを使用できます:"""
             }
         )
     
     def _create_budget_manager(self):
         """予算管理エージェントの作成"""
-        memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        memory = create_memory(self.llm, mode=self.memory_mode)
         
         tools = [
             Tool(
@@ -175,21 +287,36 @@ class MultiAgentSystem:
             ),
             Tool(
                 name="GetTravelPlan",
-                func=self._get_travel_plan,
+                func=functools.partial(self._get_travel_plan, role="budget_manager"),
                 description="プランナーエージェントの旅行プランを取得するツール。引数は必要ありません。"
             )
         ]
         
         return initialize_agent(
             tools=tools,
-            llm=self.llm,
+            llm=llm_for_role(self.llm, "budget_manager"),
             agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
             memory=memory,
+            metadata={AGENT_ROLE_KEY: "budget_manager"},
             agent_kwargs={
-                "system_message": """あなたは旅行の予算を管理する予算管理エージェントです。与えられたタスクに基づいて、旅行の予算分析を行ってください。ユーザープロファイルと旅行プランを参照して、予算の内訳と最適化案を提案してください。予算分析は、宿泊費、交通費、食費、アクティビティ費、その他の費用などを含む、詳細な内訳を提供してください。また、予算を節約するためのヒントや、予算を最大限に活用するための提案も含めてください。"""
+                "prefix": """あなたは旅行の予算を管理する予算管理エージェントです。与えられたタスクに基づいて、旅行の予算分析を行ってください。ユーザープロファイルと旅行プランを参照して、予算の内訳と最適化案を提案してください。予算分析は、宿泊費、交通費、食費、アクティビティ費、その他の費用などを含む、詳細な内訳を提供してください。また、予算を節約するためのヒントや、予算を最大限に活用するための提案も含めてください。次のツールを使用できます:"""
             }
         )
     
+    def _create_pipeline(self):
+        """pipelineモードで各段階が使うチェーン（プロンプト→LLM→文字列）を作成する"""
+        pipeline = {}
+        for role, (system, human) in PIPELINE_PROMPTS.items():
+            messages = [("system", system)]
+            if role == "coordinator":
+                # 結果の統合ではユーザーとの会話履歴も参照する
+                messages.append(MessagesPlaceholder(variable_name="chat_history"))
+            messages.append(("human", human))
+            # 各段階は1回の呼び出しで役割の成果物を作るため、役割の最終回答の階層を使う
+            llm = llm_for_role(self.llm, role, final_only=True)
+            pipeline[role] = ChatPromptTemplate.from_messages(messages) | llm | StrOutputParser()
+        return pipeline
+    
     def _get_user_profile(self, _):
         """ユーザープロファイルを取得するツール"""
         return self.user_profile.get_profile_summary()
@@ -226,66 +353,309 @@ class MultiAgentSystem:
         except ValueError:
             return "クエリの形式が正しくありません。「key:value」の形式で指定してください。"
     
+    def _delegate(self, name, agent, task, result_key, done_message):
+        """サブエージェントにタスクを実行させ、結果を共有メモリに保存する
+
+        サブエージェントが失敗した場合は、例外を送出せずに失敗の内容をコーディネーターに返す
+        （LLM呼び出しの混雑による失敗は、リクエスト全体を断るためそのまま送出する）。
+        """
+        if self.shared_memory.reuse(result_key, task=task):
+            return self._delegation_reused(name, done_message)
+        inputs = self.shared_memory.inputs(result_key, task=task)
+        try:
+            response = agent.run(task)
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            return self._delegation_failed(name, e)
+        self.shared_memory.put(result_key, response, inputs)
+        return done_message
+    
+    async def _adelegate(self, name, agent, task, result_key, done_message):
+        """_delegateの非同期版"""
+        if self.shared_memory.reuse(result_key, task=task):
+            return self._delegation_reused(name, done_message)
+        inputs = self.shared_memory.inputs(result_key, task=task)
+        try:
+            response = await agent.arun(task)
+        except LLMOverloaded:
+            raise
+        except Exception as e:
+            return self._delegation_failed(name, e)
+        self.shared_memory.put(result_key, response, inputs)
+        return done_message
+    
+    def _delegation_reused(self, name, done_message):
+        return f"{name}の前回の結果はタスクと入力（旅行先・日程・予算など）が変わっていないため、再実行せずに再利用しました。{done_message}"
+    
+    def _delegation_failed(self, name, error):
+        return (
+            f"{name}の実行中にエラーが発生したため、タスクを完了できませんでした"
+            f"（{error.__class__.__name__}: {error}）。タスクを割り当て直すか、取得済みの情報をもとに回答してください。"
+        )
+    
     def _assign_research_task(self, task):
         """リサーチエージェントにタスクを割り当てるツール"""
-        response = self.researcher.run(task)
-        self.shared_memory["research_results"] = response
-        return "リサーチタスクが完了しました。GetResearchResultsツールで結果を取得できます。"
+        return self._delegate(
+            "リサーチエージェント", self.researcher, task, "research_results",
+            "リサーチタスクが完了しました。GetResearchResultsツールで結果を取得できます。"
+        )
     
     def _assign_planning_task(self, task):
         """プランナーエージェントにタスクを割り当てるツール"""
-        response = self.planner.run(task)
-        self.shared_memory["travel_plan"] = response
-        return "プランニングタスクが完了しました。GetTravelPlanツールで結果を取得できます。"
+        return self._delegate(
+            "プランナーエージェント", self.planner, task, "travel_plan",
+            "プランニングタスクが完了しました。GetTravelPlanツールで結果を取得できます。"
+        )
     
     def _assign_budget_task(self, task):
         """予算管理エージェントにタスクを割り当てるツール"""
-        response = self.budget_manager.run(task)
-        self.shared_memory["budget_analysis"] = response
-        return "予算分析タスクが完了しました。GetBudgetAnalysisツールで結果を取得できます。"
+        return self._delegate(
+            "予算管理エージェント", self.budget_manager, task, "budget_analysis",
+            "予算分析タスクが完了しました。GetBudgetAnalysisツールで結果を取得できます。"
+        )
     
-    def _get_research_results(self, _):
+    async def _aassign_research_task(self, task):
+        """リサーチエージェントにタスクを非同期で割り当てるツール"""
+        return await self._adelegate(
+            "リサーチエージェント", self.researcher, task, "research_results",
+            "リサーチタスクが完了しました。GetResearchResultsツールで結果を取得できます。"
+        )
+    
+    async def _aassign_planning_task(self, task):
+        """プランナーエージェントにタスクを非同期で割り当てるツール"""
+        return await self._adelegate(
+            "プランナーエージェント", self.planner, task, "travel_plan",
+            "プランニングタスクが完了しました。GetTravelPlanツールで結果を取得できます。"
+        )
+    
+    async def _aassign_budget_task(self, task):
+        """予算管理エージェントにタスクを非同期で割り当てるツール"""
+        return await self._adelegate(
+            "予算管理エージェント", self.budget_manager, task, "budget_analysis",
+            "予算分析タスクが完了しました。GetBudgetAnalysisツールで結果を取得できます。"
+        )
+    
+    def _build_planning_scheduler(self, task):
+        """サブエージェント間の依存関係を宣言したスケジューラーを作成する"""
+        # research ─┐
+        #           ├─> planning ─> budget
+        # hotels ───┘
+        scheduler = TaskScheduler(max_workers=2)
+        scheduler.add_task("research", lambda inputs: self._run_research_stage(task))
+        scheduler.add_task("hotels", lambda inputs: self._run_hotel_stage(task))
+        scheduler.add_task(
+            "planning",
+            lambda inputs: self._run_planning_stage(task, inputs["research"], inputs["hotels"]),
+            depends_on=("research", "hotels")
+        )
+        scheduler.add_task(
+            "budget",
+            lambda inputs: self._run_budget_stage(task, inputs["planning"]),
+            depends_on=("planning",)
+        )
+        return scheduler
+    
+    def _run_research_stage(self, task):
+        """リサーチエージェントを実行して結果を共有メモリに保存する（最新の結果があれば再利用する）"""
+        return self.shared_memory.get_or_compute("research_results", lambda: self.researcher.run(task), task=task)
+    
+    def _task_cities(self, task):
+        """タスクの対象の旅行先（タスクに含まれる旅行先を優先し、なければ直近の旅行先）"""
+        destinations = self.user_profile.get_preference_list("destinations")
+        return [dest for dest in destinations if dest in task] or destinations[-1:]
+    
+    def _run_hotel_stage(self, task, callbacks=None):
+        """旅行先のホテルを検索して結果を共有メモリに保存する（最新の結果があれば再利用する）"""
+        cities = self._task_cities(task)
+        budget = self.nightly_budget or DEFAULT_HOTEL_BUDGET
+        return self.shared_memory.get_or_compute(
+            "hotel_options", lambda: "\n".join(self.hotel_tool._run(f"{city},{budget}") for city in cities), callbacks
+        )
+    
+    def _run_planning_stage(self, task, research_results, hotel_options):
+        """リサーチ結果とホテル情報をもとにプランナーエージェントを実行する"""
+        planning_task = f"{task}\n\n【リサーチ結果】\n{self._payload(research_results, 'planner')}"
+        if hotel_options:
+            planning_task += f"\n\n【ホテル候補】\n{hotel_options}"
+        return self.shared_memory.get_or_compute("travel_plan", lambda: self.planner.run(planning_task), task=task)
+    
+    def _run_budget_stage(self, task, travel_plan):
+        """旅行プランをもとに予算管理エージェントを実行する"""
+        return self.shared_memory.get_or_compute(
+            "budget_analysis",
+            lambda: self.budget_manager.run(f"{task}\n\n【旅行プラン】\n{self._payload(travel_plan, 'budget_manager')}"),
+            task=task
+        )
+    
+    def _run_planning_workflow(self, task):
+        """依存関係に従ってサブエージェントを並列に実行するツール"""
+        scheduler = self._build_planning_scheduler(task)
+        scheduler.run()
+        if scheduler.errors:
+            failed = ", ".join(f"{name}: {error}" for name, error in scheduler.errors.items())
+            return f"一部のタスクが失敗しました（{failed}）。完了した結果はGet系ツールで取得できます。"
+        return "リサーチ、プランニング、予算分析が完了しました。GetResearchResults、GetTravelPlan、GetBudgetAnalysisツールで結果を取得できます。"
+    
+    async def _arun_planning_workflow(self, task):
+        """依存関係に従ってサブエージェントを並列に実行するツール（非同期版）"""
+        return await asyncio.to_thread(self._run_planning_workflow, task)
+    
+    def _run_pipeline_stage(self, role, callbacks, **variables):
+        """pipelineモードの1段階をLLMの1回の呼び出しで実行する"""
+        return self.pipeline[role].invoke(
+            variables, config={"callbacks": callbacks, "metadata": {AGENT_ROLE_KEY: role}, "run_name": role}
+        )
+    
+    def _build_pipeline_scheduler(self, task, callbacks=None):
+        """pipelineモードの各段階の依存関係を宣言したスケジューラーを作成する"""
+        # research ─┐
+        #           ├─> planning ─> budget
+        # hotels ───┘
+        # プロファイルは実行開始時点のものを全段階で共有する
+        profile = self.user_profile.get_profile_summary()
+        
+        # 各段階は、入力と依頼（ユーザーの入力）が変わっていなければ前回の成果物を再利用する
+        def research(inputs):
+            def compute():
+                cities = self._task_cities(task)
+                weather = self.weather_tool._run(",".join(cities)) if cities else "旅行先が指定されていません。"
+                return self._run_pipeline_stage("researcher", callbacks, profile=profile, weather=weather, task=task)
+            return self.shared_memory.get_or_compute("research_results", compute, callbacks, task)
+        
+        def planning(inputs):
+            return self.shared_memory.get_or_compute("travel_plan", lambda: self._run_pipeline_stage(
+                "planner", callbacks, profile=profile, research=self._payload(inputs["research"], "planner"),
+                hotels=inputs["hotels"] or "ホテル候補はありません。", task=task
+            ), callbacks, task)
+        
+        def budget(inputs):
+            return self.shared_memory.get_or_compute("budget_analysis", lambda: self._run_pipeline_stage(
+                "budget_manager", callbacks, profile=profile,
+                plan=self._payload(inputs["planning"], "budget_manager"), task=task
+            ), callbacks, task)
+        
+        def stage(name, compute):
+            # 段階の開始と終了を出来事として記録する（ストリーミングでは進捗として送る）
+            def run(inputs):
+                trace_event("stage_start", {"stage": name}, callbacks)
+                try:
+                    result = compute(inputs)
+                except Exception:
+                    trace_event("stage_end", {"stage": name, "status": "error"}, callbacks)
+                    raise
+                trace_event("stage_end", {"stage": name, "status": "ok"}, callbacks)
+                return result
+            return run
+        
+        scheduler = TaskScheduler(max_workers=2)
+        scheduler.add_task("research", stage("research", research))
+        scheduler.add_task("hotels", stage("hotels", lambda inputs: self._run_hotel_stage(task, callbacks)))
+        scheduler.add_task("planning", stage("planning", planning), depends_on=("research", "hotels"))
+        scheduler.add_task("budget", stage("budget", budget), depends_on=("planning",))
+        return scheduler
+    
+    def _pipeline_response(self, user_input, callbacks=None):
+        """リサーチ→プラン→予算を順に実行し、最後に1回のLLM呼び出しで結果を統合する"""
+        scheduler = self._build_pipeline_scheduler(user_input, callbacks)
+        results = scheduler.run()
+        
+        def stage_result(name):
+            if name in scheduler.errors:
+                return f"（この段階は失敗しました: {scheduler.errors[name]}）"
+            return self._payload(results.get(name, ""), "coordinator")
+        
+        history = self.memory.load_memory_variables({"input": user_input})[self.memory.memory_key]
+        response = self._run_pipeline_stage(
+            "coordinator", callbacks, chat_history=history, input=user_input,
+            research=stage_result("research"), plan=stage_result("planning"), budget=stage_result("budget")
+        )
+        self.memory.save_context({"input": user_input}, {"output": response})
+        return response
+    
+    def _payload(self, text, role):
+        """成果物を受け取る役割の上限（PAYLOAD_TOKEN_BUDGETS）に収める（共有メモリには全文を残す）"""
+        return compact_text(text, PAYLOAD_TOKEN_BUDGETS[role]) if self.compact_payloads else text
+    
+    def _get_research_results(self, _, role="coordinator"):
         """リサーチエージェントの調査結果を取得するツール"""
-        return self.shared_memory["research_results"]
+        return self._payload(self.shared_memory["research_results"], role)
     
-    def _get_travel_plan(self, _):
+    def _get_travel_plan(self, _, role="coordinator"):
         """プランナーエージェントの旅行プランを取得するツール"""
-        return self.shared_memory["travel_plan"]
+        return self._payload(self.shared_memory["travel_plan"], role)
     
-    def _get_budget_analysis(self, _):
+    def _get_budget_analysis(self, _, role="coordinator"):
         """予算管理エージェントの予算分析を取得するツール"""
-        return self.shared_memory["budget_analysis"]
+        return self._payload(self.shared_memory["budget_analysis"], role)
     
     def _extract_preferences(self, user_input):
-        """ユーザー入力から好みを抽出して更新（簡易的な実装）"""
-        # 実際のアプリケーションでは、より高度なNLPを使用することをお勧めします
-        
-        # 旅行先の抽出（簡易的）
-        destinations = ["東京", "大阪", "京都", "札幌", "那覇", "沖縄", "北海道", "福岡", "名古屋", "広島"]
-        for dest in destinations:
-            if dest in user_input:
-                self.user_profile.update_preference("destinations", dest)
-        
-        # アクティビティの抽出（簡易的）
-        activities = ["観光", "グルメ", "ショッピング", "温泉", "ハイキング", "ビーチ", "美術館", "博物館"]
-        for act in activities:
-            if act in user_input:
-                self.user_profile.update_preference("activities", act)
-        
-        # 予算の抽出（簡易的）
-        import re
-        budget_match = re.search(r'予算[は]?(\d+)万?円', user_input)
-        if budget_match:
-            budget = int(budget_match.group(1))
-            if "万" in budget_match.group(0):
-                budget *= 10000
-            else:
-                budget *= 1000
-            self.user_profile.update_preference("budget", budget)
+        """ユーザー入力から好みと旅行の日程、1泊あたりの予算を抽出して更新"""
+        dates = _TRIP_DATES.findall(user_input)
+        if dates:
+            self.trip_dates = tuple(dates)
+        nightly_budget = parse_nightly_yen(user_input)
+        if nightly_budget:
+            self.nightly_budget = nightly_budget
+        return get_preference_extractor().apply(self.user_profile, user_input)
+    
+    def _planning_facts(self):
+        """共有メモリの成果物の入力になる事実（ARTIFACT_DEPENDENCIESを参照）"""
+        preferences = self.user_profile.preferences
+        return {
+            "destinations": tuple(preferences["destinations"]),
+            "dates": self.trip_dates,
+            "budget": preferences["budget"],
+            "nightly_budget": self.nightly_budget,
+            # 予算以外の好み（予算は予算分析とホテル候補の入力として別に扱う）
+            "profile": (tuple(preferences["activities"]), preferences["travel_style"])
+        }
+    
+    def _start_prefetch(self, preferences):
+        """入力にある旅行先の天気とホテルの取得を、最初のLLM呼び出しと並行して始める
+
+        ホテルは会話で1泊あたりの予算が分かっている場合だけ、ホテル候補の作成と同じ条件で検索しておく
+        （プロファイルの予算は旅行全体の予算のため、HotelToolの引数とは一致しない）。
+        """
+        turn = TurnPrefetch()
+        cities = preferences["destinations"]
+        if prefetch_enabled() and cities:
+            self.weather_tool.prefetch(cities, turn)
+            if self.nightly_budget:
+                self.hotel_tool.prefetch(cities, self.nightly_budget, turn)
+        return turn
+    
+    def get_response(self, user_input, callbacks=None):
+        preferences = self._extract_preferences(user_input)
+        # 天気やホテルだけを尋ねる単純な問い合わせは、コーディネーターを経ずにツールで直接答える
+        intent = get_intent_router().route(user_input)
+        if intent is not None:
+            return get_intent_router().answer(intent, self.fast_path_tools, self.memory, user_input, callbacks)
+        with self._start_prefetch(preferences).activate():
+            if self.execution_mode == "pipeline":
+                return self._pipeline_response(user_input, callbacks)
+            response = self.coordinator.invoke(
+                {"input": user_input}, config={"callbacks": callbacks}, handle_parsing_errors=True
+            )
+        return self._format_response(response)
+    
+    async def aget_response(self, user_input, callbacks=None):
+        """ユーザー入力に対する応答を非同期で取得"""
+        # プロファイルの保存先への書き込みは別スレッドで行う
+        preferences = await asyncio.to_thread(self._extract_preferences, user_input)
+        intent = get_intent_router().route(user_input)
+        if intent is not None:
+            return await get_intent_router().aanswer(intent, self.fast_path_tools, self.memory, user_input, callbacks)
+        with self._start_prefetch(preferences).activate():
+            if self.execution_mode == "pipeline":
+                return await asyncio.to_thread(self._pipeline_response, user_input, callbacks)
+            response = await self.coordinator.ainvoke(
+                {"input": user_input}, config={"callbacks": callbacks}, handle_parsing_errors=True
+            )
+        return self._format_response(response)
     
-    def get_response(self, user_input):
-        self._extract_preferences(user_input)
-        response = self.coordinator.invoke({"input": user_input}, handle_parsing_errors=True)
+    def _format_response(self, response):
+        """コーディネーターの返り値からユーザーに返す応答を取り出す"""
         # 返り値がdict型でoutputが短い場合、chat_historyからAIの最後のcontentを返す
         if isinstance(response, dict):
             # outputが短すぎる場合はchat_historyからAIの最後のcontentを返す
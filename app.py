@@ -1,21 +1,70 @@
-from flask import Flask, request, jsonify, render_template
+import os
+import threading
+import time
+from utils.startup import startup_timings
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from utils.helpers import load_api_key
-from agents.basic_agent import BasicTravelAgent
-from agents.advanced_agent import AdvancedTravelAgent
-from agents.multi_agent_system import MultiAgentSystem
+from utils.metrics import CONTENT_TYPE, REGISTRY
+from utils.batch import ChatBatchRunner
+from utils.llm_scheduler import LLMOverloaded, get_llm_scheduler
+from utils.profile_store import ProfileStore
+from utils.session_manager import SessionManager, agent_options_from_request
+from utils.session_store import create_session_store
+from utils.streaming import format_sse, stream_agent_response
+from utils.tracing import get_recent_traces, trace_request
+from agents.factory import make_session_agent_factory, mode_model_routes, needs_llm, resolve_agent_type, warm_up
 
 app = Flask(__name__)
 
 # APIキーの読み込み
 api_key = load_api_key()
 
-# エージェントの初期化
-basic_agent = BasicTravelAgent(api_key)
-advanced_agent = AdvancedTravelAgent(api_key)
-multi_agent = MultiAgentSystem(api_key)
+# ユーザープロファイルの保存先
+profile_store = ProfileStore(os.getenv("PROFILE_DB_PATH", ".cache/profiles.sqlite"))
 
-# セッション管理用の辞書
-sessions = {}
+# セッション管理（セッションごとにエージェントとメモリを分離する）
+# 会話は保存先に追記し、プロセス内に保持していないセッションは保存先から復元する（ワーカー間で共有できる）
+# モデルの階層の振り分けはMODEL_ROUTES（全種別）かMODEL_ROUTES_<種別>（例: MODEL_ROUTES_MULTI）を指定したときだけ有効になる
+session_manager = SessionManager(
+    agent_factory=make_session_agent_factory(api_key, profile_store, model_routes=mode_model_routes()),
+    max_sessions=int(os.getenv("MAX_SESSIONS", "100")),
+    ttl=int(os.getenv("SESSION_TTL_SECONDS", "1800")),
+    store=create_session_store()
+)
+
+# バッチ処理（同時実行数と1件あたりのタイムアウトはバッチ全体で共有する上限）
+batch_runner = ChatBatchRunner(
+    session_manager,
+    max_concurrency=int(os.getenv("CHAT_BATCH_CONCURRENCY", "4")),
+    item_timeout=float(os.getenv("CHAT_BATCH_ITEM_TIMEOUT_SECONDS", "120"))
+)
+max_batch_items = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "500"))
+
+# エージェントのモジュールは最初のリクエストで読み込む
+# WARMUP_AGENT_TYPES（例: advanced,multi）を指定すると、起動後にバックグラウンドで事前に読み込む
+warmup_agent_types = [t for t in os.getenv("WARMUP_AGENT_TYPES", "").split(",") if t]
+if warmup_agent_types:
+    threading.Thread(target=warm_up, args=(warmup_agent_types, api_key), daemon=True).start()
+
+# 全エージェントで共有するLLM呼び出しのスケジューラー（混雑時は429/503を返す）
+llm_scheduler = get_llm_scheduler()
+
+startup_timings.mark("app_loaded")
+
+@app.errorhandler(LLMOverloaded)
+def llm_overloaded(error):
+    """LLM呼び出しを受け付けられないときは、再試行までの目安とともにすぐに断る"""
+    response = jsonify({'error': str(error)})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def authenticated_user_id():
+    """認証の仕組み（WSGIサーバーや前段の認証ミドルウェア）が確認した利用者ID（なければNone）
+
+    リクエスト本文のuser_idは利用者が自由に名乗れるため使わない。
+    """
+    return request.environ.get('REMOTE_USER')
 
 @app.route('/')
 def index():
@@ -26,35 +75,121 @@ def chat():
     data = request.json
     user_input = data.get('message', '')
     session_id = data.get('session_id', 'default')
-    agent_type = data.get('agent_type', 'advanced')
-    
-    # セッションの初期化
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'history': []
-        }
-    
-    # エージェントの選択
-    if agent_type == 'basic':
-        agent = basic_agent
-    elif agent_type == 'multi':
-        agent = multi_agent
-    else:
-        agent = advanced_agent
-    
-    # 応答の取得
-    response = agent.get_response(user_input)
-    
-    # 会話履歴の更新
-    sessions[session_id]['history'].append({
-        'user': user_input,
-        'agent': response
-    })
+    agent_type = resolve_agent_type(data.get('agent_type', 'advanced'))
+    
+    # LLMの待ち行列が満杯なら、エージェントを動かす前に断る（ツールで直接答える問い合わせは断らない）
+    if llm_scheduler is not None and needs_llm(agent_type, user_input):
+        llm_scheduler.check('interactive')
+    
+    # セッションの取得（なければ作成）
+    try:
+        options = agent_options_from_request(data, session_id, authenticated_user_id())
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    session = session_manager.get_session(session_id, agent_type, options)
+    
+    # 同一セッション内のリクエストのみ直列化する
+    # 応答に使う値はロックの中で読む（ロックの外では他の要求がメモリを読み直しうる）
+    with session.lock, trace_request('chat', agent_type=agent_type, session_id=session_id) as trace:
+        # 応答の取得
+        agent = session.begin_turn()
+        response = agent.get_response(user_input, callbacks=[trace.handler])
+        
+        # 会話履歴の更新
+        session_manager.record_turn(session, user_input, response)
+        memory_tokens = agent.memory.last_prompt_tokens
     
     return jsonify({
         'response': response,
-        'session_id': session_id
+        'session_id': session_id,
+        'memory_tokens': memory_tokens,
+        'trace_id': trace.trace_id
+    })
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """途中経過と最終回答のトークンをServer-Sent Eventsで逐次返す"""
+    data = request.json
+    user_input = data.get('message', '')
+    session_id = data.get('session_id', 'default')
+    agent_type = resolve_agent_type(data.get('agent_type', 'advanced'))
+    
+    if llm_scheduler is not None and needs_llm(agent_type, user_input):
+        llm_scheduler.check('interactive')
+    
+    try:
+        options = agent_options_from_request(data, session_id, authenticated_user_id())
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    session = session_manager.get_session(session_id, agent_type, options)
+    
+    def run(handler):
+        # 同一セッション内のリクエストのみ直列化する
+        with session.lock, trace_request('chat_stream', agent_type=agent_type, session_id=session_id) as trace:
+            agent = session.begin_turn()
+            # 応答の形式（ReActか文章か）はエージェントの設定（multiの実行モードなど）で決まる
+            handler.react = agent.react_output
+            response = agent.get_response(user_input, callbacks=[handler, trace.handler])
+            session_manager.record_turn(session, user_input, response)
+        return response
+    
+    def generate():
+        yield format_sse({'type': 'start', 'session_id': session_id})
+        for event in stream_agent_response(run):
+            yield format_sse(event)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """複数の要求をまとめて受け取り、同時実行数の上限のもとで並列に処理する（結果は入力順）"""
+    data = request.json or {}
+    items = data.get('items')
+    if not isinstance(items, list):
+        return jsonify({'error': 'itemsに要求の配列を指定してください。'}), 400
+    if len(items) > max_batch_items:
+        return jsonify({'error': f'1回のバッチで送れる要求は{max_batch_items}件までです。'}), 400
+    try:
+        max_concurrency = int(data['max_concurrency']) if data.get('max_concurrency') else None
+        item_timeout = float(data['timeout']) if data.get('timeout') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_concurrencyとtimeoutは数値で指定してください。'}), 400
+    
+    start = time.perf_counter()
+    results = batch_runner.run(
+        items, max_concurrency=max_concurrency, item_timeout=item_timeout, user_id=authenticated_user_id()
+    )
+    return jsonify({
+        'results': results,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
     })
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """LLM応答キャッシュのヒット率を返す"""
+    # LangChainのキャッシュ関連の読み込みを起動時に払わないよう、ここで読み込む
+    from utils.llm import get_llm_cache
+    from utils.llm_cache import get_cache_stats
+    return jsonify({'llm_cache': get_cache_stats(get_llm_cache())})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus形式のメトリクスを返す"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/api/traces', methods=['GET'])
+def traces():
+    """直近のリクエストのトレース（LLM・ツール呼び出しとReActのステップの木）を返す"""
+    return jsonify({'traces': get_recent_traces(request.args.get('limit', 20, type=int))})
+
+@app.route('/api/startup', methods=['GET'])
+def startup():
+    """起動時間のレポート（モジュールの読み込み時間とエージェントの作成時間）を返す"""
+    return jsonify(startup_timings.as_dict())
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True, threaded=True)
\ No newline at end of file
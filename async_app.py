@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from utils.startup import startup_timings
+from quart import Quart, Response, request, jsonify, render_template
+from utils.helpers import load_api_key
+from utils.metrics import CONTENT_TYPE, REGISTRY
+from utils.batch import ChatBatchRunner
+from utils.llm_scheduler import LLMOverloaded, get_llm_scheduler
+from utils.profile_store import ProfileStore
+from utils.session_manager import SessionManager, agent_options_from_request
+from utils.session_store import create_session_store
+from utils.streaming import astream_agent_response, format_sse
+from utils.tracing import get_recent_traces, trace_request
+from agents.factory import make_session_agent_factory, mode_model_routes, needs_llm, resolve_agent_type, warm_up
+
+# asyncioで動作する版のチャットAPI（例: hypercorn async_app:app。quartとhypercornのインストールが必要）
+# モデルの応答待ちの間はイベントループを解放するため、1プロセスで多数の会話を同時に扱える
+# app.pyと同じAPIを提供する
+app = Quart(__name__)
+
+# APIキーの読み込み
+api_key = load_api_key()
+
+# ユーザープロファイルの保存先
+profile_store = ProfileStore(os.getenv("PROFILE_DB_PATH", ".cache/profiles.sqlite"))
+
+# セッション管理（セッションごとにエージェントとメモリを分離する）
+# 会話は保存先に追記し、プロセス内に保持していないセッションは保存先から復元する（ワーカー間で共有できる）
+# モデルの階層の振り分けはMODEL_ROUTES（全種別）かMODEL_ROUTES_<種別>（例: MODEL_ROUTES_MULTI）を指定したときだけ有効になる
+session_manager = SessionManager(
+    agent_factory=make_session_agent_factory(api_key, profile_store, model_routes=mode_model_routes()),
+    max_sessions=int(os.getenv("MAX_SESSIONS", "100")),
+    ttl=int(os.getenv("SESSION_TTL_SECONDS", "1800")),
+    store=create_session_store()
+)
+
+# バッチ処理（同時実行数と1件あたりのタイムアウトはバッチ全体で共有する上限）
+batch_runner = ChatBatchRunner(
+    session_manager,
+    max_concurrency=int(os.getenv("CHAT_BATCH_CONCURRENCY", "4")),
+    item_timeout=float(os.getenv("CHAT_BATCH_ITEM_TIMEOUT_SECONDS", "120"))
+)
+max_batch_items = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "500"))
+
+# エージェントのモジュールは最初のリクエストで読み込む（WARMUP_AGENT_TYPESで事前に読み込める）
+warmup_agent_types = [t for t in os.getenv("WARMUP_AGENT_TYPES", "").split(",") if t]
+if warmup_agent_types:
+    threading.Thread(target=warm_up, args=(warmup_agent_types, api_key), daemon=True).start()
+
+# 全エージェントで共有するLLM呼び出しのスケジューラー（混雑時は429/503を返す）
+llm_scheduler = get_llm_scheduler()
+
+startup_timings.mark("app_loaded")
+
+@app.errorhandler(LLMOverloaded)
+async def llm_overloaded(error):
+    """LLM呼び出しを受け付けられないときは、再試行までの目安とともにすぐに断る"""
+    response = jsonify({'error': str(error)})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.route('/')
+async def index():
+    return await render_template('index.html')
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    data = await request.get_json()
+    user_input = data.get('message', '')
+    session_id = data.get('session_id', 'default')
+    agent_type = resolve_agent_type(data.get('agent_type', 'advanced'))
+    
+    # LLMの待ち行列が満杯なら、エージェントを動かす前に断る（ツールで直接答える問い合わせは断らない）
+    if llm_scheduler is not None and needs_llm(agent_type, user_input):
+        llm_scheduler.check('interactive')
+    
+    # セッションの取得（なければ作成）
+    # ASGIには認証済みの利用者を渡す標準の仕組みがないため、プロファイルはセッションごとに保存する
+    try:
+        options = agent_options_from_request(data, session_id)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    session = session_manager.get_session(session_id, agent_type, options)
+    
+    # 同一セッション内のリクエストのみ直列化する
+    # エージェントの作成と保存先の読み書きは別スレッドで行い、イベントループを止めない
+    # 応答に使う値はロックの中で読む
+    async with session.async_lock:
+        with trace_request('chat', agent_type=agent_type, session_id=session_id) as trace:
+            # 応答の取得
+            agent = await session.abegin_turn()
+            response = await agent.aget_response(user_input, callbacks=[trace.handler])
+        
+        # 会話履歴の更新
+        await session_manager.arecord_turn(session, user_input, response)
+        memory_tokens = agent.memory.last_prompt_tokens
+    
+    return jsonify({
+        'response': response,
+        'session_id': session_id,
+        'memory_tokens': memory_tokens,
+        'trace_id': trace.trace_id
+    })
+
+@app.route('/api/chat/stream', methods=['POST'])
+async def chat_stream():
+    """途中経過と最終回答のトークンをServer-Sent Eventsで逐次返す"""
+    data = await request.get_json()
+    user_input = data.get('message', '')
+    session_id = data.get('session_id', 'default')
+    agent_type = resolve_agent_type(data.get('agent_type', 'advanced'))
+    
+    if llm_scheduler is not None and needs_llm(agent_type, user_input):
+        llm_scheduler.check('interactive')
+    
+    try:
+        options = agent_options_from_request(data, session_id)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    session = session_manager.get_session(session_id, agent_type, options)
+    
+    async def run(handler):
+        # 同一セッション内のリクエストのみ直列化する
+        async with session.async_lock:
+            with trace_request('chat_stream', agent_type=agent_type, session_id=session_id) as trace:
+                agent = await session.abegin_turn()
+                # 応答の形式（ReActか文章か）はエージェントの設定（multiの実行モードなど）で決まる
+                handler.react = agent.react_output
+                response = await agent.aget_response(user_input, callbacks=[handler, trace.handler])
+            await session_manager.arecord_turn(session, user_input, response)
+        return response
+    
+    async def generate():
+        yield format_sse({'type': 'start', 'session_id': session_id})
+        async for event in astream_agent_response(run):
+            yield format_sse(event)
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/chat/batch', methods=['POST'])
+async def chat_batch():
+    """複数の要求をまとめて受け取り、同時実行数の上限のもとで並列に処理する（結果は入力順）"""
+    data = await request.get_json() or {}
+    items = data.get('items')
+    if not isinstance(items, list):
+        return jsonify({'error': 'itemsに要求の配列を指定してください。'}), 400
+    if len(items) > max_batch_items:
+        return jsonify({'error': f'1回のバッチで送れる要求は{max_batch_items}件までです。'}), 400
+    try:
+        max_concurrency = int(data['max_concurrency']) if data.get('max_concurrency') else None
+        item_timeout = float(data['timeout']) if data.get('timeout') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_concurrencyとtimeoutは数値で指定してください。'}), 400
+    
+    start = time.perf_counter()
+    results = await batch_runner.arun(items, max_concurrency=max_concurrency, item_timeout=item_timeout)
+    return jsonify({
+        'results': results,
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
+    })
+
+@app.route('/api/cache/stats', methods=['GET'])
+async def cache_stats():
+    """LLM応答キャッシュのヒット率を返す"""
+    # LangChainのキャッシュ関連の読み込みを起動時に払わないよう、ここで読み込む
+    from utils.llm import get_llm_cache
+    from utils.llm_cache import get_cache_stats
+    return jsonify({'llm_cache': get_cache_stats(get_llm_cache())})
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus形式のメトリクスを返す"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/api/traces', methods=['GET'])
+async def traces():
+    """直近のリクエストのトレースを返す"""
+    return jsonify({'traces': get_recent_traces(request.args.get('limit', 20, type=int))})
+
+@app.route('/api/startup', methods=['GET'])
+async def startup():
+    """起動時間のレポートを返す"""
+    return jsonify(startup_timings.as_dict())
+
+if __name__ == '__main__':
+    app.run(debug=True)
\ No newline at end of file
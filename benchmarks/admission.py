@@ -0,0 +1,97 @@
+import argparse
+import contextlib
+import os
+import threading
+import time
+from typing import Any
+
+from agents.factory import create_agent
+from benchmarks.agents import CONVERSATION, percentile
+from benchmarks.fake_llm import ScriptedChatModel
+from utils.llm import AdmissionControlledChatModel, ChatModelWrapper
+from utils.llm_scheduler import LLMOverloaded, LLMScheduler, llm_priority
+
+
+class UpstreamChatModel(ChatModelWrapper):
+    """同時に処理できる呼び出し数に上限のあるプロバイダーを模擬する（超えた呼び出しは到着順に待つ）"""
+
+    capacity: Any
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with self.capacity:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def run_load(admission, capacity, latency, batch_workers, users, turns):
+    """バッチの呼び出しが流れ続ける中で、対話の利用者がturns回ずつ会話したときの応答時間を計測する"""
+    llm = UpstreamChatModel(inner=ScriptedChatModel(latency=latency), capacity=threading.BoundedSemaphore(capacity))
+    if admission:
+        llm = AdmissionControlledChatModel(inner=llm, scheduler=LLMScheduler(max_concurrency=capacity))
+    stop = threading.Event()
+    interactive, batch, rejected = [], [], []
+
+    def batch_worker(worker):
+        agent = create_agent("advanced", "offline", llm=llm)
+        turn = worker
+        while not stop.is_set():
+            start = time.perf_counter()
+            with llm_priority("batch"):
+                agent.get_response(CONVERSATION[turn % len(CONVERSATION)])
+            batch.append(time.perf_counter() - start)
+            turn += 1
+
+    def user(index):
+        agent = create_agent("advanced", "offline", llm=llm)
+        for turn in range(turns):
+            start = time.perf_counter()
+            try:
+                agent.get_response(CONVERSATION[(index + turn) % len(CONVERSATION)])
+            except LLMOverloaded:
+                rejected.append(index)
+                continue
+            interactive.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=batch_worker, args=(i,), daemon=True) for i in range(batch_workers)]
+    for worker in workers:
+        worker.start()
+    # バッチが待ち行列を埋めてから対話の利用者を始める
+    time.sleep(latency * 2)
+    start = time.perf_counter()
+    users_threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for thread in users_threads:
+        thread.start()
+    for thread in users_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return {
+        "interactive_p50_ms": percentile(interactive, 50) * 1000,
+        "interactive_p95_ms": percentile(interactive, 95) * 1000,
+        "rejected": len(rejected),
+        "batch_turns_per_s": len(batch) / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="過負荷時の対話の応答時間を、スケジューラーの有無で比較する")
+    parser.add_argument("--capacity", type=int, default=4, help="プロバイダーが同時に処理できる呼び出し数")
+    parser.add_argument("--latency", type=float, default=0.05, help="LLM呼び出し1回あたりの模擬遅延（秒）")
+    parser.add_argument("--batch-workers", type=int, default=16)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'スケジューラー':<12} {'対話p50(ms)':>12} {'対話p95(ms)':>12} {'拒否':>6} {'バッチ(ターン/秒)':>18}")
+    for admission in (False, True):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = run_load(admission, args.capacity, args.latency, args.batch_workers, args.users, args.turns)
+        print(
+            f"{'あり' if admission else 'なし':<12} {result['interactive_p50_ms']:>12.0f} {result['interactive_p95_ms']:>12.0f}"
+            f" {result['rejected']:>6} {result['batch_turns_per_s']:>18.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import time
+import tracemalloc
+
+from agents.factory import AGENT_TYPES, create_agent
+from benchmarks.fake_llm import ScriptedChatModel
+from tools.hotel_tool import hotel_cache
+from tools.weather_tool import weather_cache
+
+# 会話で順に送るユーザー入力（旅行先を変えながら繰り返す）
+CONVERSATION = [
+    "東京に2泊3日で旅行したいです。予算は5万円で、観光とグルメを楽しみたいです。",
+    "京都の天気とおすすめのホテルを教えてください。",
+    "大阪でのんびり温泉に入れるプランはありますか？",
+    "札幌の美術館を巡る旅行を考えています。",
+    "那覇でビーチを楽しみたいので、格安のホテルを探しています。",
+]
+
+
+def percentile(values, pct):
+    """最近傍法でパーセンタイルを求める"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_conversation(mode, turns, latency, memory_mode=None, **options):
+    """偽のLLMを使ったエージェントとturns回会話し、1ターンごとの計測値を集計する（optionsはエージェントに渡す）"""
+    llm = ScriptedChatModel(latency=latency)
+    weather_cache.clear()
+    hotel_cache.clear()
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    agent = create_agent(mode, "offline", memory_mode=memory_mode, llm=llm, **options)
+    built, _ = tracemalloc.get_traced_memory()
+
+    latencies, overheads, calls, tokens = [], [], [], []
+    for turn in range(turns):
+        llm.reset()
+        start = time.perf_counter()
+        agent.get_response(CONVERSATION[turn % len(CONVERSATION)])
+        elapsed = time.perf_counter() - start
+        model_seconds = sum(call["seconds"] for call in llm.calls)
+        latencies.append(elapsed * 1000)
+        overheads.append((elapsed - model_seconds) * 1000)
+        calls.append(len(llm.calls))
+        tokens.append(sum(call["prompt_tokens"] for call in llm.calls))
+
+    wait_for_summary = getattr(agent.memory, "wait_for_summary", None)
+    if wait_for_summary:
+        wait_for_summary(timeout=10)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mode": mode,
+        "turns": turns,
+        "latency_ms": {p: percentile(latencies, p) for p in (50, 95, 99)},
+        "overhead_ms": {p: percentile(overheads, p) for p in (50, 95, 99)},
+        "llm_calls_per_turn": sum(calls) / turns,
+        "prompt_tokens_per_turn": sum(tokens) / turns,
+        "prompt_tokens_last_turn": tokens[-1],
+        "agent_kb": (built - baseline) / 1024,
+        "growth_kb_per_turn": (current - built) / 1024 / turns,
+        "peak_kb": (peak - baseline) / 1024,
+    }
+
+
+def print_report(results):
+    print(f"{'モード':<10} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'p50上乗せ':>10} "
+          f"{'LLM回数':>8} {'トークン':>9} {'最終ターン':>10} {'KB/ターン':>10}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['latency_ms'][50]:>9.1f} {r['latency_ms'][95]:>9.1f} {r['latency_ms'][99]:>9.1f} "
+              f"{r['overhead_ms'][50]:>10.1f} {r['llm_calls_per_turn']:>8.1f} {r['prompt_tokens_per_turn']:>9.0f} "
+              f"{r['prompt_tokens_last_turn']:>10} {r['growth_kb_per_turn']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="偽のLLMでエージェントの処理時間・LLM呼び出し・トークン数・メモリ増加を計測する")
+    parser.add_argument("--mode", choices=list(AGENT_TYPES) + ["all"], default="all")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="LLM呼び出し1回あたりの模擬遅延（秒）")
+    parser.add_argument("--memory-mode", choices=["buffer", "summary_buffer"], default=None)
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    modes = list(AGENT_TYPES) if args.mode == "all" else [args.mode]
+    results = []
+    for mode in modes:
+        # エージェントの詳細ログ（verbose）は計測から外す
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results.append(run_conversation(mode, args.turns, args.latency, args.memory_mode))
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import contextlib
+import os
+import time
+
+from agents.factory import create_agent
+from benchmarks.fake_llm import ScriptedChatModel
+from utils.batch import ChatBatchRunner
+from utils.session_manager import SessionManager
+
+MESSAGES = ["東京の天気を教えてください。", "京都で1万5千円以内のホテルを探しています。", "大阪の観光プランを考えてください。"]
+
+
+def make_items(sessions, turns, agent_type):
+    """sessions個のセッションがturns回ずつ話す要求の一覧（セッションは交互に並ぶ）"""
+    return [
+        {"session_id": f"batch-{s}", "agent_type": agent_type, "message": MESSAGES[(s + t) % len(MESSAGES)]}
+        for t in range(turns) for s in range(sessions)
+    ]
+
+
+def run_batch(items, concurrency, latency, agent_type):
+    llm = ScriptedChatModel(latency=latency)
+    manager = SessionManager(agent_factory=lambda agent_type, **options: create_agent(agent_type, "offline", llm=llm))
+    runner = ChatBatchRunner(manager, max_concurrency=concurrency, item_timeout=60)
+    start = time.perf_counter()
+    results = runner.run(items)
+    elapsed = time.perf_counter() - start
+    errors = [r for r in results if "error" in r]
+    return elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="バッチ処理のスループットが同時実行数に応じて伸びることを確認する")
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.05, help="LLM呼び出し1回あたりの模擬遅延（秒）")
+    parser.add_argument("--agent-type", default="advanced")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    items = make_items(args.sessions, args.turns, args.agent_type)
+    print(f"{'同時実行数':<10} {'所要時間(s)':>12} {'件/秒':>10} {'失敗':>6}")
+    for concurrency in args.concurrency:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            elapsed, errors = run_batch(items, concurrency, args.latency, args.agent_type)
+        print(f"{concurrency:<10} {elapsed:>12.2f} {len(items) / elapsed:>10.1f} {len(errors):>6}")
+
+
+if __name__ == "__main__":
+    main()
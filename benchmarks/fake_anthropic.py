@@ -0,0 +1,202 @@
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from benchmarks.fake_llm import scripted_response
+from utils.helpers import estimate_tokens
+
+
+def _blocks(content):
+    """メッセージの内容をテキストブロックの一覧にする"""
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return [block for block in content if block.get("type") == "text"]
+
+
+def _text(content):
+    return "".join(block["text"] for block in _blocks(content))
+
+
+class FakeAnthropicServer:
+    """Anthropic Messages API（/v1/messages）を模擬するローカルのHTTPサーバー
+
+    ネットワークを使わずに、実際のAnthropicクライアント（ChatAnthropic）を通した動作を確認するために使う。
+    応答はfake_llmの台本どおりに返し、受け取ったリクエストをrequestsに、返したusageをusagesに記録する。
+    cache_controlの付いたブロックまでの接頭辞を覚えておき、プロンプトキャッシュの読み込み・書き込み
+    トークン数をusageで返す（接頭辞の一致だけを見る簡易的な模擬）。
+
+    障害の注入: slow_rateの割合のリクエストは最初の応答までslow_latency秒かかり、
+    error_rateの割合のリクエストはerror_status（既定529 overloaded）で失敗する。
+    """
+
+    def __init__(self, latency=0.0, slow_rate=0.0, slow_latency=0.0, error_rate=0.0, error_status=529, seed=None):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.injected = {"slow": 0, "error": 0}
+        self._random = random.Random(seed)
+        self.requests = []
+        self.usages = []
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))))
+                try:
+                    server.handle(self, body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # クライアントが取り消した（ヘッジで負けた）リクエスト
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        """記録とキャッシュをクリアする"""
+        with self._lock:
+            self.requests.clear()
+            self.usages.clear()
+            self._cached_prefixes.clear()
+            self.injected = {"slow": 0, "error": 0}
+
+    def handle(self, handler, body):
+        with self._lock:
+            slow = self._random.random() < self.slow_rate
+            error = self._random.random() < self.error_rate
+            self.injected["slow"] += slow
+            self.injected["error"] += error
+        if self.latency or slow:
+            time.sleep(self.slow_latency if slow else self.latency)
+        if error:
+            self._send_json(handler, self.error_status, {
+                "type": "error", "error": {"type": "overloaded_error", "message": "Overloaded (injected)"}
+            })
+            return
+        text = scripted_response(self._to_messages(body))
+        usage = dict(self._prompt_usage(body), output_tokens=estimate_tokens(text))
+        with self._lock:
+            self.requests.append(body)
+            self.usages.append(usage)
+        if body.get("stream"):
+            self._send_stream(handler, body, text, usage)
+        else:
+            self._send_json(handler, 200, self._message(body, text, usage))
+
+    def _to_messages(self, body):
+        messages = []
+        if body.get("system"):
+            messages.append(SystemMessage(content=_text(body["system"])))
+        for message in body["messages"]:
+            cls = HumanMessage if message["role"] == "user" else AIMessage
+            messages.append(cls(content=_text(message["content"])))
+        return messages
+
+    def _prompt_usage(self, body):
+        """入力トークン数を、キャッシュから読んだ分・書き込んだ分・それ以外に分ける"""
+        blocks = []
+        system = body.get("system")
+        if system:
+            blocks.extend(_blocks(system))
+        for message in body["messages"]:
+            blocks.extend(_blocks(message["content"]))
+
+        digest = hashlib.sha256()
+        total = 0
+        breakpoints = []
+        for block in blocks:
+            digest.update(block["text"].encode("utf-8"))
+            total += estimate_tokens(block["text"])
+            if block.get("cache_control"):
+                breakpoints.append((digest.hexdigest(), total))
+
+        read = 0
+        written = 0
+        with self._lock:
+            for key, tokens in breakpoints:
+                if key in self._cached_prefixes:
+                    read = tokens
+                else:
+                    self._cached_prefixes.add(key)
+            if breakpoints and breakpoints[-1][1] > read:
+                written = breakpoints[-1][1] - read
+        return {
+            "input_tokens": total - read - written,
+            "cache_read_input_tokens": read,
+            "cache_creation_input_tokens": written
+        }
+
+    @staticmethod
+    def _message(body, text, usage):
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", ""),
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": usage
+        }
+
+    def _send_stream(self, handler, body, text, usage):
+        message = self._message(body, "", dict(usage, output_tokens=1))
+        message["content"] = []
+        message["stop_reason"] = None
+        events = [("message_start", {"type": "message_start", "message": message}),
+                  ("content_block_start", {"type": "content_block_start", "index": 0,
+                                           "content_block": {"type": "text", "text": ""}})]
+        for i in range(0, len(text), 16):
+            events.append(("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                   "delta": {"type": "text_delta", "text": text[i:i + 16]}}))
+        events += [("content_block_stop", {"type": "content_block_stop", "index": 0}),
+                   ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": usage}),
+                   ("message_stop", {"type": "message_stop"})]
+        handler.send_response(200)
+        handler.send_header("content-type", "text/event-stream")
+        handler.end_headers()
+        for name, data in events:
+            handler.wfile.write(f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+        handler.wfile.flush()
+
+    @staticmethod
+    def _send_json(handler, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("content-type", "application/json")
+        handler.send_header("content-length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils.helpers import estimate_tokens
+from utils.preference_extractor import get_preference_extractor
+
+# 各エージェントの役割ごとのReActの手順（ツール名, 引数）。最後に最終回答を返す
+SCRIPTS = {
+    "advanced": [("WeatherTool", "{city}"), ("HotelTool", "{city},15000")],
+    "coordinator": [
+        ("GetUserProfile", "なし"),
+        ("AssignResearchTask", "{city}の観光情報と天気を調査してください"),
+        ("GetResearchResults", "なし"),
+        ("AssignPlanningTask", "{city}の2泊3日の旅行プランを作成してください"),
+        ("GetTravelPlan", "なし"),
+        ("AssignBudgetTask", "旅行プランの予算を分析してください"),
+        ("GetBudgetAnalysis", "なし"),
+    ],
+    "researcher": [("WeatherTool", "{city}"), ("GetUserProfile", "なし")],
+    "planner": [("GetResearchResults", "なし"), ("HotelTool", "{city},15000")],
+    "budget_manager": [("GetTravelPlan", "なし"), ("GetUserProfile", "なし")],
+}
+
+FINAL_ANSWERS = {
+    "advanced": "{city}は現在晴れで過ごしやすい気候です。予算内のホテルとしては相鉄フレッサインがおすすめです。"
+                "観光地を巡りながら、地元のグルメも楽しんでください。",
+    "coordinator": "{city}の2泊3日プランをご提案します。1日目は市内観光、2日目は名所巡りとグルメ、3日目はお土産探しです。"
+                   "宿泊は評価の高いホテルを選び、交通費と食費を含めて予算内に収まるよう調整しました。",
+    "researcher": "{city}の調査結果: 天気は良好。主な観光スポット、名物グルメ、おすすめのアクティビティ、ベストシーズンをまとめました。",
+    "planner": "{city}の旅行プラン: 1日目 到着・市内観光、2日目 名所巡り、3日目 買い物・帰路。宿泊は駅近くのホテル。",
+    "budget_manager": "予算分析: 宿泊費 24000円、交通費 20000円、食費 15000円、アクティビティ 8000円、その他 5000円。",
+    "summary": "ユーザーは{city}への旅行を計画しており、天気・ホテル・プランについて相談した。",
+    "text": "{city}への旅行でしたら、名所巡りと地元のグルメを中心にした2泊3日のプランがおすすめです。",
+}
+
+
+def detect_role(messages):
+    """システムプロンプトに含まれるツールから、呼び出し元のエージェントの役割を判定する"""
+    system = "\n".join(str(m.content) for m in messages if m.type == "system")
+    prompt = "\n".join(str(m.content) for m in messages)
+    if "Progressively summarize" in prompt:
+        return "summary"
+    if "AssignResearchTask:" in system:
+        return "coordinator"
+    if "UpdateUserProfile:" in system:
+        return "advanced"
+    if "HotelTool:" in system:
+        return "planner"
+    if "WeatherTool:" in system:
+        return "researcher"
+    if "GetTravelPlan:" in system:
+        return "budget_manager"
+    return "text"
+
+
+def react_step(message):
+    """ReActの途中経過（Observationの数）から、何手目の呼び出しかを求める"""
+    return str(message.content).count("\nObservation:")
+
+
+def action_blob(action, action_input):
+    """構造化チャットエージェント形式の行動を作る"""
+    blob = json.dumps({"action": action, "action_input": action_input}, ensure_ascii=False, indent=2)
+    return f"Thought: 次の行動を決めます。\nAction:\n```\n{blob}\n```"
+
+
+def scripted_response(messages):
+    """メッセージ列に対する台本どおりの応答を返す"""
+    role = detect_role(messages)
+    last = messages[-1]
+    destinations = get_preference_extractor().extract(str(messages[-1].content))["destinations"]
+    if not destinations:
+        destinations = get_preference_extractor().extract("\n".join(str(m.content) for m in messages))["destinations"]
+    city = destinations[0] if destinations else "東京"
+
+    if role in ("summary", "text"):
+        return FINAL_ANSWERS[role].format(city=city)
+
+    steps = SCRIPTS[role]
+    step = react_step(last)
+    if step < len(steps):
+        action, action_input = steps[step]
+        return action_blob(action, action_input.format(city=city))
+    return action_blob("Final Answer", FINAL_ANSWERS[role].format(city=city))
+
+
+class ScriptedChatModel(BaseChatModel):
+    """ネットワークを使わず、台本どおりに応答するチャットモデル
+
+    呼び出し回数とプロンプトのトークン数（見積もり）を記録する。
+    latencyを指定すると、モデルの応答時間を模擬する（ストリーミング時は最初のトークンまで）。
+    """
+
+    latency: float = 0.0
+    streaming: bool = False
+    calls: List[Any] = []
+
+    @property
+    def _llm_type(self):
+        return "scripted-fake"
+
+    @property
+    def _identifying_params(self):
+        return {"model": "scripted-fake", "latency": self.latency}
+
+    def _record(self, messages, started):
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        self.calls.append({
+            "role": detect_role(messages),
+            "prompt_tokens": prompt_tokens,
+            "seconds": time.perf_counter() - started,
+            "thread": threading.get_ident()
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        text = scripted_response(messages)
+        self._record(messages, started)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        text = scripted_response(messages)
+        for i in range(0, len(text), 8):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text[i:i + 8]))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        self._record(messages, started)
+
+    def reset(self):
+        """記録をクリアする"""
+        self.calls.clear()
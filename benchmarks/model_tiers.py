@@ -0,0 +1,63 @@
+import argparse
+import contextlib
+import os
+import time
+
+from agents.factory import create_agent
+from benchmarks.agents import CONVERSATION, percentile
+from benchmarks.fake_llm import ScriptedChatModel
+from utils.helpers import estimate_tokens
+from utils.model_router import DEFAULT_ROUTES, TieredChatModel, estimate_cost
+
+# 比較する割り当て（すべての役割をfast / すべてstrong / 既定の振り分け）
+CONFIGS = {
+    "すべてfast": {role: ("fast", "fast") for role in DEFAULT_ROUTES},
+    "すべてstrong": {role: ("strong", "strong") for role in DEFAULT_ROUTES},
+    "振り分け": DEFAULT_ROUTES,
+}
+
+
+def run(routes, agent_type, turns, fast_latency, strong_latency):
+    """台本どおりに応答する2つの階層のモデルでturns回会話し、応答時間と階層ごとの呼び出しを返す"""
+    tiers = {
+        "fast": ScriptedChatModel(latency=fast_latency, calls=[]),
+        "strong": ScriptedChatModel(latency=strong_latency, calls=[]),
+    }
+    llm = TieredChatModel(tiers=tiers, routes=routes, cache=False)
+    options = {"execution_mode": "coordinator"} if agent_type == "multi" else {}
+    agent = create_agent(agent_type, "offline", llm=llm, **options)
+    latencies = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for turn in range(turns):
+            start = time.perf_counter()
+            agent.get_response(CONVERSATION[turn % len(CONVERSATION)])
+            latencies.append(time.perf_counter() - start)
+    return latencies, tiers
+
+
+def cost(tier, calls):
+    """呼び出しの記録から料金（USD）を見積もる（出力は台本の応答の長さを200トークンとみなす）"""
+    return sum(estimate_cost(tier, call["prompt_tokens"], estimate_tokens("x" * 800)) for call in calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="役割ごとのモデルの階層の振り分けで、応答時間と推定料金を比較する（ネットワーク不要）")
+    parser.add_argument("--agent-types", nargs="*", default=["advanced", "multi"])
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--fast-latency", type=float, default=0.05, help="fastの階層の応答時間（秒）")
+    parser.add_argument("--strong-latency", type=float, default=0.3, help="strongの階層の応答時間（秒）")
+    args = parser.parse_args()
+
+    print(f"{'種別':<10} {'割り当て':<12} {'p50(ms)':>9} {'p95(ms)':>9} {'fast呼出':>9} {'strong呼出':>10} {'推定料金($)':>12}")
+    for agent_type in args.agent_types:
+        for name, routes in CONFIGS.items():
+            latencies, tiers = run(routes, agent_type, args.turns, args.fast_latency, args.strong_latency)
+            total = sum(cost(tier, model.calls) for tier, model in tiers.items())
+            print(
+                f"{agent_type:<10} {name:<12} {percentile(latencies, 50) * 1000:>9.0f} {percentile(latencies, 95) * 1000:>9.0f}"
+                f" {len(tiers['fast'].calls):>9} {len(tiers['strong'].calls):>10} {total:>12.4f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import argparse
+import contextlib
+import json
+import os
+
+from benchmarks.agents import print_report, run_conversation
+from utils.intent_router import get_intent_router
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MultiAgentSystemのcoordinatorモードとpipelineモードのLLM呼び出し回数と応答時間を比較する")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="LLM呼び出し1回あたりの模擬遅延（秒）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    # 単純な問い合わせの振り分けは両モードで共通のため、比較から外す
+    get_intent_router().threshold = 2
+
+    results = []
+    for execution_mode in ("coordinator", "pipeline"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = run_conversation("multi", args.turns, args.latency, execution_mode=execution_mode)
+        result["mode"] = execution_mode
+        results.append(result)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print_report(results)
+    coordinator, pipeline = results
+    print(f"\nLLM呼び出し: {coordinator['llm_calls_per_turn']:.1f} → {pipeline['llm_calls_per_turn']:.1f} 回/ターン, "
+          f"p50: {coordinator['latency_ms'][50]:.0f} → {pipeline['latency_ms'][50]:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import contextlib
+import json
+import os
+import time
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from agents.factory import create_agent
+from agents.multi_agent_system import PIPELINE_PROMPTS
+from benchmarks.agents import CONVERSATION, percentile
+from benchmarks.fake_llm import FINAL_ANSWERS, ScriptedChatModel, action_blob, detect_role, scripted_response
+from tools.hotel_tool import hotel_cache
+from tools.weather_tool import weather_cache
+from utils.helpers import estimate_tokens
+
+
+def _section(title, items):
+    return [f"### {title}"] + [f"- {item}" for item in items]
+
+
+# サブエージェントの最終回答に付け足す詳細（実際のモデルの回答に近い長さにする）
+DETAILS = {
+    "researcher": "\n".join(
+        _section("観光スポット", [f"スポット{i}: 歴史ある街並みと季節の景色を楽しめる定番の名所で、朝の早い時間が比較的空いています" for i in range(1, 9)])
+        + _section("グルメ", [f"名物{i}: 地元の食材を使った料理で、駅周辺の老舗から手頃な食堂まで選択肢が豊富です" for i in range(1, 7)])
+        + _section("アクティビティ", [f"体験{i}: 半日程度で参加できる体験プログラムで、事前予約をすると待ち時間を減らせます" for i in range(1, 7)])
+        + _section("ベストシーズン", [f"{month}月: 気候が穏やかで観光しやすく、季節の行事や限定メニューも楽しめます" for month in (3, 4, 10, 11)])
+    ),
+    "planner": "\n".join(
+        [line for day in (1, 2, 3) for line in _section(
+            f"{day}日目", [f"{hour}:00 {day}日目の予定{hour}: 移動時間を考慮して周辺の名所と食事処を組み合わせた行程です" for hour in range(9, 20, 2)]
+        )]
+        + _section("宿泊", [f"候補{i}: 駅から徒歩圏内で評価の高いホテル。朝食付きプランを推奨します" for i in range(1, 4)])
+        + _section("交通", [f"区間{i}: 公共交通機関の1日乗車券を使うと運賃を節約できます" for i in range(1, 4)])
+    ),
+    "budget_manager": "\n".join(
+        _section("内訳", [f"{item}: 目安の金額と、季節や曜日による変動幅を考慮した見積もりです" for item in ("宿泊費", "交通費", "食費", "アクティビティ費", "お土産", "予備費")])
+        + _section("節約のヒント", [f"ヒント{i}: 早期予約や平日の利用、セット券の活用で費用を抑えられます" for i in range(1, 9)])
+    ),
+}
+
+
+def pipeline_role(messages):
+    """pipelineモードの各段階の呼び出しなら、その役割を返す"""
+    system = "\n".join(str(m.content) for m in messages if m.type == "system")
+    for role, (prompt, _) in PIPELINE_PROMPTS.items():
+        if system.startswith(prompt):
+            return role
+    return None
+
+
+def verbose_response(messages):
+    """台本の応答のうち、サブエージェントの最終回答（pipelineモードでは各段階の出力）にDETAILSを付け足す"""
+    text = scripted_response(messages)
+    role = pipeline_role(messages)
+    if role in DETAILS:
+        return f"{FINAL_ANSWERS[role].format(city='')}\n{DETAILS[role]}"
+    role = detect_role(messages)
+    if role in DETAILS and '"Final Answer"' in text:
+        blob = json.loads(text.split("```")[1])
+        return action_blob("Final Answer", f"{blob['action_input']}\n{DETAILS[role]}")
+    return text
+
+
+class VerboseScriptedChatModel(ScriptedChatModel):
+    """サブエージェントが長い回答を返し、応答時間がプロンプトの長さに比例する台本どおりのモデル"""
+
+    # プロンプト1000トークンあたりの処理時間（秒）
+    seconds_per_1k_tokens: float = 0.05
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        started = time.perf_counter()
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        time.sleep(self.latency + prompt_tokens / 1000 * self.seconds_per_1k_tokens)
+        text = verbose_response(messages)
+        self._record(messages, started)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+def run(execution_mode, compact_payloads, turns, latency):
+    """turns回会話し、1ターンごとの応答時間とプロンプトのトークン数を返す"""
+    weather_cache.clear()
+    hotel_cache.clear()
+    llm = VerboseScriptedChatModel(latency=latency, calls=[])
+    agent = create_agent("multi", "offline", llm=llm, execution_mode=execution_mode, compact_payloads=compact_payloads)
+    latencies, tokens = [], []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for turn in range(turns):
+            llm.reset()
+            start = time.perf_counter()
+            agent.get_response(CONVERSATION[turn % len(CONVERSATION)])
+            latencies.append(time.perf_counter() - start)
+            tokens.append(sum(call["prompt_tokens"] for call in llm.calls))
+    return latencies, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ツール結果の簡潔化とエージェント間の受け渡しの上限による、プロンプトのトークン数と応答時間の変化を比較する（ネットワーク不要）")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="1回の呼び出しの固定の応答時間（秒）")
+    parser.add_argument("--execution-modes", nargs="*", default=["coordinator", "pipeline"])
+    args = parser.parse_args()
+
+    print(f"{'実行モード':<12} {'簡潔化':<6} {'トークン/ターン':>14} {'p50(ms)':>9} {'p95(ms)':>9}")
+    for execution_mode in args.execution_modes:
+        for compact_payloads in (False, True):
+            latencies, tokens = run(execution_mode, compact_payloads, args.turns, args.latency)
+            print(
+                f"{execution_mode:<12} {'on' if compact_payloads else 'off':<6} {sum(tokens) / len(tokens):>14.0f}"
+                f" {percentile(latencies, 50) * 1000:>9.0f} {percentile(latencies, 95) * 1000:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
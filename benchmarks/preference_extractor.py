@@ -0,0 +1,74 @@
+import argparse
+import random
+import re
+import time
+
+from utils.preference_extractor import DEFAULT_VOCABULARY, PreferenceExtractor
+
+SAMPLE_INPUTS = [
+    "来月、京都と大阪に2泊3日で行きたいです。予算は8万円で、温泉とグルメを楽しみたいです。",
+    "のんびりできるビーチリゾートを探しています。沖縄か那覇あたりが候補です。",
+    "東京で美術館と博物館を巡る文化体験の旅を計画中。格安のホテルが希望です。",
+]
+
+
+def naive_extract(text, destinations, activities, travel_styles):
+    """従来の実装と同じく、キーワードごとに入力全体を走査する"""
+    result = {"destinations": [], "activities": [], "budget": None, "travel_style": None}
+    for dest in destinations:
+        if dest in text:
+            result["destinations"].append(dest)
+    for act in activities:
+        if act in text:
+            result["activities"].append(act)
+    budget_match = re.search(r'予算[は]?(\d+)万?円', text)
+    if budget_match:
+        budget = int(budget_match.group(1))
+        result["budget"] = budget * 10000 if "万" in budget_match.group(0) else budget * 1000
+    for style, keywords in travel_styles.items():
+        for keyword in keywords:
+            if keyword in text:
+                result["travel_style"] = style
+                break
+    return result
+
+
+def synthetic_places(count, seed=0):
+    """ベンチマーク用の架空の地名を作る"""
+    rng = random.Random(seed)
+    chars = "山川田島本中村松井原石野小大高橋崎宮森池谷藤沢浜岡長北南西東"
+    places = set()
+    while len(places) < count:
+        places.add("".join(rng.choice(chars) for _ in range(rng.randint(2, 4))) + rng.choice("市町村"))
+    return sorted(places)
+
+
+def per_turn_us(func, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        func(SAMPLE_INPUTS[i % len(SAMPLE_INPUTS)])
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="語彙数を増やしたときの1ターンあたりの好み抽出コストを比較する")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--sizes", default="10,100,1000,5000", help="旅行先の語彙数（カンマ区切り）")
+    args = parser.parse_args()
+
+    activities = DEFAULT_VOCABULARY["activities"]
+    travel_styles = DEFAULT_VOCABULARY["travel_styles"]
+    print(f"{'旅行先の語彙数':>12} {'従来(µs/ターン)':>16} {'オートマトン(µs/ターン)':>22} {'構築(ms)':>10}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        destinations = DEFAULT_VOCABULARY["destinations"] + synthetic_places(size)
+        start = time.perf_counter()
+        extractor = PreferenceExtractor(destinations, activities, travel_styles)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        naive = per_turn_us(lambda text: naive_extract(text, destinations, activities, travel_styles), args.rounds)
+        automaton = per_turn_us(extractor.extract, args.rounds)
+        print(f"{size:>12} {naive:>16.1f} {automaton:>22.1f} {build_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import argparse
+import contextlib
+import os
+
+from agents.factory import create_agent
+from benchmarks.agents import CONVERSATION
+from benchmarks.fake_anthropic import FakeAnthropicServer
+from utils.llm import create_llm
+
+# 入力トークンの料金の倍率（キャッシュの読み込みは1割、書き込みは1.25倍）
+CACHE_READ_RATE = 0.1
+CACHE_WRITE_RATE = 1.25
+
+
+def check_markers(body):
+    """リクエストのプロンプトの並びとキャッシュの区切りを確認する（問題があればAssertionError）"""
+    system = body.get("system")
+    assert isinstance(system, list) and system[-1].get("cache_control"), "システムメッセージにcache_controlがありません"
+    messages = body["messages"]
+    assert messages[-1]["role"] == "user", "最後のメッセージが入力ではありません"
+    if len(messages) > 1:
+        # 会話履歴の末尾（最後の入力の直前）にも区切りがある
+        content = messages[-2]["content"]
+        assert isinstance(content, list) and content[-1].get("cache_control"), "会話履歴の末尾にcache_controlがありません"
+    # 最後の入力（ReActの途中経過を含み、反復ごとに変わる）はキャッシュしない
+    content = messages[-1]["content"]
+    assert isinstance(content, str) or not any(block.get("cache_control") for block in content)
+
+
+def run(server, agent_type, turns, prompt_cache):
+    """偽のAnthropicサーバーに対してturns回会話し、入力トークンの内訳を集計する"""
+    server.reset()
+    # 応答キャッシュは使わず、すべての呼び出しをサーバーに送る
+    llm = create_llm("offline", prompt_cache=prompt_cache, anthropic_api_url=server.url, cache=False)
+    agent = create_agent(agent_type, "offline", llm=llm, **({"execution_mode": "coordinator"} if agent_type == "multi" else {}))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for turn in range(turns):
+            agent.get_response(CONVERSATION[turn % len(CONVERSATION)])
+
+    if prompt_cache:
+        for body in server.requests:
+            check_markers(body)
+    usage = {"requests": len(server.requests), "input": 0, "read": 0, "write": 0}
+    for tokens in server.usages:
+        usage["input"] += tokens["input_tokens"] + tokens["cache_read_input_tokens"] + tokens["cache_creation_input_tokens"]
+        usage["read"] += tokens["cache_read_input_tokens"]
+        usage["write"] += tokens["cache_creation_input_tokens"]
+    uncached = usage["input"] - usage["read"] - usage["write"]
+    usage["cost"] = uncached + usage["read"] * CACHE_READ_RATE + usage["write"] * CACHE_WRITE_RATE
+    return usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プロンプトキャッシュの区切りを確認し、入力トークンの内訳を比較する（ネットワーク不要）")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--agent-types", nargs="*", default=["basic", "advanced", "multi"])
+    args = parser.parse_args()
+
+    with FakeAnthropicServer() as server:
+        print(f"{'種別':<10} {'キャッシュ':<8} {'呼び出し':>8} {'入力':>8} {'読込':>8} {'書込':>8} {'料金換算':>10}")
+        for agent_type in args.agent_types:
+            for prompt_cache in (False, True):
+                usage = run(server, agent_type, args.turns, prompt_cache)
+                print(
+                    f"{agent_type:<10} {'on' if prompt_cache else 'off':<8} {usage['requests']:>8} {usage['input']:>8}"
+                    f" {usage['read']:>8} {usage['write']:>8} {usage['cost']:>10.0f}"
+                )
+    print("すべてのリクエストでシステムメッセージと会話履歴の末尾にcache_controlが付いていることを確認しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import contextlib
+import os
+import time
+
+from agents.factory import create_agent
+from benchmarks.agents import CONVERSATION, percentile
+from benchmarks.fake_anthropic import FakeAnthropicServer
+from utils.llm import create_llm
+
+# 比較する設定（resilienceにFalseを渡すと、クライアント既定の再試行だけを使う従来の動作）
+CONFIGS = {
+    "従来": False,
+    "期限+再試行": {"timeout": 30.0, "attempt_timeout": 1.0, "max_retries": 2, "backoff_base": 0.05},
+    "期限+再試行+ヘッジ": {"timeout": 30.0, "attempt_timeout": 1.0, "max_retries": 2, "backoff_base": 0.05, "hedge": True},
+}
+
+
+def run(server, agent_type, turns, resilience):
+    """偽のAnthropicサーバーに対してturns回会話し、1ターンごとの応答時間と失敗数を返す"""
+    server.reset()
+    llm = create_llm("offline", prompt_cache=False, resilience=resilience, anthropic_api_url=server.url, cache=False)
+    agent = create_agent(agent_type, "offline", llm=llm)
+    latencies = []
+    failures = 0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for turn in range(turns):
+            start = time.perf_counter()
+            try:
+                agent.get_response(CONVERSATION[turn % len(CONVERSATION)])
+            except Exception:
+                failures += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="遅延と障害を注入した偽のAnthropicサーバーで、期限・再試行・ヘッジの効果を比較する")
+    parser.add_argument("--agent-type", default="advanced")
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.02, help="通常の応答までの遅延（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="遅い応答の割合")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="遅い応答までの遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.03, help="529で失敗する応答の割合")
+    args = parser.parse_args()
+
+    print(f"{'設定':<16} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'失敗':>6} {'リクエスト':>10}")
+    for name, resilience in CONFIGS.items():
+        with FakeAnthropicServer(
+            latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+            error_rate=args.error_rate, seed=0
+        ) as server:
+            latencies, failures = run(server, args.agent_type, args.turns, resilience)
+            requests = len(server.requests) + server.injected["error"]
+        print(
+            f"{name:<16} {percentile(latencies, 50) * 1000:>9.0f} {percentile(latencies, 95) * 1000:>9.0f}"
+            f" {percentile(latencies, 99) * 1000:>9.0f} {failures:>6} {requests:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
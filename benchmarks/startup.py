@@ -0,0 +1,89 @@
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# コールドスタートを計測する対象のモジュール
+IMPORT_TARGETS = ["app", "main", "agents.factory", "agents.basic_agent", "agents.advanced_agent", "agents.multi_agent_system"]
+
+
+def measure_cold_import(module_name, top=5):
+    """新しいプロセスでモジュールを読み込み、-X importtimeの出力から読み込み時間を求める
+
+    返り値は (全体のミリ秒, 時間のかかったパッケージの上位 [(名前, ミリ秒)])
+    """
+    env = dict(os.environ, ANTHROPIC_API_KEY=os.getenv("ANTHROPIC_API_KEY", "offline"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        capture_output=True, text=True, env=env
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{module_name}の読み込みに失敗しました: {result.stderr.strip().splitlines()[-1]}")
+
+    total = 0.0
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative_ms = int(cumulative) / 1000
+        # 対象が直接読み込んだモジュールを、最上位のパッケージ単位で集計する（字下げがネストの深さ）
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + cumulative_ms
+        if depth == 0 and name == module_name:
+            total = cumulative_ms
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return total, heaviest
+
+
+def measure_construction(agent_types, repeat):
+    """同じプロセスでエージェントを作成し、初回（読み込み込み）と2回目以降の時間を求める"""
+    from agents.factory import create_agent
+    from utils.startup import startup_timings
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for agent_type in agent_types:
+            for _ in range(repeat):
+                create_agent(agent_type, "offline")
+    return startup_timings.as_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="モジュールの読み込み時間とエージェントの作成時間（コールドスタート）を計測する")
+    parser.add_argument("--modules", nargs="*", default=IMPORT_TARGETS)
+    parser.add_argument("--repeat", type=int, default=3, help="エージェントを作成する回数")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    imports = {}
+    for module_name in args.modules:
+        total, heaviest = measure_cold_import(module_name)
+        imports[module_name] = {"total_ms": total, "heaviest": heaviest}
+
+    start = time.perf_counter()
+    timings = measure_construction(["basic", "advanced", "multi"], args.repeat)
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    if args.json:
+        print(json.dumps({"imports": imports, "agents": timings}, ensure_ascii=False, indent=2))
+        return
+
+    print("モジュールの読み込み（新しいプロセス）:")
+    for module_name, result in imports.items():
+        heaviest = ", ".join(f"{name} {ms:.0f}ms" for name, ms in result["heaviest"][:3])
+        print(f"  {module_name:<28} {result['total_ms']:>8.1f}ms  （主な内訳: {heaviest}）")
+    print("エージェントの作成（同じプロセス、初回はLLMクライアントの読み込みを含む）:")
+    for module_name, ms in timings["imports_ms"].items():
+        print(f"  読み込み {module_name:<24} {ms:>8.1f}ms")
+    for agent_type, stats in timings["constructions"].items():
+        print(f"  作成 {agent_type:<28} 初回{stats['first_ms']:>8.1f}ms  平均{stats['mean_ms']:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
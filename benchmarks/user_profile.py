@@ -0,0 +1,110 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from utils.helpers import UserProfile
+from utils.profile_store import ProfileStore
+
+
+class LegacyUserProfile:
+    """比較用: リストと文字列連結による従来のプロファイル"""
+
+    def __init__(self):
+        self.preferences = {"destinations": [], "activities": [], "budget": None, "travel_style": None}
+        self.past_trips = []
+
+    def update_preference(self, key, value):
+        if key in self.preferences:
+            if isinstance(self.preferences[key], list):
+                if value not in self.preferences[key]:
+                    self.preferences[key].append(value)
+            else:
+                self.preferences[key] = value
+
+    def add_past_trip(self, destination, date, notes=None):
+        self.past_trips.append({"destination": destination, "date": date, "notes": notes})
+
+    def get_profile_summary(self):
+        summary = "ユーザープロファイル:\n"
+        summary += "【好み】\n"
+        for key, value in self.preferences.items():
+            if value:
+                if key == "destinations":
+                    summary += f"好きな旅行先: {', '.join(value)}\n" if value else ""
+                elif key == "activities":
+                    summary += f"好きなアクティビティ: {', '.join(value)}\n" if value else ""
+                elif key == "budget":
+                    summary += f"予算: {value}円\n"
+                elif key == "travel_style":
+                    summary += f"旅行スタイル: {value}\n"
+        if self.past_trips:
+            summary += "\n【過去の旅行】\n"
+            for trip in self.past_trips:
+                summary += f"- {trip['destination']} ({trip['date']})"
+                if trip['notes']:
+                    summary += f": {trip['notes']}"
+                summary += "\n"
+        return summary
+
+
+def fill(profile, trips):
+    """典型的な内容でプロファイルを埋める"""
+    for dest in ["東京", "京都", "大阪", "那覇", "札幌", "福岡"]:
+        profile.update_preference("destinations", dest)
+    for act in ["観光", "グルメ", "温泉", "美術館"]:
+        profile.update_preference("activities", act)
+    profile.update_preference("budget", 80000)
+    profile.update_preference("travel_style", "リラックス")
+    for i in range(trips):
+        profile.add_past_trip(f"都市{i}", f"2024-{i % 12 + 1:02d}-01", "楽しかった" if i % 2 else None)
+    return profile
+
+
+def bytes_per_profile(factory, count, trips):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    profiles = [fill(factory(), trips) for _ in range(count)]
+    for profile in profiles:
+        profile.get_profile_summary()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return total / count
+
+
+def summary_us(profile, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        profile.get_profile_summary()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユーザープロファイルのメモリ使用量と要約の取得コストを比較する")
+    parser.add_argument("--profiles", type=int, default=2000)
+    parser.add_argument("--trips", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    legacy, compact = fill(LegacyUserProfile(), args.trips), fill(UserProfile(), args.trips)
+    assert legacy.get_profile_summary() == compact.get_profile_summary()
+
+    print(f"{'':<20} {'従来':>12} {'新実装':>12}")
+    print(f"{'メモリ(バイト/件)':<20} {bytes_per_profile(LegacyUserProfile, args.profiles, args.trips):>12.0f} "
+          f"{bytes_per_profile(UserProfile, args.profiles, args.trips):>12.0f}")
+    print(f"{'要約の取得(µs/回)':<20} {summary_us(legacy, args.calls):>12.2f} {summary_us(compact, args.calls):>12.2f}")
+
+    # 永続化したプロファイルの読み込み
+    with tempfile.TemporaryDirectory() as directory:
+        store = ProfileStore(os.path.join(directory, "profiles.sqlite"))
+        fill(UserProfile("user-1", store), args.trips).save()
+        start = time.perf_counter()
+        loaded = UserProfile.load("user-1", store)
+        print(f"{'保存先からの読み込み(µs)':<20} {'-':>12} {(time.perf_counter() - start) * 1e6:>12.1f}")
+        assert loaded.get_profile_summary() == compact.get_profile_summary()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
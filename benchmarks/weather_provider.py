@@ -0,0 +1,60 @@
+import argparse
+import time
+
+import requests
+
+from tools.stub_weather_server import start_stub_server
+from tools.weather_provider import CircuitBreaker, HTTPWeatherProvider, WeatherUnavailableError
+
+CITIES = ["東京", "大阪", "京都", "札幌", "那覇"]
+
+
+def measure(label, func, rounds):
+    """funcをrounds回実行し、1回あたりの平均時間を表示する"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"{label:<36} {elapsed * 1000:8.2f} ms/回")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="天気APIの取得方式ごとの所要時間を比較する")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005, help="スタブサーバーの応答遅延（秒）")
+    args = parser.parse_args()
+
+    server = start_stub_server(latency=args.latency)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"{len(CITIES)}都市の天気を取得（スタブサーバーの遅延 {args.latency * 1000:.0f} ms）")
+
+    # 従来のコード例と同じく、呼び出しごとに新しい接続を開く
+    def per_call_connection():
+        for city in CITIES:
+            requests.get(f"{base_url}/weather", params={"cities": city}).json()
+
+    provider = HTTPWeatherProvider(base_url)
+
+    def pooled_per_city():
+        for city in CITIES:
+            provider.get_many([city])
+
+    measure("都市ごと・接続を毎回作成", per_call_connection, args.rounds)
+    measure("都市ごと・接続プール", pooled_per_city, args.rounds)
+    measure("一括取得・接続プール", lambda: provider.get_many(CITIES), args.rounds)
+
+    # 取得元が落ちた場合、回路が開いて直近のデータで即座に応答する
+    server.error_rate = 1.0
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    failing = HTTPWeatherProvider(base_url, breaker=breaker)
+    failing._last_known.update(provider._last_known)
+    try:
+        measure("障害時（回路遮断・直近データで代替）", lambda: failing.get_many(CITIES), args.rounds)
+    except WeatherUnavailableError as e:
+        print(f"代替データがありません: {e}")
+    print(f"回路の状態: {breaker.state}, スタブサーバーへのリクエスト数: {server.request_count}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,29 +1,38 @@
+from utils.startup import startup_timings
 from utils.helpers import load_api_key
-from agents.basic_agent import BasicTravelAgent
-from agents.advanced_agent import AdvancedTravelAgent
-from agents.multi_agent_system import MultiAgentSystem
+from agents.factory import create_agent, mode_model_routes
 import argparse
 
+# モードごとの案内（エージェントのモジュールは選ばれたモードのものだけを読み込む）
+MODE_MESSAGES = {
+    'basic': "基本的な旅行エージェントを使用します。",
+    'advanced': "高度な旅行エージェントを使用します。",
+    'multi': "マルチエージェントシステムを使用します。"
+}
+
 def main():
     # コマンドライン引数の解析
     parser = argparse.ArgumentParser(description='旅行プランニングアシスタント')
     parser.add_argument('--mode', choices=['basic', 'advanced', 'multi'], default='advanced',
                         help='エージェントモード（basic, advanced, または multi）')
+    parser.add_argument('--memory-mode', choices=['buffer', 'summary_buffer'], default=None,
+                        help='会話履歴の保持方法（buffer: 全履歴, summary_buffer: 直近の履歴と要約）')
+    parser.add_argument('--model-routes', default=None,
+                        help='役割ごとのモデルの階層（例: coordinator=fast/strong,researcher=fast。既定は環境変数MODEL_ROUTES_<MODE>）')
+    parser.add_argument('--startup-report', action='store_true',
+                        help='起動時間（モジュールの読み込みとエージェントの作成）を表示する')
     args = parser.parse_args()
     
     # APIキーの読み込み
     api_key = load_api_key()
     
     # エージェントの初期化
-    if args.mode == 'basic':
-        print("基本的な旅行エージェントを使用します。")
-        agent = BasicTravelAgent(api_key)
-    elif args.mode == 'multi':
-        print("マルチエージェントシステムを使用します。")
-        agent = MultiAgentSystem(api_key)
-    else:
-        print("高度な旅行エージェントを使用します。")
-        agent = AdvancedTravelAgent(api_key)
+    print(MODE_MESSAGES[args.mode])
+    agent = create_agent(args.mode, api_key, memory_mode=args.memory_mode, model_routes=args.model_routes or mode_model_routes().get(args.mode))
+    
+    if args.startup_report:
+        startup_timings.mark("agent_ready")
+        print(startup_timings.format_report())
     
     print("旅行プランニングアシスタントへようこそ！")
     print("終了するには 'exit' または 'quit' と入力してください。")
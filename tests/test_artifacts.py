@@ -0,0 +1,95 @@
+from utils.artifacts import ArtifactStore
+
+DEPENDENCIES = {
+    "research": ("destination",),
+    "hotels": ("destination", "budget"),
+    "plan": ("research", "hotels"),
+    "budget_report": ("plan", "budget"),
+}
+
+
+def make_store(facts):
+    return ArtifactStore(DEPENDENCIES, lambda: dict(facts))
+
+
+def fill(store):
+    for name in ("research", "hotels", "plan", "budget_report"):
+        store.put(name, f"{name}の結果")
+
+
+def test_new_store_reports_everything_stale():
+    store = make_store({"destination": "京都", "budget": 50000})
+    assert store.stale() == list(DEPENDENCIES)
+    assert store["plan"] == ""
+    fill(store)
+    assert store.stale() == []
+
+
+def test_changing_a_fact_marks_only_its_dependents_stale():
+    facts = {"destination": "京都", "budget": 50000}
+    store = make_store(facts)
+    fill(store)
+
+    facts["budget"] = 80000
+    assert store.stale() == ["hotels", "plan", "budget_report"]
+    assert store.changed_inputs("hotels") == ["budget"]
+    assert store.changed_inputs("plan") == ["hotels"]
+    assert store.is_fresh("research")
+
+
+def test_recomputing_the_same_value_keeps_downstream_fresh():
+    facts = {"destination": "京都", "budget": 50000}
+    store = make_store(facts)
+    fill(store)
+    version = store.version("hotels")
+
+    facts["budget"] = 80000
+    # 予算が変わってもホテル候補が同じなら、バージョンは上がらず後続はそのまま使える
+    store.put("hotels", "hotelsの結果")
+    assert store.version("hotels") == version
+    assert store.stale() == ["budget_report"]
+
+    store.put("hotels", "別のホテル候補")
+    assert store.version("hotels") == version + 1
+    assert store.stale() == ["plan", "budget_report"]
+
+
+def test_inputs_that_were_never_created_do_not_make_artifacts_stale():
+    store = make_store({"destination": "京都", "budget": 50000})
+    store.put("research", "調査結果")
+    # coordinatorモードのようにホテル候補を作らずに計画を作った場合
+    store.put("plan", "計画")
+    assert store.is_fresh("plan")
+    assert not store.is_fresh("hotels")
+
+
+def test_get_or_compute_reuses_fresh_artifacts():
+    facts = {"destination": "京都", "budget": 50000}
+    store = make_store(facts)
+    calls = []
+
+    def compute():
+        calls.append(facts["destination"])
+        return f"{facts['destination']}の調査結果"
+
+    assert store.get_or_compute("research", compute) == "京都の調査結果"
+    assert store.get_or_compute("research", compute) == "京都の調査結果"
+    facts["destination"] = "大阪"
+    assert store.get_or_compute("research", compute) == "大阪の調査結果"
+    assert calls == ["京都", "大阪"]
+
+
+def test_a_different_task_with_the_same_facts_is_recomputed():
+    store = make_store({"destination": "京都", "budget": 50000})
+    calls = []
+
+    def plan(task):
+        return lambda: calls.append(task) or f"{task}の結果"
+
+    assert store.get_or_compute("research", plan("京都の観光情報"), task="京都の観光情報") == "京都の観光情報の結果"
+    assert store.get_or_compute("research", plan("京都の観光情報"), task="京都の観光情報") == "京都の観光情報の結果"
+    assert store.changed_inputs("research", task="京都の美術館") == ["task"]
+    assert store.get_or_compute("research", plan("京都の美術館"), task="京都の美術館") == "京都の美術館の結果"
+    assert calls == ["京都の観光情報", "京都の美術館"]
+    # 依頼文を指定しない確認では、事実と入力の成果物だけを比べる
+    assert store.is_fresh("research")
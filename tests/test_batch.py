@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+
+from utils.batch import ChatBatchRunner
+from utils.session_manager import SessionManager
+from utils.session_store import SQLiteSessionStore
+
+
+class FakeMemory:
+    def __init__(self):
+        self.chat_memory = InMemoryChatMessageHistory()
+        self.last_prompt_tokens = 0
+
+    def clear(self):
+        self.chat_memory.clear()
+
+
+class SlowAgent:
+    """delay秒かけて応答し、会話をメモリに残すエージェント"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.memory = FakeMemory()
+
+    def _answer(self, user_input):
+        self.memory.chat_memory.add_user_message(user_input)
+        self.memory.chat_memory.add_ai_message(f"{user_input}への回答")
+        return f"{user_input}への回答"
+
+    def get_response(self, user_input, callbacks=None):
+        time.sleep(self.delay)
+        return self._answer(user_input)
+
+    async def aget_response(self, user_input, callbacks=None):
+        await asyncio.sleep(self.delay)
+        return self._answer(user_input)
+
+
+def make_runner(delay, max_concurrency=1, item_timeout=1.0, store=None):
+    manager = SessionManager(agent_factory=lambda agent_type, **options: SlowAgent(delay), store=store)
+    return manager, ChatBatchRunner(manager, max_concurrency=max_concurrency, item_timeout=item_timeout)
+
+
+def items(count):
+    return [{"session_id": f"s{i}", "message": f"質問{i}"} for i in range(count)]
+
+
+def test_time_waiting_for_a_slot_does_not_count_against_the_timeout():
+    # 1件0.2秒を1件ずつ処理する。待ち時間を含めると後ろの要求は0.3秒を超える
+    _, runner = make_runner(0.2, max_concurrency=1, item_timeout=0.3)
+    results = runner.run(items(4))
+    assert [r.get("response") for r in results] == [f"質問{i}への回答" for i in range(4)]
+
+
+def test_async_time_waiting_for_a_slot_does_not_count_against_the_timeout():
+    _, runner = make_runner(0.2, max_concurrency=1, item_timeout=0.3)
+    results = asyncio.run(runner.arun(items(4)))
+    assert [r.get("response") for r in results] == [f"質問{i}への回答" for i in range(4)]
+
+
+def test_timed_out_turns_are_not_recorded(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"))
+    manager, runner = make_runner(0.3, item_timeout=0.05, store=store)
+    results = runner.run([{"session_id": "s", "message": "遅い質問"}, {"session_id": "s", "message": "次の質問"}])
+    assert "error" in results[0] and "error" in results[1]
+
+    session = manager.get_session("s", "advanced")
+    # 実行の終了を待ってから、保存先とメモリに残っていないことを確かめる
+    with session.lock:
+        assert store.load_turns("s", "advanced", 10)[0] == []
+        assert session.history == []
+        assert session.agent.memory.chat_memory.messages == []
+
+
+def test_timed_out_turns_are_dropped_from_memory_without_a_store():
+    manager, runner = make_runner(0.3, item_timeout=0.05)
+    runner.run([{"session_id": "s", "message": "遅い質問"}])
+    session = manager.get_session("s", "advanced")
+    with session.lock:
+        assert session.agent.memory.chat_memory.messages == []
+        assert session.history == []
+
+
+def test_async_timed_out_turns_are_cancelled_and_not_recorded(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"))
+    manager, runner = make_runner(0.3, item_timeout=0.05, store=store)
+    results = asyncio.run(runner.arun([{"session_id": "s", "message": "遅い質問"}]))
+    assert "error" in results[0]
+    time.sleep(0.4)
+    assert store.load_turns("s", "advanced", 10)[0] == []
+
+
+def test_slots_are_returned_after_timeouts():
+    _, runner = make_runner(0.1, max_concurrency=2, item_timeout=0.01)
+    runner.run(items(4))
+    time.sleep(0.3)
+    acquired = [runner._slots.acquire(timeout=1) for _ in range(2)]
+    assert acquired == [True, True]
+
+
+def test_unknown_memory_modes_are_rejected_per_item():
+    _, runner = make_runner(0)
+    results = runner.run([
+        {"session_id": "s1", "message": "質問", "memory_mode": "forever"},
+        {"session_id": "s1", "message": "質問", "memory_mode": "summary_buffer"},
+    ])
+    assert "forever" in results[0]["error"]
+    assert results[1]["response"] == "質問への回答"
@@ -0,0 +1,77 @@
+import bisect
+import random
+
+import pytest
+
+from tools.hotel_index import HotelIndex
+
+RECORDS = [
+    {"city": "東京", "name": "ホテルメトロポリタン", "price": 20000, "rating": 4.5},
+    {"city": "東京", "name": "相鉄フレッサイン", "price": 12000, "rating": 4.0},
+    {"city": "東京", "name": "アパホテル", "price": 8000, "rating": 3.5},
+    {"city": "東京", "name": "東横イン", "price": 7000, "rating": 4.0},
+    {"city": "Kyoto", "name": "Hotel Kanra", "price": 30000, "rating": 4.8},
+]
+
+
+def brute_force(records, city, budget, limit, offset):
+    """評価の高い順（同じなら安い順）に並べた予算内のホテル"""
+    hotels = [r for r in records if r["city"].lower() == city.lower() and r["price"] <= budget]
+    hotels.sort(key=lambda r: (-r["rating"], r["price"]))
+    return len(hotels), [(r["price"], r["rating"]) for r in hotels[offset:offset + limit]]
+
+
+def prices_and_ratings(result):
+    total, hotels = result
+    return total, [(price, rating) for _, price, rating in hotels]
+
+
+def test_search_orders_by_rating_within_budget():
+    index = HotelIndex.build(RECORDS)
+    total, hotels = index.search("東京", 15000)
+    assert total == 3
+    assert hotels == [("東横イン", 7000, 4.0), ("相鉄フレッサイン", 12000, 4.0), ("アパホテル", 8000, 3.5)]
+
+
+def test_search_paginates_and_handles_unknown_cities():
+    index = HotelIndex.build(RECORDS)
+    assert index.search("東京", 50000, limit=2, offset=2)[1] == [("相鉄フレッサイン", 12000, 4.0), ("アパホテル", 8000, 3.5)]
+    assert index.search("東京", 50000, limit=2, offset=10) == (4, [])
+    assert index.search("東京", 1000) == (0, [])
+    assert index.search("名古屋", 10000) is None
+    # 英語の都市名は大文字小文字を区別しない
+    assert index.search(" kyoto ", 30000)[1] == [("Hotel Kanra", 30000, 4.8)]
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".csv", ".idx"])
+def test_round_trip_through_files(tmp_path, suffix):
+    rng = random.Random(0)
+    records = [
+        {"city": rng.choice(["東京", "大阪", "京都"]), "name": f"ホテル{i}",
+         "price": rng.randint(5, 40) * 1000, "rating": rng.choice([3.0, 3.5, 4.0, 4.5, 5.0])}
+        for i in range(300)
+    ]
+    path = tmp_path / f"hotels{suffix}"
+    if suffix == ".jsonl":
+        import json
+        path.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in records), encoding="utf-8")
+    elif suffix == ".csv":
+        lines = ["city,name,price,rating"] + [f"{r['city']},{r['name']},{r['price']},{r['rating']}" for r in records]
+        path.write_text("\n".join(lines), encoding="utf-8")
+    else:
+        HotelIndex.build(records).save(str(path))
+
+    index = HotelIndex.load(str(path))
+    assert len(index) == len(records)
+    for city in ("東京", "大阪", "京都"):
+        for budget in (0, 5000, 12000, 25000, 40000):
+            for offset in (0, 5, 50):
+                assert prices_and_ratings(index.search(city, budget, limit=5, offset=offset)) == \
+                    brute_force(records, city, budget, 5, offset)
+
+
+def test_rejects_files_that_are_not_indexes(tmp_path):
+    path = tmp_path / "broken.idx"
+    path.write_bytes(b"NOTANIDX" + bytes(64))
+    with pytest.raises(ValueError):
+        HotelIndex.open(str(path))
@@ -0,0 +1,51 @@
+import re
+
+import pytest
+
+from tools import hotel_tool
+from tools.hotel_index import HotelIndex
+from tools.hotel_tool import PAGE_SIZE, HotelTool, hotel_cache
+
+HOTELS = [f"H{i}" for i in range(1, 13)]
+
+
+@pytest.fixture(autouse=True)
+def catalogue(monkeypatch):
+    # 評価の高い順にH1〜H12となるカタログ
+    records = [{"city": "東京", "name": name, "price": 10000, "rating": 5.0 - i * 0.1} for i, name in enumerate(HOTELS)]
+    monkeypatch.setattr(hotel_tool, "_hotel_index", HotelIndex.build(records))
+    hotel_cache.clear()
+    yield
+    hotel_cache.clear()
+
+
+def walk_pages(tool):
+    """続きの案内をたどって全ページのホテル名を集める"""
+    names, query, pages = [], "東京,20000", 0
+    while query:
+        output = tool.run(query)
+        pages += 1
+        names += re.findall(r"(H\d+)", output)
+        follow = re.search(r"(東京,20000,\d+)", output)
+        query = follow.group(1) if follow else None
+    return names, pages
+
+
+@pytest.mark.parametrize("top_k", [1, 3, 5, 7])
+def test_compact_pages_reach_every_hotel(top_k):
+    names, pages = walk_pages(HotelTool(compact=True, top_k=top_k))
+    assert names == HOTELS
+    assert pages == -(-len(HOTELS) // top_k)
+
+
+def test_text_pages_reach_every_hotel():
+    names, pages = walk_pages(HotelTool())
+    assert names == HOTELS
+    assert pages == -(-len(HOTELS) // PAGE_SIZE)
+
+
+def test_compact_continuation_states_the_next_position():
+    output = HotelTool(compact=True, top_k=3).run("東京,20000,2")
+    assert output.splitlines()[0].startswith("東京 予算20000円以内 評価順 4〜6/12件")
+    assert output.splitlines()[-1] == "ほか6件（7件目からの続き: 東京,20000,3）"
+    assert "ほか" not in HotelTool(compact=True, top_k=3).run("東京,20000,4")
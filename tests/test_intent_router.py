@@ -0,0 +1,71 @@
+import pytest
+
+from agents.factory import needs_llm
+from utils.intent_router import FAST_PATH, IntentRouter, parse_nightly_yen, parse_yen
+
+
+@pytest.mark.parametrize("text, amount", [
+    ("15000円", 15000),
+    ("1万5千円", 15000),
+    ("1.5万円", 15000),
+    ("2万円以内", 20000),
+    ("料金は未定", None),
+])
+def test_parse_yen(text, amount):
+    assert parse_yen(text) == amount
+
+
+@pytest.mark.parametrize("text, amount", [
+    ("東京で1泊15000円以内のホテル", 15000),
+    ("東京で一泊あたり1万円のホテル", 10000),
+    ("東京で15000円/泊のホテル", 15000),
+    ("東京で2万円以内のホテル", 20000),
+    ("予算10万円で東京のホテル", None),
+    ("予算10万円、1泊2万円で東京のホテル", 20000),
+])
+def test_parse_nightly_yen_ignores_trip_budgets(text, amount):
+    assert parse_nightly_yen(text) == amount
+
+
+@pytest.mark.parametrize("text", ["東京の天気は？", "東京は今雨ですか", "京都の今日の気温"])
+def test_route_answers_current_weather_questions(text):
+    intent = IntentRouter().route(text)
+    assert intent.kind == "weather"
+
+
+def test_route_answers_simple_questions():
+    router = IntentRouter()
+    intent = router.route("東京の天気は？")
+    assert (intent.kind, intent.tool_input) == ("weather", "東京")
+    intent = router.route("京都で1泊1万5千円のホテル")
+    assert (intent.kind, intent.tool_input) == ("hotel", "京都,15000")
+
+
+@pytest.mark.parametrize("text", [
+    "京都のホテル",                      # 1泊あたりの予算がない
+    "予算10万円で京都のホテル",           # 旅行全体の予算しかない
+    "京都で3泊の旅行プランとホテル",       # 計画を求めている
+    "東京と京都の天気",                  # 旅行先が複数
+    "京都の天気とホテル",                # 天気とホテルの両方
+    "東京は雨が多いですか",              # 現在の天気ではなく気候を尋ねている
+    "6月の京都の天気は？",               # 特定の時期の天気
+    "那覇の気候を教えて",                # 気候
+    "今月の東京は晴れますか",             # 現在の天気を尋ねる表現がない
+])
+def test_route_falls_back_to_the_agent(text):
+    assert IntentRouter().route(text) is None
+
+
+def test_match_does_not_record_the_routing_outcome():
+    router = IntentRouter()
+    before = FAST_PATH.render()
+    assert router.match("東京の天気は？").kind == "weather"
+    assert router.match("東京は雨が多いですか") is None
+    assert FAST_PATH.render() == before
+
+
+def test_only_agents_with_the_router_answer_without_the_llm():
+    assert not needs_llm("advanced", "東京の天気は？")
+    assert not needs_llm("multi", "東京の天気は？")
+    assert needs_llm("advanced", "東京は雨が多いですか")
+    assert needs_llm("basic", "東京の天気は？")
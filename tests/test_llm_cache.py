@@ -0,0 +1,31 @@
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from utils.llm import create_llm_cache
+from utils.llm_cache import InMemoryLLMCache, make_cache_key
+
+
+def key(*messages):
+    return make_cache_key(dumps(list(messages)), "claude")
+
+
+def tool_call(city):
+    return AIMessage(content="", tool_calls=[{"name": "weather_tool", "args": {"city": city}, "id": "call-1"}])
+
+
+def test_message_ids_and_whitespace_do_not_change_the_key():
+    assert key(HumanMessage(content="京都の 天気", id="a")) == key(HumanMessage(content=" 京都の\n天気 ", id="b"))
+
+
+def test_tool_calls_are_part_of_the_key():
+    observation = ToolMessage(content="晴れ", tool_call_id="call-1")
+    assert key(tool_call("京都"), observation) != key(tool_call("大阪"), observation)
+    assert key(tool_call("京都"), observation) != key(tool_call("京都"), ToolMessage(content="晴れ", tool_call_id="call-2"))
+    assert key(HumanMessage(content="こんにちは", name="alice")) != key(HumanMessage(content="こんにちは"))
+
+
+def test_the_response_cache_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("LLM_CACHE", raising=False)
+    assert create_llm_cache() is None
+    monkeypatch.setenv("LLM_CACHE", "memory")
+    assert isinstance(create_llm_cache(), InMemoryLLMCache)
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from utils.llm_scheduler import LLMOverloaded, LLMScheduler
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_waiting_calls_run_in_priority_order():
+    scheduler = LLMScheduler(max_concurrency=1, reserved_for_interactive=0)
+    held = scheduler.acquire(10, "interactive")
+    order = []
+
+    def call(priority):
+        ticket = scheduler.acquire(10, priority)
+        order.append(priority)
+        scheduler.release(ticket)
+
+    threads = []
+    # 優先度の低い順に並ばせる
+    for priority in ("background", "batch", "interactive"):
+        thread = threading.Thread(target=call, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: scheduler.stats()["queued"][priority] == 1)
+
+    scheduler.release(held)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "batch", "background"]
+
+
+def test_reserved_slots_are_kept_for_interactive_calls():
+    scheduler = LLMScheduler(max_concurrency=2, reserved_for_interactive=1)
+    batch = scheduler.acquire(10, "batch")
+    assert scheduler.try_acquire(10, "batch") is None
+    interactive = scheduler.try_acquire(10, "interactive")
+    assert interactive is not None
+    scheduler.release(batch)
+    scheduler.release(interactive)
+    assert scheduler.stats()["active"] == 0
+
+
+def test_full_queue_is_rejected_with_429():
+    scheduler = LLMScheduler(max_concurrency=1, queue_limits={"interactive": 1})
+    held = scheduler.acquire(10, "interactive")
+    waiter = threading.Thread(target=lambda: scheduler.release(scheduler.acquire(10, "interactive")))
+    waiter.start()
+    wait_until(lambda: scheduler.stats()["queued"]["interactive"] == 1)
+
+    with pytest.raises(LLMOverloaded) as excinfo:
+        scheduler.check("interactive")
+    assert excinfo.value.status == 429
+    with pytest.raises(LLMOverloaded) as excinfo:
+        scheduler.acquire(10, "interactive")
+    assert excinfo.value.status == 429
+
+    scheduler.release(held)
+    waiter.join(5)
+    scheduler.check("interactive")
+
+
+def test_queue_timeout_is_rejected_with_503():
+    scheduler = LLMScheduler(max_concurrency=1, queue_timeouts={"batch": 0.1})
+    held = scheduler.acquire(10, "interactive")
+    with pytest.raises(LLMOverloaded) as excinfo:
+        scheduler.acquire(10, "batch")
+    assert excinfo.value.status == 503
+    assert scheduler.stats()["queued"]["batch"] == 0
+    scheduler.release(held)
+
+
+def test_token_budget_counts_actual_usage():
+    scheduler = LLMScheduler(max_concurrency=4, tokens_per_minute=100)
+    first = scheduler.acquire(80, "interactive")
+    assert scheduler.try_acquire(50, "interactive") is None
+    # 見積もりより使用量が少なければ、その分の枠が空く
+    scheduler.release(first, used_tokens=10)
+    second = scheduler.try_acquire(50, "interactive")
+    assert second is not None
+    assert scheduler.stats()["window_tokens"] == 60
+    scheduler.release(second)
+
+
+def test_try_acquire_does_not_overtake_waiting_calls():
+    scheduler = LLMScheduler(max_concurrency=2, reserved_for_interactive=0)
+    held = [scheduler.acquire(10, "batch"), scheduler.acquire(10, "batch")]
+    waiter = threading.Thread(target=lambda: scheduler.release(scheduler.acquire(10, "batch")))
+    waiter.start()
+    wait_until(lambda: scheduler.stats()["queued"]["batch"] == 1)
+
+    scheduler.release(held.pop())
+    waiter.join(5)
+    assert scheduler.try_acquire(10, "interactive") is not None
+    assert scheduler.try_acquire(10, "interactive") is None
@@ -0,0 +1,70 @@
+import logging
+import threading
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from utils.helpers import create_memory
+from utils.memory import BackgroundSummaryBufferMemory
+from utils.session_manager import agent_options_from_request
+
+
+class FailingChatModel(FakeListChatModel):
+    def _call(self, *args, **kwargs):
+        raise RuntimeError("要約できません")
+
+
+def make_memory(llm=None, max_token_limit=20):
+    llm = llm or FakeListChatModel(responses=["これまでの要約"])
+    return BackgroundSummaryBufferMemory(
+        llm=llm, memory_key="chat_history", return_messages=True, max_token_limit=max_token_limit
+    )
+
+
+def add_turns(memory, count):
+    for i in range(count):
+        memory.chat_memory.add_user_message(f"京都の観光地を教えてください{i}")
+        memory.chat_memory.add_ai_message(f"清水寺や金閣寺がおすすめです{i}")
+
+
+def test_old_turns_are_folded_into_the_summary_in_the_background():
+    memory = make_memory()
+    add_turns(memory, 5)
+    memory.prune()
+    memory.wait_for_summary(timeout=5)
+    messages = memory.load_memory_variables({})["chat_history"]
+    assert messages[0].content == "これまでの要約"
+    assert memory.pending_messages == []
+    assert 0 < len(messages) - 1 < 10
+
+
+def test_failed_summaries_are_logged_and_retried_later(caplog):
+    memory = make_memory(FailingChatModel(responses=[]))
+    add_turns(memory, 5)
+    with caplog.at_level(logging.ERROR, logger="utils.memory"):
+        memory.prune()
+        memory.wait_for_summary(timeout=5)
+    assert "会話の要約に失敗しました" in caplog.text
+    assert not memory.summarizing
+    # 未要約分はプロンプトに残り、次の会話で再度要約する
+    pending = len(memory.pending_messages)
+    assert pending > 0
+    assert len(memory.load_memory_variables({})["chat_history"]) == pending + len(memory.chat_memory.messages)
+
+
+def test_memories_do_not_share_a_lock():
+    busy, other = make_memory(), make_memory()
+    add_turns(other, 1)
+    with busy._lock:
+        loaded = threading.Thread(target=other.load_memory_variables, args=({},))
+        loaded.start()
+        loaded.join(timeout=1)
+        assert not loaded.is_alive()
+
+
+def test_unknown_memory_modes_are_rejected():
+    with pytest.raises(ValueError):
+        create_memory(mode="forever")
+    with pytest.raises(ValueError, match="forever"):
+        agent_options_from_request({"memory_mode": "forever"}, "s1")
+    assert agent_options_from_request({"memory_mode": "buffer"}, "s1")["memory_mode"] == "buffer"
@@ -0,0 +1,60 @@
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agents.multi_agent_system import MultiAgentSystem
+from benchmarks.fake_llm import SCRIPTS, ScriptedChatModel, action_blob
+from utils.model_router import DEFAULT_ROUTES, TieredChatModel, last_observed_action, parse_routes
+
+
+def tiered(**routes):
+    tiers = {"fast": ScriptedChatModel(calls=[]), "strong": ScriptedChatModel(calls=[])}
+    return TieredChatModel(tiers=tiers, routes=dict(DEFAULT_ROUTES, **routes), cache=False)
+
+
+def scratchpad(actions):
+    """ツールを順に呼び出したReActの途中経過"""
+    return "".join(f"{action_blob(action, 'なし')}\nObservation: {action}の結果\nThought:" for action in actions)
+
+
+def test_last_observed_action():
+    assert last_observed_action("東京の旅行プラン") is None
+    assert last_observed_action(scratchpad(["AssignResearchTask", "GetResearchResults"])) == "GetResearchResults"
+    assert last_observed_action("Action: HotelTool\nAction Input: 東京,15000\nObservation: 3件") == "HotelTool"
+
+
+def test_coordinator_escalates_only_before_the_final_answer():
+    llm = tiered().for_role("coordinator")
+    steps = [action for action, _ in SCRIPTS["coordinator"]]
+    tiers = [llm.select_tier([HumanMessage(content="東京の旅行プラン\n\n" + scratchpad(steps[:n]))]) for n in range(len(steps) + 1)]
+    # 旅行プランと予算分析を取得した後のステップだけをstrongで実行する
+    assert tiers == ["fast", "fast", "fast", "fast", "fast", "strong", "fast", "strong"]
+
+
+def test_roles_without_final_tools_escalate_after_any_observation():
+    llm = tiered().for_role("planner")
+    assert llm.select_tier([HumanMessage(content="プラン")]) == "fast"
+    assert llm.select_tier([HumanMessage(content=scratchpad(["GetResearchResults"]))]) == "strong"
+    assert tiered().for_role("planner", final_only=True).select_tier([HumanMessage(content="プラン")]) == "strong"
+
+
+def test_multi_step_coordinator_trace_uses_the_fast_tier_for_tool_selection():
+    llm = tiered()
+    system = MultiAgentSystem("test-key", llm=llm, execution_mode="coordinator")
+    system.get_response("京都の2泊3日の旅行プランを作ってください")
+    coordinator_calls = {
+        tier: sum(1 for call in model.calls if call["role"] == "coordinator") for tier, model in llm.tiers.items()
+    }
+    assert coordinator_calls == {"fast": 6, "strong": 2}
+
+
+@pytest.mark.parametrize("spec, routes", [
+    ("coordinator=fast/strong", {"coordinator": ("fast", "strong")}),
+    ("planner=strong", {"planner": ("strong", "strong")}),
+])
+def test_parse_routes(spec, routes):
+    assert parse_routes(spec) == routes
+
+
+def test_parse_routes_rejects_unknown_tiers():
+    with pytest.raises(ValueError):
+        parse_routes("coordinator=fast/huge")
@@ -0,0 +1,69 @@
+import pytest
+
+from agents.multi_agent_system import DEFAULT_HOTEL_BUDGET, MultiAgentSystem
+from benchmarks.fake_llm import ScriptedChatModel
+
+
+@pytest.fixture
+def system():
+    return MultiAgentSystem("test-key", llm=ScriptedChatModel(), execution_mode="pipeline")
+
+
+@pytest.fixture
+def hotel_queries(system, monkeypatch):
+    queries = []
+    monkeypatch.setattr(type(system.hotel_tool), "_run", lambda tool, query: queries.append(query) or query)
+    return queries
+
+
+def test_hotel_stage_does_not_use_the_trip_budget(system, hotel_queries):
+    system._extract_preferences("京都に2泊3日、予算は5万円で行きたい")
+    assert system.user_profile.preferences["budget"] == 50000
+    system._run_hotel_stage("京都の旅行プラン")
+    assert hotel_queries == [f"京都,{DEFAULT_HOTEL_BUDGET}"]
+
+
+def test_hotel_stage_uses_the_nightly_budget(system, hotel_queries):
+    system._extract_preferences("京都に2泊3日、予算は5万円で行きたい")
+    system._run_hotel_stage("京都の旅行プラン")
+    system._extract_preferences("ホテルは1泊1万5千円までにしてください")
+    system._run_hotel_stage("京都の旅行プラン")
+    assert hotel_queries == [f"京都,{DEFAULT_HOTEL_BUDGET}", "京都,15000"]
+    # 1泊あたりの予算が変わらなければ、ホテル候補を再利用する
+    system._extract_preferences("予算は6万円に増やします")
+    system._run_hotel_stage("京都の旅行プラン")
+    assert len(hotel_queries) == 2
+
+
+def prefetched_tools(turn):
+    return sorted({tool for tool, _ in turn._futures})
+
+
+def test_prefetch_skips_hotels_without_a_nightly_budget(system):
+    preferences = system._extract_preferences("京都に2泊3日、予算は5万円で行きたい")
+    assert prefetched_tools(system._start_prefetch(preferences)) == ["weather"]
+
+
+def test_prefetch_uses_the_nightly_budget(system):
+    preferences = system._extract_preferences("京都で1泊1万5千円のホテルを含めた旅行プラン")
+    turn = system._start_prefetch(preferences)
+    assert ("hotel", ("京都", 15000, 1, system.hotel_tool.page_size)) in turn._futures
+
+
+class RecordingAgent:
+    def __init__(self):
+        self.tasks = []
+
+    def run(self, task):
+        self.tasks.append(task)
+        return f"{task}の結果"
+
+
+def test_delegation_recomputes_when_the_task_changes(system):
+    system._extract_preferences("京都に2泊3日で行きたい")
+    planner = RecordingAgent()
+    for task in ("京都の2泊3日のプラン", "京都の2泊3日のプラン", "もっと安いプランにしてください"):
+        system._delegate("プランナーエージェント", planner, task, "travel_plan", "完了")
+    # 旅行先と日程が同じでも、依頼が変われば作り直す
+    assert planner.tasks == ["京都の2泊3日のプラン", "もっと安いプランにしてください"]
+    assert system.shared_memory["travel_plan"] == "もっと安いプランにしてくださいの結果"
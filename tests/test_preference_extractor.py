@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from benchmarks.preference_extractor import SAMPLE_INPUTS, naive_extract
+from utils.helpers import UserProfile
+from utils.preference_extractor import DEFAULT_VOCABULARY, PreferenceExtractor, get_preference_extractor
+
+VOCABULARY = (DEFAULT_VOCABULARY["destinations"], DEFAULT_VOCABULARY["activities"], DEFAULT_VOCABULARY["travel_styles"])
+
+
+def random_inputs(count, seed=0):
+    """語彙、予算の表現、無関係な語を混ぜた入力"""
+    rng = random.Random(seed)
+    style_words = [word for words in DEFAULT_VOCABULARY["travel_styles"].values() for word in words]
+    pieces = DEFAULT_VOCABULARY["destinations"] + DEFAULT_VOCABULARY["activities"] + style_words + [
+        "予算は5万円", "予算8万円", "予算30円", "予算は", "予算", "万円", "で", "に行きたい", "、", "旅行", "ホテル",
+    ]
+    return ["".join(rng.choice(pieces) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+def assert_same_as_keyword_scan(extractor, text):
+    expected = naive_extract(text, *VOCABULARY)
+    actual = extractor.extract(text)
+    # 旅行先とアクティビティは出現順に並ぶ（従来は語彙の順）
+    assert sorted(actual["destinations"]) == sorted(expected["destinations"]), text
+    assert sorted(actual["activities"]) == sorted(expected["activities"]), text
+    assert actual["budget"] == expected["budget"], text
+    assert actual["travel_style"] == expected["travel_style"], text
+
+
+def test_sample_inputs_match_the_previous_keyword_scan():
+    extractor = PreferenceExtractor(*VOCABULARY)
+    for text in SAMPLE_INPUTS:
+        assert_same_as_keyword_scan(extractor, text)
+
+
+def test_random_inputs_match_the_previous_keyword_scan():
+    extractor = PreferenceExtractor(*VOCABULARY)
+    for text in random_inputs(500):
+        assert_same_as_keyword_scan(extractor, text)
+
+
+def test_destinations_are_listed_in_order_of_appearance():
+    assert get_preference_extractor().extract("大阪から京都、東京へ")["destinations"] == ["大阪", "京都", "東京"]
+
+
+@pytest.mark.parametrize("text, budget", [("予算を8万円で", 80000), ("予算が10万円", 100000), ("予算は30円", 30000)])
+def test_budget_particles(text, budget):
+    assert get_preference_extractor().extract(text)["budget"] == budget
+
+
+def test_apply_updates_the_profile():
+    profile = UserProfile()
+    get_preference_extractor().apply(profile, "京都で温泉、予算は5万円でのんびりしたい")
+    assert list(profile.preferences["destinations"]) == ["京都"]
+    assert list(profile.preferences["activities"]) == ["温泉"]
+    assert profile.preferences["budget"] == 50000
+    assert profile.preferences["travel_style"] == "リラックス"
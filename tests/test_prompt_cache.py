@@ -0,0 +1,55 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from benchmarks.fake_llm import ScriptedChatModel
+from utils.llm import CACHE_CONTROL, PromptCachingChatModel, mark_prompt_cache
+
+
+def marked_indexes(messages):
+    return [
+        index for index, message in enumerate(messages)
+        if isinstance(message.content, list) and message.content[-1].get("cache_control") == CACHE_CONTROL
+    ]
+
+
+def conversation():
+    return [
+        SystemMessage(content="あなたは旅行エージェントです。"),
+        HumanMessage(content="京都の天気は？"),
+        AIMessage(content="小雨です。"),
+        HumanMessage(content="ホテルは？"),
+    ]
+
+
+def test_the_system_prompt_and_the_end_of_the_history_are_marked():
+    messages = conversation()
+    marked = mark_prompt_cache(messages)
+    assert marked_indexes(marked) == [0, 2]
+    assert marked[0].content == [{"type": "text", "text": "あなたは旅行エージェントです。", "cache_control": CACHE_CONTROL}]
+    # 元のメッセージは書き換えない
+    assert marked_indexes(messages) == []
+    assert marked[3] is messages[3]
+
+
+def test_short_prompts_mark_only_the_system_prompt():
+    assert marked_indexes(mark_prompt_cache([SystemMessage(content="指示"), HumanMessage(content="質問")])) == [0]
+    assert marked_indexes(mark_prompt_cache([HumanMessage(content="質問")])) == []
+
+
+def test_only_the_last_block_of_a_list_content_is_marked():
+    message = HumanMessage(content=[{"type": "text", "text": "前半"}, {"type": "text", "text": "後半"}])
+    marked = mark_prompt_cache([SystemMessage(content="指示"), message, HumanMessage(content="質問")])[1]
+    assert marked.content == [{"type": "text", "text": "前半"}, {"type": "text", "text": "後半", "cache_control": CACHE_CONTROL}]
+    assert "cache_control" not in message.content[1]
+
+
+def test_the_wrapper_sends_marked_messages(monkeypatch):
+    seen = []
+    generate = ScriptedChatModel._generate
+
+    def recording_generate(self, messages, *args, **kwargs):
+        seen.append(messages)
+        return generate(self, messages, *args, **kwargs)
+
+    monkeypatch.setattr(ScriptedChatModel, "_generate", recording_generate)
+    PromptCachingChatModel(inner=ScriptedChatModel(calls=[])).invoke(conversation())
+    assert marked_indexes(seen[0]) == [0, 2]
@@ -0,0 +1,185 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from utils import llm as llm_module
+from utils.llm import LLMCallTimeout, ResilientChatModel
+from utils.llm_scheduler import LLMScheduler
+
+MESSAGES = [HumanMessage(content="東京の天気は？")]
+
+
+class Overloaded(Exception):
+    status_code = 529
+
+
+class ScriptedModel(BaseChatModel):
+    """呼び出しごとに (遅延, 応答の文字列または例外) を順に返すモデル（台本が尽きたらすぐに"ok"を返す）"""
+
+    script: List[Any] = []
+    calls: List[float] = []
+    lock: Any = None
+
+    def __init__(self, script, **kwargs):
+        super().__init__(script=list(script), calls=[], lock=threading.Lock(), **kwargs)
+
+    @property
+    def _llm_type(self):
+        return "scripted-test"
+
+    def _next(self):
+        with self.lock:
+            self.calls.append(time.monotonic())
+            return self.script.pop(0) if self.script else (0.0, "ok")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, outcome = self._next()
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=outcome))])
+
+
+class StreamingScriptedModel(ScriptedModel):
+    """最初のチャンクまでに遅延があり、その後は0.01秒ごとにチャンクを返すモデル"""
+
+    chunks_sent: List[int] = []
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, outcome = self._next()
+        time.sleep(delay)
+        for i in range(20):
+            self.chunks_sent.append(i)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=outcome if i == 0 else ""))
+            time.sleep(0.01)
+
+
+def resilient(inner, **options):
+    options = dict({"timeout": 5.0, "attempt_timeout": 1.0, "max_retries": 2, "backoff_base": 0.01}, **options)
+    return ResilientChatModel(inner=inner, cache=False, **options)
+
+
+def test_retryable_errors_are_retried():
+    inner = ScriptedModel([(0.0, Overloaded("overloaded")), (0.0, "回復しました")])
+    assert resilient(inner).invoke(MESSAGES).content == "回復しました"
+    assert len(inner.calls) == 2
+
+
+def test_other_errors_are_not_retried():
+    inner = ScriptedModel([(0.0, ValueError("不正なリクエスト"))])
+    with pytest.raises(ValueError):
+        resilient(inner).invoke(MESSAGES)
+    assert len(inner.calls) == 1
+
+
+def test_retries_stop_after_max_retries():
+    inner = ScriptedModel([(0.0, Overloaded("overloaded"))] * 5)
+    with pytest.raises(Overloaded):
+        resilient(inner, max_retries=2).invoke(MESSAGES)
+    assert len(inner.calls) == 3
+
+
+def test_slow_attempts_time_out_and_are_retried():
+    inner = ScriptedModel([(1.0, "遅い応答"), (0.0, "速い応答")])
+    started = time.monotonic()
+    assert resilient(inner, attempt_timeout=0.1).invoke(MESSAGES).content == "速い応答"
+    assert time.monotonic() - started < 0.8
+
+
+def test_the_overall_deadline_is_enforced():
+    inner = ScriptedModel([(1.0, "遅い応答")] * 5)
+    started = time.monotonic()
+    with pytest.raises(LLMCallTimeout):
+        resilient(inner, timeout=0.3, attempt_timeout=0.2).invoke(MESSAGES)
+    assert time.monotonic() - started < 0.8
+
+
+def test_hedge_wins_over_a_slow_attempt():
+    inner = ScriptedModel([(1.0, "遅い応答"), (0.0, "ヘッジの応答")])
+    started = time.monotonic()
+    result = resilient(inner, hedge=True, hedge_delay=0.05).invoke(MESSAGES)
+    assert result.content == "ヘッジの応答"
+    assert time.monotonic() - started < 0.8
+
+
+def test_hedge_is_skipped_when_the_scheduler_is_full():
+    scheduler = LLMScheduler(max_concurrency=1, reserved_for_interactive=0)
+    held = scheduler.acquire(10, "interactive")
+    inner = ScriptedModel([(0.3, "最初の応答")])
+    result = resilient(inner, hedge=True, hedge_delay=0.05, scheduler=scheduler).invoke(MESSAGES)
+    assert result.content == "最初の応答"
+    assert len(inner.calls) == 1
+    scheduler.release(held)
+
+
+def test_hedge_returns_its_scheduler_slot():
+    scheduler = LLMScheduler(max_concurrency=4)
+    inner = ScriptedModel([(0.3, "遅い応答"), (0.0, "ヘッジの応答")])
+    resilient(inner, hedge=True, hedge_delay=0.05, scheduler=scheduler).invoke(MESSAGES)
+    assert len(inner.calls) == 2
+    assert scheduler.stats()["active"] == 0
+
+
+def test_losing_streams_stop_at_the_next_chunk():
+    inner = StreamingScriptedModel([(0.3, "遅い応答"), (0.0, "ヘッジの応答")])
+    result = resilient(inner, hedge=True, hedge_delay=0.05).invoke(MESSAGES)
+    assert result.content == "ヘッジの応答"
+    time.sleep(0.6)
+    # 負けた試行は最初のチャンクを受け取った時点で読み込みをやめる
+    assert len(inner.chunks_sent) < 40
+
+
+def test_waiting_for_a_worker_does_not_use_the_attempt_budget(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(llm_module, "_attempt_executor", pool)
+    busy = pool.submit(time.sleep, 0.3)
+    inner = ScriptedModel([(0.0, "応答")])
+    # スレッドが空くまで0.3秒かかるが、試行の期限（0.2秒）は試行が始まってから数える
+    assert resilient(inner, attempt_timeout=0.2, max_retries=0).invoke(MESSAGES).content == "応答"
+    busy.result()
+    pool.shutdown()
+
+
+def test_unstarted_hedges_are_cancelled_and_release_their_slot(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(llm_module, "_attempt_executor", pool)
+    scheduler = LLMScheduler(max_concurrency=4)
+    inner = ScriptedModel([(0.2, "最初の応答")])
+    # 最初の試行がスレッドを使っている間、ヘッジはスレッドの空きを待ったまま取り消される
+    result = resilient(inner, hedge=True, hedge_delay=0.05, scheduler=scheduler).invoke(MESSAGES)
+    assert result.content == "最初の応答"
+    pool.shutdown(wait=True)
+    assert len(inner.calls) == 1
+    assert scheduler.stats()["active"] == 0
+
+
+def test_attempt_pool_covers_the_scheduler_fan_out(monkeypatch):
+    monkeypatch.setenv("LLM_ATTEMPT_WORKERS", "4")
+    assert llm_module.attempt_workers() == 4
+    assert llm_module.attempt_workers(LLMScheduler(max_concurrency=8)) == 8 * llm_module.ATTEMPTS_PER_CALL
+
+
+class FailingStreamModel(ScriptedModel):
+    """最初のチャンクを返した後に失敗するストリーム"""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._next()
+        yield ChatGenerationChunk(message=AIMessageChunk(content="途中"))
+        time.sleep(0.2)
+        raise ValueError("ストリームが途切れました")
+
+
+def test_errors_after_a_skipped_hedge_are_raised_promptly():
+    inner = FailingStreamModel([])
+    started = time.monotonic()
+    with pytest.raises(ValueError):
+        resilient(inner, hedge=True, hedge_delay=0.05, attempt_timeout=2.0).invoke(MESSAGES)
+    # 送らなかったヘッジの応答を試行の期限まで待たない
+    assert time.monotonic() - started < 1.0
+    assert len(inner.calls) == 1
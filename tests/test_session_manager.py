@@ -0,0 +1,47 @@
+import asyncio
+
+from utils.session_manager import SessionManager
+
+
+class FakeAgent:
+    def __init__(self, agent_type):
+        self.agent_type = agent_type
+
+
+def make_manager(**options):
+    return SessionManager(agent_factory=lambda agent_type, **_: FakeAgent(agent_type), **options)
+
+
+def test_least_recently_used_sessions_are_evicted():
+    manager = make_manager(max_sessions=2)
+    first = manager.get_session("s1", "advanced")
+    manager.get_session("s2", "advanced")
+    manager.get_session("s1", "advanced")
+    manager.get_session("s3", "advanced")
+    assert len(manager) == 2
+    assert manager.get_session("s1", "advanced") is first
+
+
+def test_busy_sessions_are_not_evicted_by_the_size_limit():
+    manager = make_manager(max_sessions=1)
+    busy = manager.get_session("s1", "advanced")
+    with busy.lock:
+        manager.get_session("s2", "advanced")
+        # 実行中のセッションは上限を超えても残り、次の要求は同じセッション（同じロック）を使う
+        assert manager.get_session("s1", "advanced") is busy
+        manager.get_session("s3", "advanced")
+        assert len(manager) == 2
+    manager.get_session("s4", "advanced")
+    assert len(manager) == 1
+
+
+def test_busy_sessions_are_not_evicted_by_the_ttl():
+    manager = make_manager(ttl=0)
+    busy = manager.get_session("s1", "advanced")
+
+    async def run_turn():
+        async with busy.async_lock:
+            return manager.get_session("s1", "advanced")
+
+    assert asyncio.run(run_turn()) is busy
+    assert manager.get_session("s1", "advanced") is not busy
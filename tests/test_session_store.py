@@ -0,0 +1,94 @@
+import fnmatch
+
+import pytest
+from langchain_core.chat_history import InMemoryChatMessageHistory
+
+from utils.session_manager import SessionManager
+from utils.session_store import KeyValueSessionStore, SQLiteSessionStore
+
+
+class FakeKeyValueClient:
+    """KeyValueSessionStoreが使うRedisのリスト操作だけを持つクライアント"""
+
+    def __init__(self):
+        self.data = {}
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def rpush(self, key, value):
+        self.data.setdefault(key, []).append(value)
+
+    def lrange(self, key, start, end):
+        items = self.data.get(key, [])
+        return items[max(0, len(items) + start):len(items) + end + 1 if end < 0 else end + 1]
+
+    def ltrim(self, key, start, end):
+        self.data[key] = self.lrange(key, start, end)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, pattern):
+        return [key for key in self.data if fnmatch.fnmatch(key, pattern)]
+
+
+@pytest.fixture(params=["sqlite", "kvs"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteSessionStore(str(tmp_path / "sessions.sqlite"))
+    return KeyValueSessionStore(FakeKeyValueClient())
+
+
+def test_turns_are_appended_loaded_and_compacted(store):
+    ids = [store.append_turn("s1", "advanced", f"質問{i}", f"回答{i}") for i in range(5)]
+    store.append_turn("s1", "multi", "別の種別", "回答")
+    assert ids == sorted(ids)
+    assert store.last_turn_id("s1", "advanced") == ids[-1]
+    turns, last_id = store.load_turns("s1", "advanced", 2)
+    assert turns == [("質問3", "回答3"), ("質問4", "回答4")]
+    assert last_id == ids[-1]
+
+    store.compact("s1", "advanced", 3)
+    assert [user for user, _ in store.load_turns("s1", "advanced", 10)[0]] == ["質問2", "質問3", "質問4"]
+    # 圧縮してもターンの番号は戻らない
+    assert store.append_turn("s1", "advanced", "質問5", "回答5") > ids[-1]
+
+    store.delete("s1")
+    assert store.load_turns("s1", "advanced", 10) == ([], 0)
+    assert store.load_turns("s1", "multi", 10) == ([], 0)
+
+
+class FakeMemory:
+    def __init__(self):
+        self.chat_memory = InMemoryChatMessageHistory()
+
+    def clear(self):
+        self.chat_memory.clear()
+
+
+class MemoryAgent:
+    def __init__(self):
+        self.memory = FakeMemory()
+
+
+def test_sessions_are_restored_from_the_store_by_another_worker(store):
+    workers = [SessionManager(agent_factory=lambda agent_type, **_: MemoryAgent(), store=store) for _ in range(2)]
+    first = workers[0].get_session("s1", "advanced")
+    first.begin_turn()
+    workers[0].record_turn(first, "京都の天気は？", "小雨です")
+
+    second = workers[1].get_session("s1", "advanced")
+    agent = second.begin_turn()
+    assert [message.content for message in agent.memory.chat_memory.messages] == ["京都の天気は？", "小雨です"]
+    workers[1].record_turn(second, "ホテルは？", "3件あります")
+
+    # 他のワーカーが会話を進めていれば、次のターンの開始時に読み直す
+    agent = first.begin_turn()
+    assert len(agent.memory.chat_memory.messages) == 4
+    assert first.history[-1] == {"user": "ホテルは？", "agent": "3件あります"}
@@ -0,0 +1,74 @@
+import asyncio
+import uuid
+
+from utils.streaming import FinalAnswerParser, StreamingEventHandler, astream_agent_response, format_sse, stream_agent_response
+
+REACT_OUTPUT = '```json\n{"action": "Final Answer", "action_input": "京都は\\"小雨\\"です\\nどうぞ"}\n```'
+
+
+def feed_in_chunks(parser, text, size=3):
+    return "".join(parser.feed(text[i:i + size]) for i in range(0, len(text), size))
+
+
+def test_final_answer_is_extracted_from_react_output_across_token_boundaries():
+    assert feed_in_chunks(FinalAnswerParser(), REACT_OUTPUT) == '京都は"小雨"です\nどうぞ'
+    assert feed_in_chunks(FinalAnswerParser(), '{"action": "WeatherTool", "action_input": "京都"}') == ""
+    assert feed_in_chunks(FinalAnswerParser(react=False), "そのままの文章") == "そのままの文章"
+
+
+def emit_answer(handler, tokens):
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [[]], run_id=run_id)
+    for token in tokens:
+        handler.on_llm_new_token(token, run_id=run_id)
+    handler.on_llm_end(None, run_id=run_id)
+
+
+def fake_run(handler):
+    tool_run = uuid.uuid4()
+    handler.on_tool_start({"name": "weather_tool"}, "京都", run_id=tool_run)
+    # ツールの実行中のトークン（サブエージェントなど）は最終回答として流さない
+    emit_answer(handler, ['{"action": "Final Answer", "action_input": "', 'ツール内', '"}'])
+    handler.on_tool_end("小雨", run_id=tool_run)
+    emit_answer(handler, ['{"action": "Final Answer", ', '"action_input": "', '京都は', '小雨です', '"}'])
+    return "京都は小雨です"
+
+
+def test_stream_agent_response_yields_tool_and_token_events_in_order():
+    events = list(stream_agent_response(fake_run))
+    assert [event["type"] for event in events] == ["tool_start", "tool_end", "token", "token", "done"]
+    assert "".join(event["text"] for event in events if event["type"] == "token") == "京都は小雨です"
+    assert events[-1]["response"] == "京都は小雨です"
+
+
+def test_async_stream_matches_the_threaded_stream():
+    async def run(handler):
+        await asyncio.sleep(0)
+        # コールバックは別スレッドから呼ばれることもある
+        return await asyncio.to_thread(fake_run, handler)
+
+    async def collect():
+        return [event async for event in astream_agent_response(run)]
+
+    assert asyncio.run(collect()) == list(stream_agent_response(fake_run))
+
+
+def test_errors_end_the_stream():
+    def failing_run(handler):
+        raise RuntimeError("混雑しています")
+
+    assert list(stream_agent_response(failing_run)) == [{"type": "error", "error": "混雑しています"}]
+
+
+def test_format_sse():
+    assert format_sse({"type": "token", "text": "晴れ"}) == 'data: {"type": "token", "text": "晴れ"}\n\n'
+
+
+def test_handler_accepts_another_queue():
+    events = []
+
+    class ListQueue:
+        put = events.append
+
+    StreamingEventHandler(events=ListQueue()).put("start")
+    assert events == [{"type": "start"}]
@@ -0,0 +1,65 @@
+import contextvars
+import threading
+
+import pytest
+
+from utils.task_scheduler import TaskScheduler
+
+
+def test_dependencies_receive_results():
+    scheduler = TaskScheduler()
+    scheduler.add_task("research", lambda inputs: "京都の情報")
+    scheduler.add_task("hotels", lambda inputs: "ホテル候補")
+    scheduler.add_task("plan", lambda inputs: f"{inputs['research']}と{inputs['hotels']}の計画", depends_on=("research", "hotels"))
+    assert scheduler.run()["plan"] == "京都の情報とホテル候補の計画"
+    assert scheduler.errors == {}
+
+
+def test_failures_propagate_to_dependents_only():
+    scheduler = TaskScheduler()
+    error = ValueError("検索に失敗しました")
+
+    def fail(inputs):
+        raise error
+
+    ran = []
+    scheduler.add_task("research", fail)
+    scheduler.add_task("hotels", lambda inputs: ran.append("hotels") or "ホテル候補")
+    scheduler.add_task("plan", lambda inputs: ran.append("plan"), depends_on=("research", "hotels"))
+    scheduler.add_task("budget", lambda inputs: ran.append("budget"), depends_on=("plan",))
+
+    results = scheduler.run()
+    assert results == {"hotels": "ホテル候補"}
+    assert ran == ["hotels"]
+    assert scheduler.errors["research"] is error
+    assert isinstance(scheduler.errors["plan"], RuntimeError)
+    assert "research" in str(scheduler.errors["plan"])
+    assert "plan" in str(scheduler.errors["budget"])
+
+
+def test_independent_tasks_run_in_parallel():
+    scheduler = TaskScheduler(max_workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+    scheduler.add_task("a", lambda inputs: barrier.wait() is not None)
+    scheduler.add_task("b", lambda inputs: barrier.wait() is not None)
+    assert scheduler.run() == {"a": True, "b": True}
+
+
+def test_tasks_inherit_the_callers_context():
+    variable = contextvars.ContextVar("variable", default="未設定")
+    variable.set("呼び出し元")
+    scheduler = TaskScheduler()
+    scheduler.add_task("read", lambda inputs: variable.get())
+    assert scheduler.run() == {"read": "呼び出し元"}
+
+
+@pytest.mark.parametrize("tasks", [
+    {"plan": ("research",)},
+    {"a": ("b",), "b": ("a",)},
+])
+def test_invalid_graphs_are_rejected(tasks):
+    scheduler = TaskScheduler()
+    for name, deps in tasks.items():
+        scheduler.add_task(name, lambda inputs: None, depends_on=deps)
+    with pytest.raises(ValueError):
+        scheduler.run()
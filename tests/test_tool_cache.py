@@ -0,0 +1,98 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils.tool_cache import ToolResultCache
+
+
+def test_concurrent_calls_for_the_same_key_are_coalesced():
+    cache = ToolResultCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "晴れ"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute("東京", compute)))
+    leader.start()
+    started.wait(5)
+    followers = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("東京", compute))) for _ in range(7)
+    ]
+    for thread in followers:
+        thread.start()
+    while cache.coalesced < 7:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert results == ["晴れ"] * 8
+    assert len(calls) == 1
+    assert (cache.misses, cache.coalesced) == (1, 7)
+    # 取得後はキャッシュから返す
+    assert cache.get_or_compute("東京", compute) == "晴れ"
+    assert cache.hits == 1
+
+
+def test_errors_reach_waiters_and_are_not_cached():
+    cache = ToolResultCache()
+
+    def fail():
+        raise RuntimeError("接続できません")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("大阪", fail)
+    assert cache.get_or_compute("大阪", lambda: "曇り") == "曇り"
+
+
+def test_missing_results_use_negative_ttl():
+    cache = ToolResultCache(ttl=300, negative_ttl=0)
+    assert cache.get_or_compute("不明", lambda: None) is None
+    # negative_ttl=0なので、見つからなかった結果はすぐに取り直す
+    assert cache.get_or_compute("不明", lambda: "見つかった") == "見つかった"
+
+
+def test_get_or_compute_many_fetches_only_missing_keys():
+    cache = ToolResultCache()
+    cache.get_or_compute("東京", lambda: "晴れ")
+    requested = []
+
+    def compute_many(keys):
+        requested.append(list(keys))
+        return {key: f"{key}の天気" for key in keys}
+
+    results = cache.get_or_compute_many(["東京", "京都", "京都", "札幌"], compute_many)
+    assert results == {"東京": "晴れ", "京都": "京都の天気", "札幌": "札幌の天気"}
+    assert requested == [["京都", "札幌"]]
+
+
+def test_async_calls_are_coalesced():
+    cache = ToolResultCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "雨"
+
+    async def main():
+        return await asyncio.gather(*(cache.aget_or_compute("福岡", compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["雨"] * 5
+    assert len(calls) == 1
+
+
+def test_ttl_for_can_skip_caching_a_value():
+    cache = ToolResultCache(ttl_for=lambda value: 0 if value.get("stale") else None)
+    values = iter([{"stale": True}, {"stale": False}])
+    assert cache.get_or_compute("東京", lambda: next(values)) == {"stale": True}
+    assert cache.get_or_compute("東京", lambda: next(values)) == {"stale": False}
+    assert cache.get_or_compute("東京", lambda: {"stale": None}) == {"stale": False}
+    assert cache.misses == 2
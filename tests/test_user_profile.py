@@ -0,0 +1,63 @@
+from agents.factory import make_session_agent_factory
+from benchmarks.fake_llm import ScriptedChatModel
+from utils.helpers import UserProfile
+from utils.profile_store import ProfileStore
+from utils.session_manager import SessionManager, agent_options_from_request
+
+
+class CountingProfileStore(ProfileStore):
+    """保存の回数を数える保存先"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.saves = 0
+
+    def save(self, profile_id, data):
+        self.saves += 1
+        super().save(profile_id, data)
+
+
+def make_manager(store):
+    factory = make_session_agent_factory("test-key", store)
+    return SessionManager(lambda agent_type, **options: factory(agent_type, llm=ScriptedChatModel(), **options))
+
+
+def test_changes_are_saved_once_per_turn(tmp_path):
+    store = CountingProfileStore(str(tmp_path / "profiles.sqlite"))
+    manager = make_manager(store)
+    session = manager.get_session("s1", "advanced", agent_options_from_request({}, "s1"))
+    profile = session.begin_turn().user_profile
+    profile.update_preference("destinations", "京都")
+    profile.update_preference("activities", "温泉")
+    profile.update_preference("budget", 50000)
+    assert store.saves == 0
+    manager.record_turn(session, "京都で温泉", "いいですね")
+    assert store.saves == 1
+    # 変更がなければ保存しない
+    manager.record_turn(session, "ありがとう", "どういたしまして")
+    assert store.saves == 1
+    assert UserProfile.load("session:s1", store).get_preference_list("destinations") == ["京都"]
+
+
+def test_sessions_of_the_same_user_share_one_profile(tmp_path):
+    store = ProfileStore(str(tmp_path / "profiles.sqlite"))
+    manager = make_manager(store)
+    advanced = manager.get_session("s1", "advanced", agent_options_from_request({}, "s1", user_id="alice"))
+    multi = manager.get_session("s2", "multi", agent_options_from_request({}, "s2", user_id="alice"))
+    advanced_profile = advanced.begin_turn().user_profile
+    multi_profile = multi.begin_turn().user_profile
+    assert advanced_profile is multi_profile
+
+    # どちらのセッションの更新も、後から保存したセッションに上書きされない
+    advanced_profile.update_preference("destinations", "京都")
+    manager.record_turn(advanced, "京都", "はい")
+    multi_profile.update_preference("destinations", "大阪")
+    manager.record_turn(multi, "大阪", "はい")
+    assert UserProfile.load("user:alice", store).get_preference_list("destinations") == ["京都", "大阪"]
+
+
+def test_user_id_in_the_request_body_is_ignored():
+    assert agent_options_from_request({"user_id": "alice"}, "s1") == {"user_id": "session:s1"}
+    assert agent_options_from_request({"user_id": "mallory"}, "s1", user_id="alice") == {"user_id": "user:alice"}
+    # セッションIDに利用者IDを指定しても、その利用者のプロファイルにはならない
+    assert agent_options_from_request({}, "alice")["user_id"] != agent_options_from_request({}, "s1", "alice")["user_id"]
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+import requests
+
+from tools import weather_tool
+from tools.weather_provider import CircuitBreaker, HTTPWeatherProvider, WeatherUnavailableError
+from tools.weather_tool import WeatherTool, weather_cache
+
+
+class FakeResponse:
+    def __init__(self, results):
+        self.results = results
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"results": self.results}
+
+
+class FakeSession:
+    """応答（辞書）または例外を順に返すHTTPセッション"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+
+def make_provider(*outcomes, failure_threshold=2, reset_timeout=0.05):
+    provider = HTTPWeatherProvider("http://weather.test", breaker=CircuitBreaker(failure_threshold, reset_timeout))
+    provider.session = FakeSession(*outcomes)
+    return provider
+
+
+def test_breaker_opens_after_consecutive_failures_and_half_opens_after_the_timeout():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    # 試行は1回だけ許可し、結果が出るまで他の呼び出しは止める
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_failures_fall_back_to_the_last_known_weather():
+    provider = make_provider(
+        {"東京": {"description": "晴れ", "temp": 25}}, requests.ConnectionError(), requests.ConnectionError()
+    )
+    assert provider.get_many(["東京"]) == {"東京": {"description": "晴れ", "temp": 25}}
+    assert provider.get_many(["東京"]) == {"東京": {"description": "晴れ", "temp": 25, "stale": True}}
+    with pytest.raises(WeatherUnavailableError):
+        provider.get_many(["大阪"])
+
+
+def test_an_open_breaker_skips_the_request():
+    provider = make_provider(requests.Timeout(), requests.Timeout(), failure_threshold=2, reset_timeout=60)
+    for _ in range(2):
+        with pytest.raises(WeatherUnavailableError):
+            provider.get_many(["東京"])
+    with pytest.raises(WeatherUnavailableError):
+        provider.get_many(["東京"])
+    assert provider.session.calls == 2
+
+
+@pytest.fixture
+def fake_provider(monkeypatch):
+    weather_cache.clear()
+    provider = make_provider(
+        {"東京": {"description": "晴れ", "temp": 25}},
+        requests.ConnectionError(),
+        {"東京": {"description": "雨", "temp": 20}},
+        reset_timeout=0,
+    )
+    monkeypatch.setattr(weather_tool, "_weather_provider", provider)
+    yield provider
+    weather_cache.clear()
+
+
+def test_stale_fallbacks_are_not_cached(fake_provider):
+    tool = WeatherTool(compact=True)
+    assert tool._run("東京") == "東京: 晴れ 25°C"
+    weather_cache.clear()
+    assert tool._run("東京") == "東京: 晴れ 25°C（直近の情報）"
+    # 直近の情報はキャッシュせず、次の呼び出しで取得し直す
+    assert tool._run("東京") == "東京: 雨 20°C"
+    assert tool._run("東京") == "東京: 雨 20°C"
+    assert fake_provider.session.calls == 3
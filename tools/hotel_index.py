@@ -0,0 +1,226 @@
+import argparse
+import bisect
+import csv
+import heapq
+import json
+import mmap
+import struct
+from array import array
+
+# インデックスファイルのヘッダ: マジック, ホテル数, 都市表(JSON)のバイト数, ホテル名領域のバイト数
+# （評価の索引を加えた形式。以前の形式のファイルはpython -m tools.hotel_indexで作り直す）
+_MAGIC = b"HOTELIX2"
+_HEADER = struct.Struct("<8sIII")
+
+
+def _align(offset):
+    """4バイト境界に揃える"""
+    return (offset + 3) & ~3
+
+
+def _better(ratings, i, j):
+    """評価の高い方（同じならカタログ内で先にある、つまり安い方）の位置を返す"""
+    if ratings[j] > ratings[i] or (ratings[j] == ratings[i] and j < i):
+        return j
+    return i
+
+
+class HotelIndex:
+    """都市ごとに価格順で並べた列指向のホテルカタログ
+
+    各列（価格・評価・ホテル名）は連続した配列で保持し、都市は配列内の範囲で表す。
+    評価の索引（都市ごとに、価格順の区間で最も評価の高いホテルを求めるセグメント木）も
+    作成時に計算しておく。save()で書き出したファイルはopen()でmmapして読み込むため、
+    複数のワーカープロセスで同じページを共有できる。
+    """
+
+    def __init__(self, city_ranges, prices, ratings, name_offsets, names, best=None, buffer=None):
+        self.city_ranges = city_ranges
+        self.prices = prices
+        self.ratings = ratings
+        self.name_offsets = name_offsets
+        self.names = names
+        # 都市の範囲 [start, end) のセグメント木は best[2 * start:2 * end] に置く
+        self.best = best if best is not None else self._build_best(city_ranges, ratings)
+        self._buffer = buffer
+
+    def __len__(self):
+        return len(self.prices)
+
+    @classmethod
+    def build(cls, records):
+        """{"city", "name", "price", "rating"} のレコード列からインデックスを作成する"""
+        by_city = {}
+        for record in records:
+            city = normalize_city(record["city"])
+            by_city.setdefault(city, []).append(
+                (int(record["price"]), float(record["rating"]), str(record["name"]))
+            )
+
+        city_ranges = {}
+        prices, ratings, name_offsets = array("i"), array("f"), array("I", [0])
+        names = bytearray()
+        for city, hotels in by_city.items():
+            hotels.sort(key=lambda hotel: hotel[0])
+            start = len(prices)
+            for price, rating, name in hotels:
+                prices.append(price)
+                ratings.append(rating)
+                names += name.encode("utf-8")
+                name_offsets.append(len(names))
+            city_ranges[city] = (start, len(prices))
+        return cls(city_ranges, prices, ratings, name_offsets, bytes(names))
+
+    @staticmethod
+    def _build_best(city_ranges, ratings):
+        """都市ごとに、評価の最も高いホテルの位置を持つセグメント木を作る"""
+        best = array("I", bytes(4 * 2 * len(ratings)))
+        for start, end in city_ranges.values():
+            size, base = end - start, 2 * start
+            for leaf in range(size):
+                best[base + size + leaf] = start + leaf
+            for node in range(size - 1, 0, -1):
+                best[base + node] = _better(ratings, best[base + 2 * node], best[base + 2 * node + 1])
+        return best
+
+    @classmethod
+    def from_jsonl(cls, path):
+        """JSON Lines形式のカタログを読み込む"""
+        with open(path, encoding="utf-8") as f:
+            return cls.build(json.loads(line) for line in f if line.strip())
+
+    @classmethod
+    def from_csv(cls, path):
+        """city,name,price,rating の列を持つCSV形式のカタログを読み込む"""
+        with open(path, encoding="utf-8", newline="") as f:
+            return cls.build(csv.DictReader(f))
+
+    @classmethod
+    def load(cls, path):
+        """拡張子に応じてカタログまたはインデックスファイルを読み込む"""
+        if path.endswith(".idx"):
+            return cls.open(path)
+        if path.endswith(".csv"):
+            return cls.from_csv(path)
+        return cls.from_jsonl(path)
+
+    def save(self, path):
+        """インデックスをmmap可能なバイナリ形式で書き出す"""
+        city_table = json.dumps(self.city_ranges, ensure_ascii=False).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(self), len(city_table), len(self.names)))
+            f.write(city_table)
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(bytes(self.prices))
+            f.write(bytes(self.ratings))
+            f.write(bytes(self.name_offsets))
+            f.write(bytes(self.best))
+            f.write(self.names)
+
+    @classmethod
+    def open(cls, path):
+        """save()で書き出したインデックスをコピーせずにmmapで開く"""
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(buffer)
+        magic, count, city_table_len, names_len = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError(
+                f"{path}はこの版のホテルインデックスファイルではありません。python -m tools.hotel_indexで作り直してください。"
+            )
+
+        offset = _HEADER.size
+        city_ranges = {
+            city: tuple(bounds)
+            for city, bounds in json.loads(bytes(view[offset:offset + city_table_len]).decode("utf-8")).items()
+        }
+        offset = _align(offset + city_table_len)
+        prices = view[offset:offset + 4 * count].cast("i")
+        offset += 4 * count
+        ratings = view[offset:offset + 4 * count].cast("f")
+        offset += 4 * count
+        name_offsets = view[offset:offset + 4 * (count + 1)].cast("I")
+        offset += 4 * (count + 1)
+        best = view[offset:offset + 4 * 2 * count].cast("I")
+        offset += 4 * 2 * count
+        names = view[offset:offset + names_len]
+        return cls(city_ranges, prices, ratings, name_offsets, names, best=best, buffer=buffer)
+
+    def has_city(self, city):
+        return normalize_city(city) in self.city_ranges
+
+    def search(self, city, budget, limit=5, offset=0):
+        """予算内のホテルを評価の高い順に返す
+
+        都市が見つからなければNone、見つかれば (該当件数, [(名前, 価格, 評価), ...]) を返す。
+        予算の境界は二分探索で求め、評価の高い順の取り出しは評価の索引で行う。1ページの計算量は
+        都市のホテル数mに対して O(log m + (offset + limit)·log m) で、予算内のホテル数にはよらない
+        （ページが深いほど読み飛ばす分だけ増える）。
+        """
+        bounds = self.city_ranges.get(normalize_city(city))
+        if bounds is None:
+            return None
+        start, end = bounds
+        stop = bisect.bisect_right(self.prices, budget, start, end)
+        wanted = min(offset + limit, stop - start)
+        top = []
+        # 区間ごとの最も評価の高いホテルをヒープで管理し、取り出したホテルの前後の区間を追加していく
+        ratings = self.ratings
+        heap = []
+        self._push_best(heap, start, end, start, stop)
+        while heap and len(top) < wanted:
+            _, i, lo, hi = heapq.heappop(heap)
+            top.append(i)
+            self._push_best(heap, start, end, lo, i)
+            self._push_best(heap, start, end, i + 1, hi)
+        prices = self.prices
+        return stop - start, [(self._name(i), prices[i], round(ratings[i], 1)) for i in top[offset:]]
+
+    def _push_best(self, heap, start, end, lo, hi):
+        """区間 [lo, hi) で最も評価の高いホテルをヒープに加える（空の区間は何もしない）"""
+        if lo >= hi:
+            return
+        i = self._best_in(start, end, lo, hi)
+        heapq.heappush(heap, (-self.ratings[i], i, lo, hi))
+
+    def _best_in(self, start, end, lo, hi):
+        """都市の範囲 [start, end) の中の区間 [lo, hi) で最も評価の高いホテルの位置（O(log m)）"""
+        best, ratings = self.best, self.ratings
+        size, base = end - start, 2 * start
+        left, right = lo - start + size, hi - start + size
+        found = None
+        while left < right:
+            if left & 1:
+                candidate = best[base + left]
+                found = candidate if found is None else _better(ratings, found, candidate)
+                left += 1
+            if right & 1:
+                right -= 1
+                candidate = best[base + right]
+                found = candidate if found is None else _better(ratings, found, candidate)
+            left >>= 1
+            right >>= 1
+        return found
+
+    def _name(self, i):
+        return bytes(self.names[self.name_offsets[i]:self.name_offsets[i + 1]]).decode("utf-8")
+
+
+def normalize_city(city):
+    """都市名を検索キーに正規化する（英語名は小文字にそろえる）"""
+    return city.strip().lower()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ホテルカタログからmmap可能なインデックスファイルを作成する")
+    parser.add_argument("source", help="カタログファイル（.jsonl または .csv）")
+    parser.add_argument("output", help="出力するインデックスファイル（.idx）")
+    args = parser.parse_args()
+
+    index = HotelIndex.load(args.source)
+    index.save(args.output)
+    print(f"{len(index)}件のホテル（{len(index.city_ranges)}都市）を{args.output}に書き出しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,180 @@
+import os
+import threading
+from typing import List, NamedTuple
+
 from langchain.tools import BaseTool
 
+from tools.hotel_index import HotelIndex, normalize_city
+from utils.prefetch import atake_prefetched, take_prefetched
+from utils.tool_cache import ToolResultCache
+
+# ホテルカタログ（HOTEL_CATALOG_PATHで .jsonl / .csv / .idx を指定できる）
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "hotels.jsonl")
+
+# 1回の検索で返すホテル数（簡潔な表形式ではtop_k件ずつ返す）
+PAGE_SIZE = 5
+
+# 検索結果をキャッシュする（都市・予算・ページ・ページの件数単位）
+hotel_cache = ToolResultCache(ttl=1800, negative_ttl=300)
+
+
+class HotelRecord(NamedTuple):
+    """検索結果のホテル1件"""
+    name: str
+    price: int
+    rating: float
+
+
+class HotelSearchResult(NamedTuple):
+    """ホテル検索の結果（hotelsは評価順のページ内のホテル）"""
+    city: str
+    budget: int
+    page: int
+    page_size: int
+    total: int
+    hotels: List[HotelRecord]
+
+
+_hotel_index = None
+_hotel_index_lock = threading.Lock()
+
+def get_hotel_index():
+    """ホテルカタログのインデックスを取得する（初回のみ読み込む）"""
+    global _hotel_index
+    with _hotel_index_lock:
+        if _hotel_index is None:
+            _hotel_index = HotelIndex.load(os.getenv("HOTEL_CATALOG_PATH", DEFAULT_CATALOG_PATH))
+        return _hotel_index
+
 class HotelTool(BaseTool):
     name: str = "hotel_tool"
-    description: str = "旅行先のホテル情報を検索するツール。引数として「都市名,予算(円)」の形式で指定してください。例: 東京,15000"
+    description: str = "旅行先のホテル情報を検索するツール。引数として「都市名,予算(円)」の形式で指定してください。続きを見る場合は「都市名,予算(円),ページ番号」と指定します。例: 東京,15000"
+    # Trueなら結果を文章ではなく、top_k件ずつの簡潔な表形式で返す（エージェントが読む場合。利用者に見せる応答は文章で返す）
+    compact: bool = False
+    top_k: int = 3
     
     def _run(self, query: str) -> str:
         """指定された都市と予算に基づいてホテル情報を検索する"""
         try:
-            # クエリを都市名と予算に分割
-            parts = query.split(',')
-            if len(parts) != 2:
-                return "クエリの形式が正しくありません。「都市名,予算」の形式で指定してください。例: 東京,15000"
-            
-            city = parts[0].strip()
-            try:
-                budget = int(parts[1].strip())
-            except ValueError:
-                return "予算は数値で指定してください。例: 東京,15000"
-            
-            # デモ用のホテルデータ
-            hotel_data = {
-                "東京": [
-                    {"name": "ホテルメトロポリタン", "price": 20000, "rating": 4.5},
-                    {"name": "相鉄フレッサイン", "price": 12000, "rating": 4.0},
-                    {"name": "アパホテル", "price": 8000, "rating": 3.5},
-                ],
-                "大阪": [
-                    {"name": "ホテルグランヴィア大阪", "price": 18000, "rating": 4.5},
-                    {"name": "ホテルモントレ", "price": 13000, "rating": 4.2},
-                    {"name": "ドーミーイン", "price": 9000, "rating": 3.8},
-                ],
-                "京都": [
-                    {"name": "京都センチュリーホテル", "price": 22000, "rating": 4.7},
-                    {"name": "三井ガーデンホテル", "price": 15000, "rating": 4.3},
-                    {"name": "イビススタイルズ", "price": 10000, "rating": 3.9},
-                ],
-                # 英語の都市名も対応
-                "tokyo": [
-                    {"name": "Hotel Metropolitan", "price": 20000, "rating": 4.5},
-                    {"name": "Sotetsu Fresa Inn", "price": 12000, "rating": 4.0},
-                    {"name": "APA Hotel", "price": 8000, "rating": 3.5},
-                ],
-                "osaka": [
-                    {"name": "Hotel Granvia Osaka", "price": 18000, "rating": 4.5},
-                    {"name": "Hotel Monterey", "price": 13000, "rating": 4.2},
-                    {"name": "Dormy Inn", "price": 9000, "rating": 3.8},
-                ],
-                "kyoto": [
-                    {"name": "Kyoto Century Hotel", "price": 22000, "rating": 4.7},
-                    {"name": "Mitsui Garden Hotel", "price": 15000, "rating": 4.3},
-                    {"name": "Ibis Styles", "price": 10000, "rating": 3.9},
-                ],
-            }
-            
-            city_lower = city.lower()
-            if city_lower in hotel_data or city in hotel_data:
-                hotels = hotel_data.get(city, hotel_data.get(city_lower))
-                # 予算内のホテルをフィルタリング
-                affordable_hotels = [h for h in hotels if h["price"] <= budget]
-                
-                if not affordable_hotels:
-                    return f"{city}で予算{budget}円以内のホテルは見つかりませんでした。予算を増やしてみてください。"
-                
-                # 結果をフォーマット
-                result = f"{city}で予算{budget}円以内のホテル情報:\n\n"
-                for hotel in affordable_hotels:
-                    result += f"- {hotel['name']}: {hotel['price']}円/泊, 評価: {hotel['rating']}/5.0\n"
-                
-                return result
+            parsed = self._parse_query(query)
+            if isinstance(parsed, str):
+                return parsed
+            city, budget, page = parsed
+            size = self.page_size
+            key = (normalize_city(city), budget, page, size)
+            # このターンで先読みした検索はその結果を使う
+            prefetched = take_prefetched("hotel", [key])
+            if key in prefetched:
+                result = prefetched[key]
             else:
-                return f"{city}のホテル情報は見つかりませんでした。"
-        
+                result = hotel_cache.get_or_compute(key, lambda: self._fetch(city, budget, page, size))
+            return self._render(self._records(city, budget, page, size, result), city)
+        except Exception as e:
+            return f"エラーが発生しました: {str(e)}"
+    
+    async def _arun(self, query: str) -> str:
+        """指定された都市と予算に基づいてホテル情報を非同期で検索する"""
+        try:
+            parsed = self._parse_query(query)
+            if isinstance(parsed, str):
+                return parsed
+            city, budget, page = parsed
+            size = self.page_size
+            key = (normalize_city(city), budget, page, size)
+            prefetched = await atake_prefetched("hotel", [key])
+            if key in prefetched:
+                result = prefetched[key]
+            else:
+                result = await hotel_cache.aget_or_compute(key, lambda: self._afetch(city, budget, page, size))
+            return self._render(self._records(city, budget, page, size, result), city)
         except Exception as e:
             return f"エラーが発生しました: {str(e)}"
     
-    def _arun(self, query: str):
-        """非同期実行用（今回は使用しない）"""
-        raise NotImplementedError("HotelToolは非同期実行をサポートしていません。")
\ No newline at end of file
+    @property
+    def page_size(self):
+        """1ページのホテル数（簡潔な表形式ではtop_k件）"""
+        return self.top_k if self.compact else PAGE_SIZE
+    
+    def prefetch(self, cities, budget, turn):
+        """都市ごとの予算内のホテル検索（1ページ目）をturn（utils.prefetch.TurnPrefetch）で先に始める"""
+        size = self.page_size
+        for city in cities:
+            key = (normalize_city(city), budget, 1, size)
+            turn.submit("hotel", key, lambda key=key, city=city: hotel_cache.get_or_compute(
+                key, lambda: self._fetch(city, budget, 1, size)
+            ))
+    
+    def _parse_query(self, query):
+        """クエリを都市名・予算・ページ番号に分割する（形式が不正な場合はエラーメッセージを返す）"""
+        parts = query.split(',')
+        if len(parts) not in (2, 3):
+            return "クエリの形式が正しくありません。「都市名,予算」の形式で指定してください。例: 東京,15000"
+        
+        city = parts[0].strip()
+        try:
+            budget = int(parts[1].strip())
+        except ValueError:
+            return "予算は数値で指定してください。例: 東京,15000"
+        
+        page = 1
+        if len(parts) == 3:
+            try:
+                page = max(1, int(parts[2].strip()))
+            except ValueError:
+                return "ページ番号は数値で指定してください。例: 東京,15000,2"
+        return city, budget, page
+    
+    def _fetch(self, city, budget, page, size=PAGE_SIZE):
+        """予算内のホテルを評価順に検索する（都市が見つからなければNone）"""
+        return get_hotel_index().search(city, budget, limit=size, offset=(page - 1) * size)
+    
+    async def _afetch(self, city, budget, page, size=PAGE_SIZE):
+        """予算内のホテルを評価順に非同期で検索する（都市が見つからなければNone）"""
+        # インデックスはメモリ上（mmap）の参照のみでブロックしないため、同期処理をそのまま呼び出す
+        return self._fetch(city, budget, page, size)
+    
+    def _records(self, city, budget, page, size, result):
+        """検索結果を型付きのレコードにする（都市が見つからなければNone）"""
+        if result is None:
+            return None
+        total, hotels = result
+        return HotelSearchResult(city, budget, page, size, total, [HotelRecord(*hotel) for hotel in hotels])
+    
+    def _render(self, result, city):
+        if result is None:
+            return f"{city}のホテル情報は見つかりませんでした。"
+        return self._format_compact(result) if self.compact else self._format(result)
+    
+    def _format_compact(self, result):
+        """予算内のホテルをtop_k件ずつの表にする（1行1件: 名前|円/泊|評価）"""
+        city, budget, page, size, total, hotels = result
+        if not hotels:
+            return f"{city} 予算{budget}円以内: 該当{total}件（{page}ページ目なし）"
+        first = (page - 1) * size + 1
+        last = first + len(hotels) - 1
+        lines = [f"{city} 予算{budget}円以内 評価順 {first}〜{last}/{total}件（名前|円/泊|評価）"]
+        lines += [f"{hotel.name}|{hotel.price}|{hotel.rating}" for hotel in hotels]
+        if last < total:
+            lines.append(f"ほか{total - last}件（{last + 1}件目からの続き: {city},{budget},{page + 1}）")
+        return "\n".join(lines)
+    
+    def _format(self, result):
+        """予算内のホテルを応答文にする"""
+        city, budget, page, size, total, hotels = result
+        if not total:
+            return f"{city}で予算{budget}円以内のホテルは見つかりませんでした。予算を増やしてみてください。"
+        if not hotels:
+            return f"{city}で予算{budget}円以内のホテルは全{total}件です。{page}ページ目はありません。"
+        
+        # 結果をフォーマット
+        result = f"{city}で予算{budget}円以内のホテル情報（評価順）:\n\n"
+        for name, price, rating in hotels:
+            result += f"- {name}: {price}円/泊, 評価: {rating}/5.0\n"
+        
+        first = (page - 1) * size + 1
+        if total > size:
+            result += f"\n全{total}件中{first}〜{first + len(hotels) - 1}件目を表示しています。"
+            if first + len(hotels) - 1 < total:
+                result += f"続きは「{city},{budget},{page + 1}」で検索できます。\n"
+        
+        return result
\ No newline at end of file
@@ -0,0 +1,79 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from tools.weather_provider import WEATHER_DATA
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    """HTTPWeatherProviderのAPIを模したローカルの天気サーバー"""
+
+    # キープアライブを有効にする（ヘッダと本文の分割送信で遅延しないようNagleを無効化）
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/weather":
+            self._send(404, {"error": "not found"})
+            return
+
+        server = self.server
+        with server.stats_lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(503, {"error": "unavailable"})
+            return
+
+        cities = [city for city in parse_qs(url.query).get("cities", [""])[0].split(",") if city]
+        results = {city: WEATHER_DATA.get(city, WEATHER_DATA.get(city.lower())) for city in cities}
+        self._send(200, {"results": results})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, error_rate=0.0):
+    """スタブサーバーをバックグラウンドで起動する（port=0なら空いているポートを使う）"""
+    server = ThreadingHTTPServer((host, port), StubWeatherHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.request_count = 0
+    server.stats_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="オフライン検証用のスタブ天気サーバー")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答までの遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503を返す確率")
+    args = parser.parse_args()
+
+    server = start_stub_server(port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"スタブ天気サーバーを起動しました: http://127.0.0.1:{server.server_port}/weather?cities=東京,大阪")
+    print("WEATHER_API_URL にこのURL（/weatherを除く）を設定するとWeatherToolから利用できます。")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
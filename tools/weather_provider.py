@@ -0,0 +1,160 @@
+import asyncio
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# デモ用の天気データ
+WEATHER_DATA = {
+    "東京": {"description": "晴れ", "temp": 25},
+    "大阪": {"description": "曇り", "temp": 23},
+    "京都": {"description": "小雨", "temp": 22},
+    "札幌": {"description": "雪", "temp": 5},
+    "那覇": {"description": "晴れ", "temp": 30},
+    # 英語の都市名も対応
+    "tokyo": {"description": "晴れ", "temp": 25},
+    "osaka": {"description": "曇り", "temp": 23},
+    "kyoto": {"description": "小雨", "temp": 22},
+    "sapporo": {"description": "雪", "temp": 5},
+    "naha": {"description": "晴れ", "temp": 30},
+}
+
+
+class WeatherUnavailableError(Exception):
+    """天気情報の取得元が利用できず、代わりのデータもない場合の例外"""
+
+
+class DemoWeatherProvider:
+    """デモ用の天気データを返す取得元"""
+
+    def get_many(self, cities):
+        """都市ごとの天気データの辞書を返す（見つからない都市はNone）"""
+        return {city: WEATHER_DATA.get(city, WEATHER_DATA.get(city.lower())) for city in cities}
+
+    async def aget_many(self, cities):
+        # メモリ上の参照のみでブロックしないため、同期処理をそのまま呼び出す
+        return self.get_many(cities)
+
+
+class CircuitBreaker:
+    """連続して失敗した取得元への呼び出しを一定時間止める"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def allow(self):
+        """呼び出してよいかを返す（open中でもreset_timeout経過後は試行を1回許可する）"""
+        with self._lock:
+            state = self._state()
+            if state == "half_open":
+                # 試行中は他の呼び出しを止めておく
+                self.opened_at = time.monotonic()
+            return state != "open"
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+
+class HTTPWeatherProvider:
+    """HTTPの天気APIから取得する取得元
+
+    キープアライブの接続プールを使い、複数都市はまとめて1回のリクエストで取得する。
+    API: GET {base_url}/weather?cities=東京,大阪
+         -> {"results": {"東京": {"description": "晴れ", "temp": 25}, "大阪": null}}
+    取得に失敗した場合や回路が開いている場合は、直近に取得できたデータで代替する。
+    """
+
+    def __init__(self, base_url, api_key=None, connect_timeout=2.0, read_timeout=5.0,
+                 pool_size=20, max_batch=20, breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_batch = max_batch
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._last_known = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, cities):
+        """都市ごとの天気データの辞書を返す（見つからない都市はNone）"""
+        results = {}
+        cities = list(cities)
+        for i in range(0, len(cities), self.max_batch):
+            results.update(self._fetch_batch(cities[i:i + self.max_batch]))
+        return results
+
+    async def aget_many(self, cities):
+        """都市ごとの天気データを非同期で取得する（通信は別スレッドで行う）"""
+        return await asyncio.to_thread(self.get_many, cities)
+
+    def _fetch_batch(self, cities):
+        if self.breaker.allow():
+            try:
+                params = {"cities": ",".join(cities)}
+                if self.api_key:
+                    params["appid"] = self.api_key
+                response = self.session.get(f"{self.base_url}/weather", params=params, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()["results"]
+            except (requests.RequestException, ValueError, KeyError):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                results = {city: data.get(city) for city in cities}
+                with self._lock:
+                    self._last_known.update({city: value for city, value in results.items() if value})
+                return results
+        return self._fallback(cities)
+
+    def _fallback(self, cities):
+        """直近に取得できたデータで代替する（ない場合は例外）"""
+        with self._lock:
+            missing = [city for city in cities if city not in self._last_known]
+            if missing:
+                raise WeatherUnavailableError(f"{', '.join(missing)}の天気情報を取得できませんでした。")
+            return {city: dict(self._last_known[city], stale=True) for city in cities}
+
+
+def create_weather_provider():
+    """環境変数の設定に従って天気情報の取得元を作成する
+
+    WEATHER_API_URLが設定されていればHTTPの取得元、なければデモデータを使う。
+    """
+    base_url = os.getenv("WEATHER_API_URL")
+    if not base_url:
+        return DemoWeatherProvider()
+    return HTTPWeatherProvider(
+        base_url,
+        api_key=os.getenv("WEATHER_API_KEY"),
+        connect_timeout=float(os.getenv("WEATHER_CONNECT_TIMEOUT", "2")),
+        read_timeout=float(os.getenv("WEATHER_READ_TIMEOUT", "5"))
+    )
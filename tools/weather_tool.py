@@ -1,44 +1,132 @@
-import requests
+import re
+import threading
+from typing import NamedTuple, Optional
+
 from langchain.tools import BaseTool
 
+from tools.weather_provider import WeatherUnavailableError, create_weather_provider
+from utils.prefetch import atake_prefetched, take_prefetched
+from utils.tool_cache import ToolResultCache
+
+# 天気は数分単位で変わるため短めのTTLにする（見つからなかった都市は1分だけ保持）
+# 取得元の障害時に代わりに返す直近の情報（stale）は保持せず、次の呼び出しで取得し直す
+weather_cache = ToolResultCache(ttl=300, negative_ttl=60, ttl_for=lambda weather: 0 if weather.get("stale") else None)
+
+
+class WeatherRecord(NamedTuple):
+    """都市1つの天気（見つからなかった都市はdescriptionとtempがNone）"""
+    city: str
+    description: Optional[str]
+    temp: Optional[float]
+    stale: bool = False
+
+
+_weather_provider = None
+_weather_provider_lock = threading.Lock()
+
+def get_weather_provider():
+    """天気情報の取得元を取得する（初回のみ作成する）"""
+    global _weather_provider
+    with _weather_provider_lock:
+        if _weather_provider is None:
+            _weather_provider = create_weather_provider()
+        return _weather_provider
+
 class WeatherTool(BaseTool):
     name: str = "weather_tool"
-    description: str = "旅行先の天気情報を取得するツール。引数として都市名を指定してください。"
+    description: str = "旅行先の天気情報を取得するツール。引数として都市名を指定してください。複数の都市は「東京,大阪」のようにカンマ区切りで指定できます。"
+    # Trueなら結果を文章ではなく1都市1行の簡潔な形式で返す（エージェントが読む場合）
+    compact: bool = False
     
     def _run(self, city: str) -> str:
         """指定された都市の天気情報を取得する"""
-        # 注: 実際のアプリケーションでは、OpenWeatherMapなどの実際のAPIを使用することをお勧めします
-        # ここではデモのために簡易的な実装をしています
-        
-        # 実際のAPIを使用する場合のコード例:
-        # api_key = os.getenv("WEATHER_API_KEY")
-        # url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-        # response = requests.get(url)
-        # data = response.json()
-        # return f"{city}の現在の天気: {data['weather'][0]['description']}, 気温: {data['main']['temp']}°C"
-        
-        # デモ用の簡易実装
-        weather_data = {
-            "東京": {"description": "晴れ", "temp": 25},
-            "大阪": {"description": "曇り", "temp": 23},
-            "京都": {"description": "小雨", "temp": 22},
-            "札幌": {"description": "雪", "temp": 5},
-            "那覇": {"description": "晴れ", "temp": 30},
-            # 英語の都市名も対応
-            "tokyo": {"description": "晴れ", "temp": 25},
-            "osaka": {"description": "曇り", "temp": 23},
-            "kyoto": {"description": "小雨", "temp": 22},
-            "sapporo": {"description": "雪", "temp": 5},
-            "naha": {"description": "晴れ", "temp": 30},
-        }
-        
-        city_lower = city.lower()
-        if city_lower in weather_data or city in weather_data:
-            data = weather_data.get(city, weather_data.get(city_lower))
-            return f"{city}の現在の天気: {data['description']}, 気温: {data['temp']}°C"
-        else:
-            return f"{city}の天気情報は見つかりませんでした。"
-    
-    def _arun(self, city: str):
-        """非同期実行用（今回は使用しない）"""
-        raise NotImplementedError("WeatherToolは非同期実行をサポートしていません。")
\ No newline at end of file
+        cities = self._parse_cities(city)
+        if not cities:
+            return "都市名を指定してください。"
+        # このターンで先読みした都市はその結果を使い、残りだけを取得する
+        data = take_prefetched("weather", list(cities))
+        missing = [key for key in cities if key not in data]
+        try:
+            if missing:
+                data.update(weather_cache.get_or_compute_many(
+                    missing, lambda keys: self._fetch([cities[key] for key in keys], keys)
+                ))
+        except WeatherUnavailableError as e:
+            return f"現在天気情報を取得できません: {e}"
+        return self._render(self._records(cities, data))
+    
+    async def _arun(self, city: str) -> str:
+        """指定された都市の天気情報を非同期で取得する"""
+        cities = self._parse_cities(city)
+        if not cities:
+            return "都市名を指定してください。"
+        data = await atake_prefetched("weather", list(cities))
+        missing = [key for key in cities if key not in data]
+        try:
+            if missing:
+                data.update(await weather_cache.aget_or_compute_many(
+                    missing, lambda keys: self._afetch([cities[key] for key in keys], keys)
+                ))
+        except WeatherUnavailableError as e:
+            return f"現在天気情報を取得できません: {e}"
+        return self._render(self._records(cities, data))
+    
+    def prefetch(self, cities, turn):
+        """都市ごとの天気の取得をturn（utils.prefetch.TurnPrefetch）で先に始める"""
+        for key, city in self._parse_cities(",".join(cities)).items():
+            turn.submit("weather", key, lambda key=key, city=city: weather_cache.get_or_compute_many(
+                [key], lambda keys: self._fetch([city], keys)
+            )[key])
+    
+    def _parse_cities(self, query):
+        """クエリを都市名に分割し、キャッシュキーと都市名の辞書にする"""
+        names = [name.strip() for name in re.split(r"[,、，]", query) if name.strip()]
+        return {name.lower(): name for name in names}
+    
+    def _fetch(self, cities, keys):
+        """複数都市の天気データを1回のリクエストでまとめて取得する"""
+        results = get_weather_provider().get_many(cities)
+        return dict(zip(keys, (results.get(city) for city in cities)))
+    
+    async def _afetch(self, cities, keys):
+        """複数都市の天気データを非同期でまとめて取得する"""
+        results = await get_weather_provider().aget_many(cities)
+        return dict(zip(keys, (results.get(city) for city in cities)))
+    
+    def _records(self, cities, data):
+        """天気データを都市ごとの型付きのレコードにする"""
+        records = []
+        for key, city in cities.items():
+            weather = data.get(key)
+            if weather is None:
+                records.append(WeatherRecord(city, None, None))
+            else:
+                records.append(WeatherRecord(city, weather["description"], weather["temp"], bool(weather.get("stale"))))
+        return records
+    
+    def _render(self, records):
+        return self._format_compact(records) if self.compact else self._format(records)
+    
+    def _format_compact(self, records):
+        """天気を1都市1行（都市: 天気 気温）にする"""
+        lines = []
+        for record in records:
+            if record.description is None:
+                lines.append(f"{record.city}: 情報なし")
+            else:
+                lines.append(f"{record.city}: {record.description} {record.temp}°C" + ("（直近の情報）" if record.stale else ""))
+        return "\n".join(lines)
+    
+    def _format(self, records):
+        """天気データを応答文にする"""
+        lines = []
+        for record in records:
+            city = record.city
+            if record.description is None:
+                lines.append(f"{city}の天気情報は見つかりませんでした。")
+            else:
+                line = f"{city}の現在の天気: {record.description}, 気温: {record.temp}°C"
+                if record.stale:
+                    line += "（最新の情報を取得できなかったため、直近の情報を表示しています）"
+                lines.append(line)
+        return "\n".join(lines)
\ No newline at end of file
@@ -0,0 +1,132 @@
+import hashlib
+import threading
+
+from utils.metrics import REGISTRY
+from utils.tracing import trace_event
+
+ARTIFACTS = REGISTRY.counter(
+    "travel_agent_artifact_total", "共有の成果物を再利用した（reused）・作り直した（computed）回数", ("artifact", "outcome")
+)
+
+
+def _digest(value):
+    return hashlib.sha256(repr(value).encode("utf-8")).hexdigest()[:16]
+
+
+class Artifact:
+    """1つの成果物（値、バージョン、作成時の入力の指紋）"""
+
+    __slots__ = ("value", "version", "inputs", "digest")
+
+    def __init__(self, value, version, inputs, digest):
+        self.value = value
+        self.version = version
+        self.inputs = inputs
+        self.digest = digest
+
+
+class ArtifactStore:
+    """依存関係を追跡する、バージョン付きの成果物の保存先
+
+    dependenciesは成果物ごとの入力の名前で、入力は他の成果物か、facts()が返す事実（旅行先、予算など）。
+    成果物は保存時の入力（成果物はバージョン、事実は値のハッシュ）とともに記録し、入力が変わったもの、
+    または入力の成果物が古くなったものだけを古い（stale）と判定する。同じ値を保存してもバージョンは
+    上がらないため、作り直した結果が変わらなければ後続の成果物は古くならない。
+    エージェントへの依頼文（task）から作る成果物は、依頼文のハッシュも入力として記録する。依頼文を
+    指定して確認した場合は、事実が同じでも依頼文が変われば古いと判定する（後続の成果物はバージョンで判定する）。
+    従来の辞書と同じくstore[name]で値を読み書きできる（未作成なら空文字列）。
+    """
+
+    def __init__(self, dependencies, facts):
+        self.dependencies = dependencies
+        self.facts = facts
+        self._artifacts = {}
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name):
+        artifact = self._artifacts.get(name)
+        return artifact.value if artifact is not None else ""
+
+    def __setitem__(self, name, value):
+        self.put(name, value)
+
+    def version(self, name):
+        """成果物のバージョン（未作成なら0）"""
+        artifact = self._artifacts.get(name)
+        return artifact.version if artifact is not None else 0
+
+    def inputs(self, name, facts=None, task=None):
+        """成果物の現在の入力の指紋（taskを指定すると依頼文のハッシュを含める）"""
+        facts = self.facts() if facts is None else facts
+        with self._lock:
+            fingerprint = {
+                dep: self.version(dep) if dep in self.dependencies else _digest(facts.get(dep))
+                for dep in self.dependencies.get(name, ())
+            }
+        if task is not None:
+            fingerprint["task"] = _digest(task)
+        return fingerprint
+
+    def changed_inputs(self, name, facts=None, task=None):
+        """保存時から変わった入力と、古くなった入力の成果物の名前（未作成ならNone）
+
+        まだ作成されていない入力の成果物（coordinatorモードのホテル候補など）は変わっていないものとみなす。
+        taskを指定すると、保存時と依頼文が違う場合に"task"を含める。
+        """
+        facts = self.facts() if facts is None else facts
+        with self._lock:
+            artifact = self._artifacts.get(name)
+            if artifact is None:
+                return None
+            current = self.inputs(name, facts, task)
+            changed = [
+                dep for dep in self.dependencies.get(name, ())
+                if current[dep] != artifact.inputs.get(dep)
+                or (dep in self._artifacts and not self.is_fresh(dep, facts))
+            ]
+            if task is not None and current["task"] != artifact.inputs.get("task"):
+                changed.append("task")
+            return changed
+
+    def is_fresh(self, name, facts=None, task=None):
+        """成果物が作成済みで、入力（taskを指定すると依頼文も）が変わっていないか"""
+        return self.changed_inputs(name, facts, task) == []
+
+    def stale(self):
+        """古くなった（または未作成の）成果物の名前"""
+        facts = self.facts()
+        return [name for name in self.dependencies if not self.is_fresh(name, facts)]
+
+    def reuse(self, name, callbacks=None, task=None):
+        """最新の成果物を再利用する（再利用したらTrue）。再利用はメトリクスとトレースに記録する"""
+        with self._lock:
+            if not self.is_fresh(name, task=task):
+                return False
+            version = self.version(name)
+        ARTIFACTS.inc(artifact=name, outcome="reused")
+        trace_event("artifact", {"artifact": name, "outcome": "reused", "version": version}, callbacks)
+        return True
+
+    def put(self, name, value, inputs=None, callbacks=None, task=None):
+        """成果物を保存する（inputsは作成に使った入力の指紋。省略すると現在の入力とtaskの指紋）"""
+        digest = _digest(value)
+        with self._lock:
+            changed = self.changed_inputs(name, task=task)
+            inputs = self.inputs(name, task=task) if inputs is None else inputs
+            previous = self._artifacts.get(name)
+            version = previous.version if previous is not None and previous.digest == digest else self.version(name) + 1
+            self._artifacts[name] = Artifact(value, version, inputs, digest)
+        ARTIFACTS.inc(artifact=name, outcome="computed")
+        trace_event("artifact", {
+            "artifact": name, "outcome": "computed", "version": version,
+            "changed": changed if changed is not None else "new"
+        }, callbacks)
+
+    def get_or_compute(self, name, compute, callbacks=None, task=None):
+        """最新の成果物があれば再利用し、なければcompute()で作って保存する（taskは成果物を作る依頼文）"""
+        if self.reuse(name, callbacks, task):
+            return self[name]
+        inputs = self.inputs(name, task=task)
+        value = compute()
+        self.put(name, value, inputs, callbacks, task)
+        return value
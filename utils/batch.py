@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from agents.factory import resolve_agent_type
+from utils.llm_scheduler import llm_priority
+from utils.session_manager import agent_options_from_request
+from utils.tracing import trace_request
+
+
+class _BatchCall:
+    """1件の要求の実行状態（呼び出し元が待つのをやめた要求は、会話を記録しない）
+
+    実行側は会話を記録する前にcommit()を、呼び出し元はタイムアウトしたらabandon()を呼ぶ。
+    先に呼ばれた方が勝ち、後の呼び出しはFalseを返す。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def commit(self):
+        return self._settle("committed")
+
+    def abandon(self):
+        return self._settle("abandoned")
+
+    def _settle(self, state):
+        with self._lock:
+            if self._state is None:
+                self._state = state
+            return self._state == state
+
+
+class ChatBatchRunner:
+    """複数のチャット要求を、同時実行数の上限のもとで並列に処理する
+
+    同じsession_idの要求は入力順に1つずつ処理し、異なるセッションの要求は並列に処理する。
+    同時実行数の上限はこのインスタンスで処理するすべてのバッチで共有する。
+    LLM呼び出しはbatchの優先度で行い、対話のチャットの呼び出しを先に通す。
+    1件あたりのタイムアウトは実行の枠を得てから数える。タイムアウトした要求の会話は記録しない。
+    """
+
+    def __init__(self, session_manager, max_concurrency=4, item_timeout=120):
+        self.session_manager = session_manager
+        self.max_concurrency = max_concurrency
+        self.item_timeout = item_timeout
+        # エージェントの実行中の数を制限する（タイムアウトで待つのをやめた実行も、終わるまで枠を使う）
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._calls = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="chat-batch")
+        self._async_slots = {}
+
+    def run(self, items, max_concurrency=None, item_timeout=None, user_id=None):
+        """要求の一覧を処理し、入力順の結果の一覧を返す
+
+        各要求は {"session_id", "agent_type", "message"}（memory_modeも指定できる）。
+        user_idは認証済みの利用者ID（要求に含まれるuser_idは使わない）。
+        結果は {"index", "session_id", "agent_type", "response"} で、失敗した要求は
+        responseの代わりにerrorを持つ。
+        """
+        concurrency = min(max_concurrency or self.max_concurrency, self.max_concurrency)
+        timeout = item_timeout or self.item_timeout
+        results, groups = self._prepare(items, user_id)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(groups)))) as drivers:
+            for group in groups.values():
+                drivers.submit(self._run_group, group, results, timeout)
+        return results
+
+    async def arun(self, items, max_concurrency=None, item_timeout=None, user_id=None):
+        """runの非同期版（タイムアウトした要求は取り消す）"""
+        concurrency = min(max_concurrency or self.max_concurrency, self.max_concurrency)
+        timeout = item_timeout or self.item_timeout
+        results, groups = self._prepare(items, user_id)
+        slots = self._async_slots_for_loop()
+        drivers = asyncio.Semaphore(concurrency)
+
+        async def run_group(group):
+            async with drivers:
+                for position, (index, item) in enumerate(group):
+                    start = time.perf_counter()
+                    async with slots:
+                        call = _BatchCall()
+                        task = asyncio.ensure_future(self._acall(item, call))
+                        done, _ = await asyncio.wait({task}, timeout=timeout)
+                        timed_out = not done and call.abandon()
+                        if timed_out:
+                            task.cancel()
+                        elif not done:
+                            # 会話の記録を始めていれば、記録が終わるまで待つ
+                            await asyncio.wait({task})
+                    results[index]["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                    if timed_out:
+                        results[index]["error"] = f"{timeout}秒以内に応答が得られませんでした。"
+                        self._skip_rest(group[position + 1:], results)
+                        break
+                    self._store(results[index], task)
+
+        await asyncio.gather(*(run_group(group) for group in groups.values()))
+        return results
+
+    def _prepare(self, items, user_id=None):
+        """結果の入れ物を用意し、要求をsession_idごとに入力順のまま分ける（エージェントの設定もここで決める）"""
+        results = []
+        groups = OrderedDict()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get("message"), str):
+                results.append({"index": index, "error": "messageを含むオブジェクトを指定してください。"})
+                continue
+            session_id = item.get("session_id") or "default"
+            agent_type = resolve_agent_type(item.get("agent_type", "advanced"))
+            result = {"index": index, "session_id": session_id, "agent_type": agent_type}
+            results.append(result)
+            try:
+                options = agent_options_from_request(item, session_id, user_id)
+            except ValueError as error:
+                result["error"] = str(error)
+                continue
+            groups.setdefault(session_id, []).append(
+                (index, dict(item, session_id=session_id, agent_type=agent_type, agent_options=options))
+            )
+        return results, groups
+
+    def _run_group(self, group, results, timeout):
+        """1つのセッションの要求を順に処理する"""
+        for position, (index, item) in enumerate(group):
+            start = time.perf_counter()
+            # 実行の枠を得てから投入し、タイムアウトは枠を得た時点から数える（枠を待つ時間は含めない）
+            # 枠は_callが終了時に返す
+            self._slots.acquire()
+            call = _BatchCall()
+            try:
+                future = self._calls.submit(self._call, item, call)
+            except BaseException:
+                self._slots.release()
+                raise
+            done, _ = wait([future], timeout=timeout)
+            timed_out = not done and call.abandon()
+            if timed_out and future.cancel():
+                # まだ始まっていなかった実行は取り消し、枠を返す
+                self._slots.release()
+            results[index]["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if timed_out:
+                results[index]["error"] = f"{timeout}秒以内に応答が得られませんでした。"
+                # 実行中の要求を追い越さないよう、同じセッションの残りは実行しない
+                self._skip_rest(group[position + 1:], results)
+                return
+            # タイムアウト後でも会話の記録を始めていた要求は、完了を待って応答を返す
+            self._store(results[index], future)
+
+    def _call(self, item, call):
+        try:
+            session = self._session_for(item)
+            with session.lock, llm_priority("batch"), trace_request(
+                "chat_batch", agent_type=item["agent_type"], session_id=item["session_id"]
+            ) as trace:
+                response = session.begin_turn().get_response(item["message"], callbacks=[trace.handler])
+                if call.commit():
+                    self.session_manager.record_turn(session, item["message"], response)
+                else:
+                    # 呼び出し元はタイムアウトとして返したため、このターンはなかったことにする
+                    session.discard_turn()
+            return response
+        finally:
+            self._slots.release()
+
+    async def _acall(self, item, call):
+        session = self._session_for(item)
+        async with session.async_lock:
+            with llm_priority("batch"), trace_request("chat_batch", agent_type=item["agent_type"], session_id=item["session_id"]) as trace:
+                agent = await session.abegin_turn()
+                response = await agent.aget_response(item["message"], callbacks=[trace.handler])
+                if call.commit():
+                    await self.session_manager.arecord_turn(session, item["message"], response)
+                else:
+                    await asyncio.to_thread(session.discard_turn)
+        return response
+
+    def _session_for(self, item):
+        return self.session_manager.get_session(item["session_id"], item["agent_type"], item["agent_options"])
+
+    def _async_slots_for_loop(self):
+        """イベントループごとの同時実行数の枠を返す"""
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = self._async_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        return slots
+
+    @staticmethod
+    def _skip_rest(rest, results):
+        for index, _ in rest:
+            results[index]["error"] = "同じセッションの前の要求がタイムアウトしたため実行しませんでした。"
+
+    @staticmethod
+    def _store(result, future):
+        """完了した実行の応答または例外を結果に記録する"""
+        error = future.exception()
+        if error is None:
+            result["response"] = future.result()
+        else:
+            result["error"] = str(error) or error.__class__.__name__
@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 def load_api_key():
@@ -29,82 +30,206 @@ def format_travel_plan(destination, duration, activities, accommodations, transp
 
 # 既存のコードに以下を追加
 
-from langchain.memory import ConversationBufferMemory, ConversationSummaryMemory, CombinedMemory
+def estimate_tokens(text):
+    """テキストのおおよそのトークン数を見積もる（日本語は1文字、英数字は4文字で約1トークン）"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
 
-def create_memory():
-    """会話履歴を管理するためのメモリを作成する"""
-    # 直近の会話を保存するバッファメモリ
-    buffer_memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        return_messages=True,
-        input_key="input"
-    )
-    
-    # 長い会話を要約するサマリーメモリ
-    summary_memory = ConversationSummaryMemory(
-        memory_key="conversation_summary",
-        return_messages=False,
-        input_key="input"
-    )
-    
-    # 両方のメモリを組み合わせる
-    memory = CombinedMemory(memories=[buffer_memory, summary_memory])
-    
-    return memory
+# 見出しとみなす行（「【宿泊】」「1日目」「## 観光」「宿泊:」など）
+_HEADING = re.compile(r"^(?:#+\s*|【.+】|(?:第)?\d+日目|.{1,30}[:：]$)")
+# 行頭の箇条書き・見出しの記号と強調の記号
+_MARKUP = re.compile(r"^(?:#+|[-*・•]|\d+[.)．])\s+|\*\*|__")
+
+def compact_text(text, max_tokens):
+    """エージェント間で渡すテキストを、おおよそmax_tokensトークンに収める
+
+    見出しや箇条書きの記号、空行、重複する行を除く。それでも上限を超える場合は、見出しで区切った
+    各節の先頭の行から順に（すべての節から1行ずつ、次に2行目を…）選び、どの節の要点も残るように切り詰める。
+    """
+    if not text:
+        return text
+    sections, seen = [], set()
+    for raw in text.splitlines():
+        line = _MARKUP.sub("", raw.strip()).strip()
+        if not line or line in seen:
+            continue
+        seen.add(line)
+        if not sections or _HEADING.match(raw.strip()):
+            sections.append([])
+        sections[-1].append(line)
+    lines = [line for section in sections for line in section]
+    if estimate_tokens("\n".join(lines)) <= max_tokens:
+        return "\n".join(lines)
+
+    # 省略した旨の注記の分を残しておく
+    remaining = max_tokens - 10
+    selected = [[] for _ in sections]
+    open_sections = set(range(len(sections)))
+    depth = 0
+    while open_sections:
+        for index in sorted(open_sections):
+            section = sections[index]
+            if depth >= len(section):
+                open_sections.discard(index)
+                continue
+            line = section[depth]
+            cost = estimate_tokens(line) + 1
+            if cost > remaining:
+                # 見出ししか選ばれていない節は、収まらない行も残りを節の数で分けた長さまで残す
+                share = remaining // len(open_sections)
+                if len(selected[index]) <= 1 and share > 20:
+                    while estimate_tokens(line) + 2 > share:
+                        line = line[:max(1, int(len(line) * share / (estimate_tokens(line) + 2)) - 1)]
+                    selected[index].append(line + "…")
+                    remaining -= estimate_tokens(line) + 2
+                # この節はここで打ち切る
+                open_sections.discard(index)
+                continue
+            selected[index].append(line)
+            remaining -= cost
+        depth += 1
+    kept = [line for section in selected for line in section]
+    return "\n".join(kept + ["（長さの上限のため一部を省略）"])
+
+# create_memoryで指定できるメモリモード
+MEMORY_MODES = ("buffer", "summary_buffer")
+
+def create_memory(llm=None, mode=None, memory_key="chat_history", max_token_limit=None):
+    """会話履歴を管理するためのメモリを作成する
+
+    mode（既定は環境変数MEMORY_MODE）:
+      buffer         会話全体を保持する
+      summary_buffer 直近の会話をトークン上限まで保持し、古い会話は要約に畳み込む
+    """
+    from utils.memory import BackgroundSummaryBufferMemory, TokenCountingBufferMemory
+    
+    mode = mode or os.getenv("MEMORY_MODE", "buffer")
+    if mode == "buffer":
+        return TokenCountingBufferMemory(memory_key=memory_key, return_messages=True)
+    if mode == "summary_buffer":
+        if llm is None:
+            raise ValueError("summary_bufferモードには要約用のLLMが必要です。")
+        return BackgroundSummaryBufferMemory(
+            llm=llm,
+            memory_key=memory_key,
+            return_messages=True,
+            max_token_limit=max_token_limit or int(os.getenv("MEMORY_MAX_TOKENS", "1500"))
+        )
+    raise ValueError(f"不明なメモリモード'{mode}'です。{' または '.join(MEMORY_MODES)} を指定してください。")
 
 # 既存のコードに以下を追加
 
 class UserProfile:
-    def __init__(self):
+    # インスタンスごとの__dict__を持たないようにしてメモリを節約する
+    # 同じ利用者のセッション間で共有するため、弱参照を許す（agents.factoryを参照）
+    __slots__ = ("preferences", "past_trips", "profile_id", "store", "_summary", "_dirty", "__weakref__")
+    
+    # 複数の値を持つ好み（挿入順を保つ集合としてdictのキーで保持する）
+    COLLECTION_KEYS = ("destinations", "activities")
+    
+    def __init__(self, profile_id=None, store=None):
         self.preferences = {
-            "destinations": [],  # 好きな旅行先
-            "activities": [],    # 好きなアクティビティ
+            "destinations": {},  # 好きな旅行先
+            "activities": {},    # 好きなアクティビティ
             "budget": None,      # 予算
             "travel_style": None # 旅行スタイル（例: 贅沢、節約、アドベンチャー）
         }
-        self.past_trips = []     # 過去の旅行
+        self.past_trips = []     # 過去の旅行（目的地, 日付, メモ）のタプル
+        self.profile_id = profile_id
+        self.store = store
+        self._summary = None
+        self._dirty = False
+    
+    @classmethod
+    def load(cls, profile_id, store):
+        """保存されたプロファイルを読み込む（保存されていなければ空のプロファイルを作る）"""
+        profile = cls(profile_id, store)
+        data = store.load(profile_id)
+        if data:
+            profile._restore(data)
+        return profile
     
     def update_preference(self, key, value):
         """ユーザーの好みを更新する"""
         if key in self.preferences:
-            if isinstance(self.preferences[key], list):
-                if value not in self.preferences[key]:
-                    self.preferences[key].append(value)
+            if key in self.COLLECTION_KEYS:
+                if value in self.preferences[key]:
+                    return
+                self.preferences[key][value] = None
+            elif self.preferences[key] == value:
+                return
             else:
                 self.preferences[key] = value
+            self._changed()
     
     def add_past_trip(self, destination, date, notes=None):
         """過去の旅行を追加する"""
-        self.past_trips.append({
-            "destination": destination,
-            "date": date,
-            "notes": notes
-        })
+        self.past_trips.append((destination, date, notes))
+        self._changed()
+    
+    def get_preference_list(self, key):
+        """複数の値を持つ好みを追加順のリストで取得する"""
+        return list(self.preferences[key])
     
     def get_profile_summary(self):
-        """ユーザープロファイルの要約を取得する"""
-        summary = "ユーザープロファイル:\n"
+        """ユーザープロファイルの要約を取得する（変更されるまでは前回の結果を返す）"""
+        if self._summary is None:
+            self._summary = self._build_summary()
+        return self._summary
+    
+    def to_dict(self):
+        """保存用の辞書に変換する"""
+        return {
+            "destinations": list(self.preferences["destinations"]),
+            "activities": list(self.preferences["activities"]),
+            "budget": self.preferences["budget"],
+            "travel_style": self.preferences["travel_style"],
+            "past_trips": [list(trip) for trip in self.past_trips]
+        }
+    
+    def _restore(self, data):
+        """保存用の辞書から復元する"""
+        for key in self.COLLECTION_KEYS:
+            self.preferences[key] = dict.fromkeys(data.get(key, []))
+        self.preferences["budget"] = data.get("budget")
+        self.preferences["travel_style"] = data.get("travel_style")
+        self.past_trips = [tuple(trip) for trip in data.get("past_trips", [])]
+        self._summary = None
+    
+    def save(self):
+        """前回の保存以降に変更があれば保存先に保存する（ターンの終わりにまとめて呼ぶ）"""
+        if not self._dirty or self.store is None or self.profile_id is None:
+            return
+        self._dirty = False
+        self.store.save(self.profile_id, self.to_dict())
+    
+    def _changed(self):
+        """要約のキャッシュを破棄し、保存が必要なことを記録する（保存はsaveで行う）"""
+        self._summary = None
+        self._dirty = True
+    
+    def _build_summary(self):
+        """ユーザープロファイルの要約を作成する"""
+        lines = ["ユーザープロファイル:", "【好み】"]
         
         # 好みの情報
-        summary += "【好み】\n"
-        for key, value in self.preferences.items():
-            if value:
-                if key == "destinations":
-                    summary += f"好きな旅行先: {', '.join(value)}\n" if value else ""
-                elif key == "activities":
-                    summary += f"好きなアクティビティ: {', '.join(value)}\n" if value else ""
-                elif key == "budget":
-                    summary += f"予算: {value}円\n"
-                elif key == "travel_style":
-                    summary += f"旅行スタイル: {value}\n"
+        destinations = self.preferences["destinations"]
+        activities = self.preferences["activities"]
+        if destinations:
+            lines.append(f"好きな旅行先: {', '.join(destinations)}")
+        if activities:
+            lines.append(f"好きなアクティビティ: {', '.join(activities)}")
+        if self.preferences["budget"]:
+            lines.append(f"予算: {self.preferences['budget']}円")
+        if self.preferences["travel_style"]:
+            lines.append(f"旅行スタイル: {self.preferences['travel_style']}")
         
         # 過去の旅行
         if self.past_trips:
-            summary += "\n【過去の旅行】\n"
-            for trip in self.past_trips:
-                summary += f"- {trip['destination']} ({trip['date']})"
-                if trip['notes']:
-                    summary += f": {trip['notes']}"
-                summary += "\n"
+            lines.append("\n【過去の旅行】")
+            for destination, date, notes in self.past_trips:
+                lines.append(f"- {destination} ({date}): {notes}" if notes else f"- {destination} ({date})")
         
-        return summary
\ No newline at end of file
+        return "\n".join(lines) + "\n"
\ No newline at end of file
@@ -0,0 +1,189 @@
+import os
+import re
+import threading
+
+from utils.metrics import REGISTRY
+from utils.preference_extractor import get_preference_extractor
+
+# 単純な問い合わせを表す語
+WEATHER_WORDS = ("天気", "気温", "気候", "降水", "雨", "晴れ")
+HOTEL_WORDS = ("ホテル", "宿泊", "宿", "旅館")
+# 現在の天気を尋ねていることを示す表現（「今月」「今年」などの期間は含めない）
+_CURRENT_WEATHER = re.compile(r"天気|今日|本日|現在|いま|今(?![月年週度後回])")
+# 気候や傾向を尋ねる表現（現在の天気では答えられない。例: 東京は雨が多いですか, 6月の京都の天気）
+_CLIMATE = re.compile(r"多い|少ない|気候|季節|時期|シーズン|例年|平年|平均|梅雨|(?:\d+|[一二三四五六七八九十]+)月|いつ|よく")
+# エージェントに任せるべき、計画や比較を求める表現（「1泊」は1泊あたりの予算の表現にも使うため含めない）
+_COMPLEX = re.compile(r"プラン|計画|日程|旅程|スケジュール|比較|観光|行き方|交通|予算分析|(?<!\d)(?:[2-9]|\d{2,})泊|\d+日間|なぜ|どちら")
+
+# 金額（例: 15000円, 1万5千円, 1.5万円, 2万円以内）
+_AMOUNT = re.compile(r'(?:(\d+(?:\.\d+)?)万)?(?:(\d+)千)?(\d+)?円')
+
+FAST_PATH = REGISTRY.counter(
+    "travel_agent_fast_path_total", "単純な問い合わせの振り分け結果", ("intent", "outcome")
+)
+
+
+# 金額が1泊あたりであることを示す前後の表現（例: 1泊15000円, 一泊あたり1万円, 15000円/泊）
+_NIGHTLY_BEFORE = re.compile(r'(?:[1一]泊|一晩)(?:あたり)?(?:の)?(?:予算|料金|宿泊費)?[はがで]?\s*$')
+_NIGHTLY_AFTER = re.compile(r'\s*(?:/|／)\s*泊')
+# 金額が旅行全体の予算であることを示す前の表現（例: 予算10万円, 総額8万円）
+_TRIP_TOTAL = re.compile(r'(?:予算|総額|合計|全部で|トータル)[はがをで]?\s*$')
+
+
+def _yen(match):
+    """金額の一致を円にする（金額でなければNone）"""
+    man, sen, yen = match.groups()
+    if not (man or sen or yen):
+        return None
+    return int(float(man or 0) * 10000 + int(sen or 0) * 1000 + int(yen or 0)) or None
+
+
+def parse_yen(text):
+    """テキスト中の最初の金額を円で返す（見つからなければNone）"""
+    for match in _AMOUNT.finditer(text):
+        amount = _yen(match)
+        if amount:
+            return amount
+    return None
+
+
+def parse_nightly_yen(text):
+    """テキスト中の1泊あたりの金額を円で返す（見つからなければNone）
+
+    「1泊15000円」「15000円/泊」のように1泊あたりと明示された金額と、「15000円以内のホテル」のように
+    何の金額か示されていない金額を1泊あたりとみなす。「予算10万円」のような旅行全体の予算は使わない。
+    """
+    for match in _AMOUNT.finditer(text):
+        amount = _yen(match)
+        if not amount:
+            continue
+        before = text[:match.start()]
+        if _NIGHTLY_BEFORE.search(before) or _NIGHTLY_AFTER.match(text, match.end()):
+            return amount
+        if not _TRIP_TOTAL.search(before):
+            return amount
+    return None
+
+
+class Intent:
+    """振り分けの判定結果"""
+
+    __slots__ = ("kind", "city", "budget", "confidence")
+
+    def __init__(self, kind, city, budget=None, confidence=1.0):
+        self.kind = kind
+        self.city = city
+        self.budget = budget
+        self.confidence = confidence
+
+    @property
+    def tool_input(self):
+        """ツールに渡す引数"""
+        if self.kind == "hotel":
+            return f"{self.city},{self.budget}"
+        return self.city
+
+
+class IntentRouter:
+    """天気やホテルだけを尋ねる単純な問い合わせを見分け、ReActを経ずにツールで直接答える
+
+    判定の確信度がthreshold未満の入力は、通常どおりエージェントに任せる。
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+
+    def classify(self, text):
+        """入力の意図と確信度を判定する（単純な問い合わせでなければNone）"""
+        weather = any(word in text for word in WEATHER_WORDS)
+        hotel = any(word in text for word in HOTEL_WORDS)
+        if weather == hotel:
+            # どちらでもない、または両方を尋ねる入力はエージェントに任せる
+            return None
+
+        destinations = get_preference_extractor().extract(text)["destinations"]
+        if not destinations:
+            return None
+
+        confidence = 1.0
+        if len(destinations) > 1:
+            confidence -= 0.5
+        confidence -= 0.3 * len(_COMPLEX.findall(text))
+        if len(text) > 80:
+            confidence -= 0.5
+        elif len(text) > 40:
+            confidence -= 0.2
+
+        if weather:
+            if not _CURRENT_WEATHER.search(text) or _CLIMATE.search(text):
+                # 天気ツールは現在の天気しか返さないため、気候や傾向の質問はエージェントに任せる
+                confidence -= 1.0
+            return Intent("weather", destinations[0], confidence=confidence)
+
+        budget = parse_nightly_yen(text)
+        if budget is None:
+            # 1泊あたりの予算が分からなければエージェントに任せる
+            # （プロファイルの予算は旅行全体の予算のため、1泊の上限には使えない）
+            confidence -= 0.5
+        return Intent("hotel", destinations[0], budget=budget, confidence=confidence)
+
+    def route(self, text):
+        """ツールで直接答えられる場合に判定結果を返す（そうでなければNone）"""
+        intent, answerable = self._decide(text)
+        if intent is None:
+            return None
+        FAST_PATH.inc(intent=intent.kind, outcome="answered" if answerable else "fallback")
+        return intent if answerable else None
+
+    def match(self, text):
+        """routeと同じ判定を、振り分けの結果を記録せずに行う（エージェントを動かす前の確認用）"""
+        intent, answerable = self._decide(text)
+        return intent if answerable else None
+
+    def _decide(self, text):
+        """判定結果と、ツールで直接答えるかを返す"""
+        if self.threshold > 1:
+            return None, False
+        intent = self.classify(text)
+        if intent is None:
+            return None, False
+        return intent, intent.confidence >= self.threshold and (intent.kind != "hotel" or bool(intent.budget))
+
+    def answer(self, intent, tools, memory, user_input, callbacks=None):
+        """ツールを直接呼び出して応答を作り、会話履歴にも記録する
+
+        toolsは意図（weather, hotel）とツールの辞書。
+        """
+        output = tools[intent.kind].run(intent.tool_input, callbacks=callbacks)
+        response = self.render(intent, output)
+        memory.save_context({"input": user_input}, {"output": response})
+        return response
+
+    async def aanswer(self, intent, tools, memory, user_input, callbacks=None):
+        """answerの非同期版"""
+        output = await tools[intent.kind].arun(intent.tool_input, callbacks=callbacks)
+        response = self.render(intent, output)
+        await memory.asave_context({"input": user_input}, {"output": response})
+        return response
+
+    def render(self, intent, output):
+        """ツールの結果を応答文にする"""
+        if intent.kind == "weather":
+            return f"{output.rstrip()}\n\n{intent.city}のホテル探しや旅行プランの作成もお手伝いできます。"
+        return f"{output.rstrip()}\n\n詳しい旅行プランが必要な場合は、日程やご希望をお知らせください。"
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_intent_router():
+    """全エージェントで共有する振り分けを取得する
+
+    INTENT_ROUTER_THRESHOLD: ツールで直接答える確信度の下限（既定0.8、1より大きくすると無効）
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = IntentRouter(threshold=float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.8")))
+        return _router
@@ -0,0 +1,620 @@
+import asyncio
+import itertools
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream, generate_from_stream
+from langchain_core.messages import SystemMessage
+from pydantic import PrivateAttr
+
+from utils.helpers import estimate_tokens
+from utils.llm_cache import InMemoryLLMCache, SQLiteLLMCache, TieredLLMCache
+from utils.llm_scheduler import get_llm_scheduler
+from utils.metrics import REGISTRY
+
+DEFAULT_MODEL = "claude-3-haiku-20240307"
+DEFAULT_TEMPERATURE = 0.7
+
+# 再試行する応答のステータス（タイムアウト、競合、レート制限、サーバーエラー、過負荷）
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+# ヘッジの遅延をパーセンタイルで決めるのに必要な計測数
+HEDGE_MIN_SAMPLES = 20
+# スケジューラーに申告する出力トークン数の見積もり（使用量は応答が返ってから実際の値に置き換える）
+EXPECTED_OUTPUT_TOKENS = 512
+# 1回の呼び出しで同時に実行しうる試行の数（最初の試行とヘッジ）
+ATTEMPTS_PER_CALL = 2
+
+LLM_RETRIES = REGISTRY.counter("travel_agent_llm_retries_total", "LLM呼び出しの再試行の回数", ("reason",))
+LLM_HEDGES = REGISTRY.counter(
+    "travel_agent_llm_hedges_total", "LLM呼び出しのヘッジ（重複リクエスト）の回数", ("outcome",)
+)
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+_attempt_executor = None
+_attempt_executor_lock = threading.Lock()
+
+
+def attempt_workers(scheduler=None):
+    """試行を実行するスレッドの数
+
+    LLM_ATTEMPT_WORKERS: 同時に実行する試行（ヘッジを含む）の上限（既定32）。スケジューラーがあれば、
+    その同時実行数×ATTEMPTS_PER_CALLを下回らないようにする（試行がスレッドの空き待ちにならないように）。
+    """
+    workers = int(os.getenv("LLM_ATTEMPT_WORKERS", "32"))
+    if scheduler is not None:
+        workers = max(workers, scheduler.max_concurrency * ATTEMPTS_PER_CALL)
+    return workers
+
+
+def _get_attempt_executor(scheduler=None):
+    """同期のLLM呼び出しの試行を実行するスレッドプールを取得する（初回のみ作成する）"""
+    global _attempt_executor
+    with _attempt_executor_lock:
+        if _attempt_executor is None:
+            _attempt_executor = ThreadPoolExecutor(max_workers=attempt_workers(scheduler), thread_name_prefix="llm-attempt")
+        return _attempt_executor
+
+
+def create_llm_cache(mode=None):
+    """環境変数の設定に従ってLLM応答キャッシュを作成する
+
+    LLM_CACHE: memory, sqlite, tiered, off（既定）のいずれか
+    キャッシュは同じプロンプトに同じ応答を返すため、温度が0より大きい（応答を毎回サンプリングする）モデルでは
+    応答の多様性が失われる。温度0で使う場合や、同じ応答でよいと分かっている場合だけ有効にする。
+    """
+    mode = mode or os.getenv("LLM_CACHE", "off")
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+    if mode == "off":
+        return None
+    if mode == "memory":
+        return InMemoryLLMCache(max_entries=max_entries)
+
+    disk = SQLiteLLMCache(
+        os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite"),
+        max_entries=int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", "100000")),
+        ttl=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    )
+    if mode == "sqlite":
+        return disk
+    if mode == "tiered":
+        return TieredLLMCache(InMemoryLLMCache(max_entries=max_entries), disk)
+    raise ValueError(f"不明なLLM_CACHEの設定'{mode}'です。memory, sqlite, tiered, off のいずれかを指定してください。")
+
+
+def get_llm_cache():
+    """全エージェントで共有するLLM応答キャッシュを取得する"""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = create_llm_cache() or False
+        return _llm_cache or None
+
+
+class ChatModelWrapper(BaseChatModel):
+    """別のチャットモデルへの呼び出しを包み、前後に処理を加えるための基底クラス
+
+    キャッシュのキーや設定はinnerのものをそのまま使う（包んでもキャッシュ済みの応答を使える）。
+    """
+
+    inner: BaseChatModel
+
+    @property
+    def _llm_type(self):
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self):
+        return self.inner._identifying_params
+
+    def _get_llm_string(self, stop=None, **kwargs):
+        return self.inner._get_llm_string(stop=stop, **kwargs)
+
+    def get_num_tokens_from_messages(self, messages, tools=None):
+        return self.inner.get_num_tokens_from_messages(messages, tools=tools)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+# Anthropicのプロンプトキャッシュの指定（5分間保持される）
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _with_cache_control(message):
+    """メッセージの最後のブロックにcache_controlを付けた複製を返す"""
+    if isinstance(message.content, str):
+        content = [{"type": "text", "text": message.content, "cache_control": CACHE_CONTROL}]
+    else:
+        content = [dict(block) if isinstance(block, dict) else {"type": "text", "text": block} for block in message.content]
+        if not content:
+            return message
+        content[-1]["cache_control"] = CACHE_CONTROL
+    return message.model_copy(update={"content": content})
+
+
+def mark_prompt_cache(messages):
+    """プロンプトの変わらない接頭辞の終わりにキャッシュの区切りを付ける
+
+    区切りは、システムメッセージ（指示とツールの説明）の末尾と、最後の入力の直前
+    （会話履歴の末尾。ReActの反復の間は変わらない）の2か所。
+    """
+    marked = list(messages)
+    breakpoints = set()
+    if marked and isinstance(marked[0], SystemMessage):
+        breakpoints.add(0)
+    if len(marked) > 2:
+        breakpoints.add(len(marked) - 2)
+    for index in breakpoints:
+        marked[index] = _with_cache_control(marked[index])
+    return marked
+
+
+class PromptCachingChatModel(ChatModelWrapper):
+    """プロンプトの変わらない接頭辞にAnthropicのcache_controlを付けてから呼び出す
+
+    エージェントのプロンプトは システム（指示とツールの説明）→ 会話履歴 → 入力とReActの途中経過
+    の順に並んでいるため、ReActの反復ごとにシステムと会話履歴の分はキャッシュから読まれる。
+    """
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return super()._generate(mark_prompt_cache(messages), stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await super()._agenerate(mark_prompt_cache(messages), stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.inner._stream(mark_prompt_cache(messages), stop=stop, run_manager=run_manager, **kwargs)
+
+    def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.inner._astream(mark_prompt_cache(messages), stop=stop, run_manager=run_manager, **kwargs)
+
+
+class LLMCallTimeout(TimeoutError):
+    """LLM呼び出しが期限までに応答しなかったことを表す"""
+
+
+def retry_reason(error):
+    """再試行すべきエラーなら理由（メトリクスのラベル）を、そうでなければNoneを返す"""
+    if isinstance(error, TimeoutError) or type(error).__name__ == "APITimeoutError":
+        return "timeout"
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return str(status) if status in RETRYABLE_STATUS else None
+    if isinstance(error, ConnectionError) or type(error).__name__ == "APIConnectionError":
+        return "connection"
+    return None
+
+
+def _retry_after(error):
+    """エラー応答のRetry-Afterヘッダーの秒数（なければNone）"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientChatModel(ChatModelWrapper):
+    """LLM呼び出しに期限、再試行、ヘッジ（重複リクエスト）を加える
+
+    - 呼び出し全体の期限timeoutと、試行ごとの最初の応答（ストリーミング時は最初のチャンク）までの期限attempt_timeout
+    - 再試行できるエラー（タイムアウト、接続エラー、429・5xx・529）はジッター付きの指数バックオフで最大max_retries回再試行する
+    - hedgeを有効にすると、最初の応答が直近の応答時間のp95（hedge_delayで固定も可）を過ぎても来ないとき
+      同じリクエストをもう1つ送り、先に応答した方を採用して遅い方は取り消す
+
+    ストリーミング時は採用した試行のトークンだけをコールバックに流す。トークンを流し始めた後の失敗は再試行しない。
+    同期の試行は共有のスレッドプール（attempt_workers()）で実行し、試行ごとの期限とヘッジの遅延は
+    スレッドが試行を始めた時点から数える（スレッドの空き待ちの時間は呼び出し全体の期限にだけ含める）。
+    innerがストリーミングに対応していればストリーミングしない呼び出しでもチャンク単位で受け取るため、
+    取り消した試行は次のチャンクで接続を閉じる。まだ始まっていない試行は取り消してスレッドを使わない。
+    schedulerを指定すると、ヘッジもスケジューラーの同時実行数と1分あたりのトークン数の枠を使う
+    （枠がすぐに空いていなければヘッジを送らない）。
+    """
+
+    streaming: bool = False
+    timeout: float = 60.0
+    attempt_timeout: float = 20.0
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    hedge: bool = False
+    hedge_delay: Optional[float] = None
+    hedge_min_delay: float = 0.2
+    hedge_percentile: float = 95.0
+    scheduler: Any = None
+    _latencies: Any = PrivateAttr(default_factory=lambda: deque(maxlen=200))
+    _latencies_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        deadline = time.monotonic() + self.timeout
+        state = {"streamed": False}
+        for attempt in itertools.count(1):
+            try:
+                return self._call_once(messages, stop, run_manager, kwargs, deadline, state)
+            except Exception as error:
+                delay = self._retry_delay(error, attempt, deadline, state)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        deadline = time.monotonic() + self.timeout
+        state = {"streamed": False}
+        for attempt in itertools.count(1):
+            try:
+                return await self._acall_once(messages, stop, run_manager, kwargs, deadline, state)
+            except Exception as error:
+                delay = self._retry_delay(error, attempt, deadline, state)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    def _retry_delay(self, error, attempt, deadline, state):
+        """再試行までの待ち時間を返す（再試行しない場合はNone）"""
+        reason = retry_reason(error)
+        if reason is None or attempt > self.max_retries or state["streamed"]:
+            return None
+        delay = random.uniform(0.5, 1.0) * min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        delay = max(delay, min(_retry_after(error) or 0.0, self.backoff_max))
+        if time.monotonic() + delay >= deadline:
+            return None
+        LLM_RETRIES.inc(reason=reason)
+        return delay
+
+    def _current_hedge_delay(self):
+        """ヘッジを送るまでの待ち時間（ヘッジしない場合はNone）"""
+        if not self.hedge:
+            return None
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        with self._latencies_lock:
+            samples = sorted(self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return max(self.hedge_min_delay, samples[index])
+
+    def _won(self, index, started):
+        """最初に応答した試行を記録する"""
+        with self._latencies_lock:
+            self._latencies.append(time.monotonic() - started)
+        if index > 0:
+            LLM_HEDGES.inc(outcome="won")
+
+    def _call_once(self, messages, stop, run_manager, kwargs, deadline, state):
+        """1回の試行（とそのヘッジ）を実行し、先に応答した方の結果を返す"""
+        events = queue.Queue()
+        cancels = []
+        futures = []
+        # いずれかの試行が応答を返し始めたら、まだ始まっていない試行は送らない
+        answered = threading.Event()
+
+        def launch(ticket=None):
+            cancel = threading.Event()
+            cancels.append(cancel)
+            future = _get_attempt_executor(self.scheduler).submit(
+                self._run_attempt, len(cancels) - 1, cancel, answered, events, messages, stop, kwargs, ticket
+            )
+            futures.append((future, ticket))
+
+        called = time.monotonic()
+        hedge_delay = self._current_hedge_delay()
+        # 最初の試行が始まるまでは呼び出し全体の期限まで待ち、始まった時点から試行の期限とヘッジの遅延を数える
+        hedge_at = None
+        first_deadline = deadline
+        starts = {}
+        winner = None
+        chunks = []
+        failures = 0
+        error = None
+        launch()
+        try:
+            while True:
+                wake = deadline if winner is not None else min(first_deadline, hedge_at or first_deadline)
+                try:
+                    index, kind, payload = events.get(timeout=max(0.0, wake - time.monotonic()))
+                except queue.Empty:
+                    if winner is None and hedge_at is not None and time.monotonic() >= hedge_at:
+                        hedge_at = None
+                        admitted, ticket = self._admit_hedge(messages)
+                        if admitted:
+                            launch(ticket)
+                        continue
+                    raise LLMCallTimeout(f"LLMの応答が期限（{wake - called:.1f}秒）までに得られませんでした。")
+                if kind == "started":
+                    starts[index] = payload
+                    if index == 0:
+                        first_deadline = min(payload + self.attempt_timeout, deadline)
+                        if hedge_delay is not None:
+                            hedge_at = payload + hedge_delay
+                    continue
+                if winner is None:
+                    if kind in ("error", "skipped"):
+                        # 送らなかった試行も失敗として数える（すべての試行が失敗したら最後のエラーを送出する）
+                        failures += 1
+                        error = payload if kind == "error" else error
+                        if failures == len(cancels):
+                            raise error
+                        continue
+                    winner = index
+                    self._won(index, starts[index])
+                    for i, cancel in enumerate(cancels):
+                        if i != winner:
+                            cancel.set()
+                    if kind == "result":
+                        return payload
+                if index != winner:
+                    continue
+                if kind == "chunk":
+                    chunks.append(payload)
+                    if run_manager is not None and payload.text:
+                        state["streamed"] = True
+                        run_manager.on_llm_new_token(payload.text, chunk=payload)
+                elif kind == "done":
+                    return generate_from_stream(iter(chunks))
+                else:
+                    raise payload
+        finally:
+            for cancel in cancels:
+                cancel.set()
+            for future, ticket in futures:
+                if future.cancel():
+                    # スレッドの空きを待っていた試行は実行せず、ヘッジの枠を返す
+                    self._release_hedge(ticket)
+
+    def _admit_hedge(self, messages):
+        """ヘッジを送れるか判定し、(送るか, スケジューラーの枠) を返す"""
+        ticket = None
+        if self.scheduler is not None:
+            ticket = self.scheduler.try_acquire(_message_tokens(messages) + EXPECTED_OUTPUT_TOKENS)
+            if ticket is None:
+                LLM_HEDGES.inc(outcome="skipped")
+                return False, None
+        LLM_HEDGES.inc(outcome="launched")
+        return True, ticket
+
+    def _release_hedge(self, ticket, result=None):
+        """ヘッジに割り当てたスケジューラーの枠を返す"""
+        if ticket is not None:
+            self.scheduler.release(ticket, used_tokens=_used_tokens(result) if result is not None else None)
+
+    def _run_attempt(self, index, cancel, answered, events, messages, stop, kwargs, ticket=None):
+        """スレッドプールで1回分のリクエストを送り、結果をeventsに入れる（cancelされたら読み込みをやめる）
+
+        応答を返し始めたらansweredを立てる。始める前にほかの試行が応答していれば、リクエストを送らない。
+        """
+        result = None
+        try:
+            if cancel.is_set() or answered.is_set():
+                events.put((index, "skipped", None))
+                return
+            events.put((index, "started", time.monotonic()))
+            if not self.streaming and not _can_stream(self.inner):
+                result = self.inner._generate(messages, stop=stop, **kwargs)
+                answered.set()
+                events.put((index, "result", result))
+                return
+            chunks = []
+            stream = self.inner._stream(messages, stop=stop, **kwargs)
+            try:
+                for chunk in stream:
+                    if cancel.is_set():
+                        return
+                    answered.set()
+                    if self.streaming:
+                        events.put((index, "chunk", chunk))
+                    else:
+                        chunks.append(chunk)
+            finally:
+                stream.close()
+            if self.streaming:
+                events.put((index, "done", None))
+            else:
+                result = generate_from_stream(iter(chunks))
+                events.put((index, "result", result))
+        except Exception as error:
+            events.put((index, "error", error))
+        finally:
+            self._release_hedge(ticket, result)
+
+    async def _acall_once(self, messages, stop, run_manager, kwargs, deadline, state):
+        """_call_onceの非同期版（遅い方の試行はタスクごと取り消す）"""
+        events = asyncio.Queue()
+        tasks = []
+
+        def launch(ticket=None):
+            tasks.append(asyncio.ensure_future(self._arun_attempt(len(tasks), events, messages, stop, kwargs, ticket)))
+
+        started = time.monotonic()
+        hedge_delay = self._current_hedge_delay()
+        hedge_at = None if hedge_delay is None else started + hedge_delay
+        first_deadline = min(started + self.attempt_timeout, deadline)
+        winner = None
+        chunks = []
+        failures = 0
+        launch()
+        try:
+            while True:
+                wake = deadline if winner is not None else min(first_deadline, hedge_at or first_deadline)
+                try:
+                    index, kind, payload = await asyncio.wait_for(events.get(), max(0.0, wake - time.monotonic()))
+                except asyncio.TimeoutError:
+                    if winner is None and hedge_at is not None and time.monotonic() >= hedge_at:
+                        hedge_at = None
+                        admitted, ticket = self._admit_hedge(messages)
+                        if admitted:
+                            launch(ticket)
+                        continue
+                    raise LLMCallTimeout(f"LLMの応答が期限（{wake - started:.1f}秒）までに得られませんでした。")
+                if winner is None:
+                    if kind == "error":
+                        failures += 1
+                        if failures == len(tasks):
+                            raise payload
+                        continue
+                    winner = index
+                    self._won(index, started)
+                    for i, task in enumerate(tasks):
+                        if i != winner:
+                            task.cancel()
+                    if kind == "result":
+                        return payload
+                if index != winner:
+                    continue
+                if kind == "chunk":
+                    chunks.append(payload)
+                    if run_manager is not None and payload.text:
+                        state["streamed"] = True
+                        await run_manager.on_llm_new_token(payload.text, chunk=payload)
+                elif kind == "done":
+                    return await agenerate_from_stream(_aiter(chunks))
+                else:
+                    raise payload
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _arun_attempt(self, index, events, messages, stop, kwargs, ticket=None):
+        result = None
+        try:
+            if not self.streaming:
+                result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+                events.put_nowait((index, "result", result))
+                return
+            async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                events.put_nowait((index, "chunk", chunk))
+            events.put_nowait((index, "done", None))
+        except Exception as error:
+            events.put_nowait((index, "error", error))
+        finally:
+            self._release_hedge(ticket, result)
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+def _can_stream(model):
+    """モデルが同期のストリーミングを実装しているか"""
+    return type(model)._stream is not BaseChatModel._stream
+
+
+def _message_tokens(messages):
+    return sum(estimate_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+
+
+def _used_tokens(result):
+    """応答に含まれる実際のトークン使用量（入力+出力）を返す（含まれていなければNone）"""
+    total = None
+    for generation in result.generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            total = (total or 0) + usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+    return total
+
+
+class AdmissionControlledChatModel(ChatModelWrapper):
+    """LLM呼び出しを共有のスケジューラーで順番待ちさせてから実行する
+
+    優先度は呼び出し元のllm_priorityで決まる。待ち行列が満杯か待ち時間の上限を超えると
+    LLMOverloadedを送出する。キャッシュに応答があれば順番待ちせずに返す。
+    """
+
+    scheduler: Any
+    # 見積もりに加える出力トークン数（使用量は応答が返ってから実際の値に置き換える）
+    expected_output_tokens: int = EXPECTED_OUTPUT_TOKENS
+
+    def _estimate(self, messages):
+        return _message_tokens(messages) + self.expected_output_tokens
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        ticket = self.scheduler.acquire(self._estimate(messages))
+        result = None
+        try:
+            result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return result
+        finally:
+            self.scheduler.release(ticket, used_tokens=_used_tokens(result) if result is not None else None)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        ticket = await self.scheduler.aacquire(self._estimate(messages))
+        result = None
+        try:
+            result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return result
+        finally:
+            self.scheduler.release(ticket, used_tokens=_used_tokens(result) if result is not None else None)
+
+
+def resilience_options():
+    """環境変数からLLM呼び出しの期限・再試行・ヘッジの設定を読み込む
+
+    LLM_TIMEOUT_SECONDS: 呼び出し全体の期限（既定60）
+    LLM_ATTEMPT_TIMEOUT_SECONDS: 試行ごとの最初の応答までの期限（既定20）
+    LLM_MAX_RETRIES: 再試行の回数（既定2、負の値で期限・再試行・ヘッジをすべて無効にする）
+    LLM_HEDGE: onでヘッジを有効にする（既定off）。LLM_HEDGE_DELAY_SECONDSで遅延を固定できる（既定は直近のp95）
+    """
+    max_retries = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    if max_retries < 0:
+        return None
+    hedge_delay = os.getenv("LLM_HEDGE_DELAY_SECONDS")
+    return {
+        "timeout": float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+        "attempt_timeout": float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "20")),
+        "max_retries": max_retries,
+        "hedge": os.getenv("LLM_HEDGE", "off") == "on",
+        "hedge_delay": float(hedge_delay) if hedge_delay else None
+    }
+
+
+def create_llm(api_key, prompt_cache=None, resilience=None, **kwargs):
+    """エージェント共通の設定でClaudeのチャットモデルを作成する
+
+    prompt_cache（既定は環境変数PROMPT_CACHE、未設定ならon）が有効ならプロンプトの接頭辞にキャッシュの区切りを付け、
+    resilience（既定はresilience_options()、Falseで無効）に従って期限・再試行・ヘッジを加え、
+    LLM_MAX_CONCURRENCYなどでスケジューラーが有効なら呼び出しを順番待ちさせる。
+    """
+    # Anthropicクライアントの読み込みは重いため、最初にモデルを作るときまで遅らせる
+    from langchain_anthropic import ChatAnthropic
+
+    params = {
+        "model": DEFAULT_MODEL,
+        "temperature": DEFAULT_TEMPERATURE,
+        "streaming": True,
+        "cache": get_llm_cache()
+    }
+    params.update(kwargs)
+    cache = params.pop("cache")
+    if resilience is None:
+        resilience = resilience_options()
+    if resilience:
+        # 再試行はResilientChatModelが行うため、クライアント自身の再試行は止める
+        params.setdefault("max_retries", 0)
+        params.setdefault("default_request_timeout", resilience.get("attempt_timeout", 20.0))
+    llm = ChatAnthropic(api_key=api_key, cache=False, **params)
+    if prompt_cache is None:
+        prompt_cache = os.getenv("PROMPT_CACHE", "on") != "off"
+    if prompt_cache:
+        llm = PromptCachingChatModel(inner=llm, cache=False)
+    scheduler = get_llm_scheduler()
+    if resilience:
+        # ヘッジもスケジューラーの枠の中で送る
+        llm = ResilientChatModel(inner=llm, streaming=params["streaming"], scheduler=scheduler, cache=False, **resilience)
+    if scheduler is not None:
+        llm = AdmissionControlledChatModel(inner=llm, scheduler=scheduler, cache=False)
+    # 応答キャッシュは最も外側で引く（キャッシュにある応答は順番待ちさせない）
+    llm.cache = cache
+    return llm
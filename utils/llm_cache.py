@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+# 応答に影響しない項目（メッセージIDと、応答に付いていたメタデータ・使用量）
+_IGNORED_FIELDS = frozenset({"id", "response_metadata", "usage_metadata"})
+
+
+def normalize_prompt(prompt):
+    """キャッシュキー用にプロンプト（シリアライズ済みメッセージ列）を正規化する"""
+    try:
+        messages = json.loads(prompt)
+    except (TypeError, ValueError):
+        return _WHITESPACE.sub(" ", prompt).strip()
+    # 応答に影響しない項目と空の項目を除き、本文の空白をそろえる
+    # ツールの呼び出し（tool_calls, tool_call_id）や名前などの項目はキーに含める
+    normalized = []
+    for message in messages if isinstance(messages, list) else [messages]:
+        if not isinstance(message, dict) or not isinstance(message.get("kwargs"), dict):
+            normalized.append(message)
+            continue
+        fields = {
+            key: value for key, value in message["kwargs"].items()
+            if key not in _IGNORED_FIELDS and value not in (None, "", [], {})
+        }
+        if isinstance(fields.get("content"), str):
+            fields["content"] = _WHITESPACE.sub(" ", fields["content"]).strip()
+        normalized.append(fields)
+    return json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+
+
+def make_cache_key(prompt, llm_string):
+    """正規化したメッセージ列とモデル設定（モデル名・温度など）からキーを作る"""
+    raw = normalize_prompt(prompt) + "\x00" + llm_string
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    """キャッシュのヒット率を集計する"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+class InMemoryLLMCache(BaseCache):
+    """プロセス内のLRUキャッシュ"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, prompt, llm_string):
+        key = make_cache_key(prompt, llm_string)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        self.stats.record(value is not None)
+        return value
+
+    def update(self, prompt, llm_string, return_val):
+        key = make_cache_key(prompt, llm_string)
+        with self._lock:
+            self._entries[key] = return_val
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteLLMCache(BaseCache):
+    """SQLiteに保存する永続キャッシュ（件数上限とTTLで破棄する）"""
+
+    def __init__(self, path, max_entries=100000, ttl=7 * 24 * 3600, evict_interval=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self.stats = CacheStats()
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._conn.commit()
+
+    def lookup(self, prompt, llm_string):
+        key = make_cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND created > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        self.stats.record(row is not None)
+        if row is None:
+            return None
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt, llm_string, return_val):
+        key = make_cache_key(prompt, llm_string)
+        value = json.dumps([dumps(generation) for generation in return_val], ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._writes += 1
+            if self._writes % self.evict_interval == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def _evict(self, now):
+        """期限切れのエントリと、上限を超えた最も古いエントリを削除する"""
+        self._conn.execute("DELETE FROM llm_cache WHERE created <= ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+
+class TieredLLMCache(BaseCache):
+    """メモリ（LRU）とSQLiteの二段構成のキャッシュ"""
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+        self.stats = CacheStats()
+
+    def lookup(self, prompt, llm_string):
+        value = self.memory.lookup(prompt, llm_string)
+        if value is None:
+            value = self.disk.lookup(prompt, llm_string)
+            if value is not None:
+                # ディスクでヒットしたものはメモリに昇格させる
+                self.memory.update(prompt, llm_string, value)
+        self.stats.record(value is not None)
+        return value
+
+    def update(self, prompt, llm_string, return_val):
+        self.memory.update(prompt, llm_string, return_val)
+        self.disk.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs):
+        self.memory.clear()
+        self.disk.clear()
+
+
+def get_cache_stats(cache):
+    """キャッシュ（多段の場合は各段も含む）のヒット率を取得する"""
+    if cache is None:
+        return {}
+    stats = cache.stats.as_dict()
+    if isinstance(cache, TieredLLMCache):
+        stats["memory"] = cache.memory.stats.as_dict()
+        stats["disk"] = cache.disk.stats.as_dict()
+    return stats
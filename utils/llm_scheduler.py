@@ -0,0 +1,347 @@
+import asyncio
+import bisect
+import contextvars
+import itertools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from utils.metrics import REGISTRY
+
+# 優先度（小さいほど先に実行する）
+# interactive: 利用者が応答を待っているチャット（サブエージェントの呼び出しも同じ要求の一部として引き継ぐ）
+# batch: バッチ処理
+# background: 会話の要約など、応答を待たせない処理
+PRIORITIES = {"interactive": 0, "batch": 1, "background": 2}
+DEFAULT_PRIORITY = "interactive"
+
+# 優先度ごとの待ち行列の上限（超えた呼び出しはすぐに断る）と待ち時間の上限（秒）
+DEFAULT_QUEUE_LIMITS = {"interactive": 64, "batch": 256, "background": 32}
+DEFAULT_QUEUE_TIMEOUTS = {"interactive": 20.0, "batch": 300.0, "background": 120.0}
+
+# 待ち行列の状態を確認し直す間隔（秒）。トークンの使用量は時間の経過で枠が空くため
+_POLL_SECONDS = 0.5
+
+_priority = contextvars.ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "travel_agent_llm_queue_wait_seconds", "LLM呼び出しの実行待ちの時間", ("priority",)
+)
+ADMISSIONS = REGISTRY.counter(
+    "travel_agent_llm_admission_total", "LLM呼び出しの受け付け結果", ("priority", "outcome")
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "travel_agent_llm_queue_depth", "実行を待っているLLM呼び出しの数", ("priority",)
+)
+IN_FLIGHT = REGISTRY.gauge("travel_agent_llm_in_flight", "実行中のLLM呼び出しの数")
+WINDOW_TOKENS = REGISTRY.gauge("travel_agent_llm_window_tokens", "直近1分間に割り当てたトークン数")
+
+
+class LLMOverloaded(Exception):
+    """LLM呼び出しの受け付けを断ったことを表す
+
+    statusは呼び出し元に返すHTTPステータス（待ち行列が満杯なら429、待ち時間の上限を超えたら503）。
+    """
+
+    def __init__(self, message, status=503, retry_after=1):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+@contextmanager
+def llm_priority(priority):
+    """このブロック内（とそこから起動したタスク）のLLM呼び出しの優先度を設定する"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"不明な優先度'{priority}'です。{', '.join(PRIORITIES)} のいずれかを指定してください。")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    """現在のLLM呼び出しの優先度を返す"""
+    return _priority.get()
+
+
+class Ticket:
+    """実行を許可されたLLM呼び出し（終わったらreleaseに渡す）"""
+
+    __slots__ = ("rank", "seq", "priority", "tokens", "enqueued", "granted", "window_entry", "_wake")
+
+    def __init__(self, priority, seq, tokens, wake):
+        self.rank = PRIORITIES[priority]
+        self.seq = seq
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.window_entry = None
+        self._wake = wake
+
+    def __lt__(self, other):
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class LLMScheduler:
+    """全エージェントのLLM呼び出しを、同時実行数と1分あたりのトークン数の上限のもとで実行させる
+
+    実行を待つ呼び出しは優先度順（同じ優先度なら到着順）に並べる。interactive以外の呼び出しは
+    reserved_for_interactive個の枠を使わないため、バッチが混み合っても対話の呼び出しはすぐに始まる。
+    """
+
+    def __init__(self, max_concurrency=8, tokens_per_minute=None, reserved_for_interactive=None,
+                 queue_limits=None, queue_timeouts=None):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute or None
+        if reserved_for_interactive is None:
+            reserved_for_interactive = max_concurrency // 4
+        self.reserved_for_interactive = min(reserved_for_interactive, max_concurrency - 1)
+        self.queue_limits = dict(DEFAULT_QUEUE_LIMITS, **(queue_limits or {}))
+        self.queue_timeouts = dict(DEFAULT_QUEUE_TIMEOUTS, **(queue_timeouts or {}))
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._queued = dict.fromkeys(PRIORITIES, 0)
+        self._active = 0
+        # 直近1分間に割り当てたトークン [[時刻, トークン数], ...]
+        self._window = deque()
+        self._window_tokens = 0
+        self._seq = itertools.count()
+
+    def check(self, priority=None):
+        """待ち行列が満杯なら、呼び出しを始める前にLLMOverloaded（429）を送出する"""
+        priority = priority or current_priority()
+        with self._lock:
+            if self._queued[priority] >= self.queue_limits[priority]:
+                ADMISSIONS.inc(priority=priority, outcome="queue_full")
+                raise self._queue_full(priority)
+
+    def acquire(self, tokens, priority=None):
+        """実行の順番が来るまで待ち、Ticketを返す"""
+        event = threading.Event()
+        ticket = self._enqueue(priority or current_priority(), tokens, event.set)
+        deadline = ticket.enqueued + self.queue_timeouts[ticket.priority]
+        while True:
+            event.wait(max(0.0, min(deadline - time.monotonic(), _POLL_SECONDS)))
+            if self._poll(ticket, deadline):
+                return ticket
+
+    async def aacquire(self, tokens, priority=None):
+        """acquireの非同期版（待っている間はイベントループを解放する）"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        ticket = self._enqueue(priority or current_priority(), tokens, lambda: loop.call_soon_threadsafe(event.set))
+        deadline = ticket.enqueued + self.queue_timeouts[ticket.priority]
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(event.wait(), max(0.0, min(deadline - time.monotonic(), _POLL_SECONDS)))
+                except asyncio.TimeoutError:
+                    pass
+                if self._poll(ticket, deadline):
+                    return ticket
+        except asyncio.CancelledError:
+            self._abandon(ticket)
+            raise
+
+    def try_acquire(self, tokens, priority=None):
+        """待たずに実行できる場合だけTicketを返す（待っている呼び出しがあるか、枠が空いていなければNone）
+
+        ヘッジのように、送らなくても済む追加の呼び出しに使う。待ち行列には並ばない。
+        """
+        priority = priority or current_priority()
+        with self._lock:
+            now = time.monotonic()
+            self._expire_window(now)
+            ticket = Ticket(priority, next(self._seq), tokens, lambda: None)
+            if self._waiting or not self._fits(ticket):
+                ADMISSIONS.inc(priority=priority, outcome="skipped")
+                return None
+            self._grant(ticket, now)
+            self._update_gauges()
+        ADMISSIONS.inc(priority=priority, outcome="admitted")
+        return ticket
+
+    def release(self, ticket, used_tokens=None):
+        """実行の終わった呼び出しの枠を返す（used_tokensで見積もりを実際の使用量に置き換える）"""
+        with self._lock:
+            self._active -= 1
+            if used_tokens is not None and ticket.window_entry is not None:
+                self._window_tokens += used_tokens - ticket.window_entry[1]
+                ticket.window_entry[1] = used_tokens
+            self._dispatch()
+            self._update_gauges()
+
+    @contextmanager
+    def admit(self, tokens, priority=None):
+        """実行の順番が来るまで待ち、ブロックを抜けたら枠を返す"""
+        ticket = self.acquire(tokens, priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        """現在の実行数と待ち行列の状態を返す"""
+        with self._lock:
+            self._expire_window(time.monotonic())
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "queued": dict(self._queued),
+                "window_tokens": self._window_tokens,
+                "tokens_per_minute": self.tokens_per_minute
+            }
+
+    def _enqueue(self, priority, tokens, wake):
+        with self._lock:
+            if self._queued[priority] >= self.queue_limits[priority]:
+                ADMISSIONS.inc(priority=priority, outcome="queue_full")
+                raise self._queue_full(priority)
+            ticket = Ticket(priority, next(self._seq), tokens, wake)
+            bisect.insort(self._waiting, ticket)
+            self._queued[priority] += 1
+            self._dispatch()
+            self._update_gauges()
+            return ticket
+
+    def _poll(self, ticket, deadline):
+        """実行を許可されていればTrueを返す（待ち時間の上限を超えていればLLMOverloadedを送出する）"""
+        with self._lock:
+            if not ticket.granted:
+                # 時間の経過でトークンの枠が空いていれば、ここで割り当てる
+                self._dispatch()
+            if ticket.granted:
+                QUEUE_WAIT.observe(time.monotonic() - ticket.enqueued, priority=ticket.priority)
+                ADMISSIONS.inc(priority=ticket.priority, outcome="admitted")
+                return True
+            if time.monotonic() < deadline:
+                return False
+            self._remove(ticket)
+            self._update_gauges()
+            retry_after = self._retry_after(ticket.tokens)
+        ADMISSIONS.inc(priority=ticket.priority, outcome="timeout")
+        raise LLMOverloaded(
+            f"LLMの呼び出しが混み合っているため、{self.queue_timeouts[ticket.priority]:.0f}秒以内に開始できませんでした。",
+            status=503, retry_after=retry_after
+        )
+
+    def _abandon(self, ticket):
+        """取り消された呼び出しを待ち行列から外す（すでに許可されていれば枠を返す）"""
+        with self._lock:
+            granted = ticket.granted
+            if not granted:
+                self._remove(ticket)
+                self._update_gauges()
+        if granted:
+            self.release(ticket, used_tokens=0)
+
+    def _remove(self, ticket):
+        index = bisect.bisect_left(self._waiting, ticket)
+        if index < len(self._waiting) and self._waiting[index] is ticket:
+            del self._waiting[index]
+            self._queued[ticket.priority] -= 1
+
+    def _dispatch(self):
+        """先頭から順に、枠に収まる呼び出しの実行を許可する（ロックを保持して呼ぶこと）"""
+        now = time.monotonic()
+        self._expire_window(now)
+        while self._waiting:
+            ticket = self._waiting[0]
+            if not self._fits(ticket):
+                # 先頭を追い越させない（優先度の低い呼び出しが枠を先に使わないように）
+                break
+            del self._waiting[0]
+            self._queued[ticket.priority] -= 1
+            self._grant(ticket, now)
+
+    def _grant(self, ticket, now):
+        """呼び出しに実行の枠を割り当てる（ロックを保持して呼ぶこと）"""
+        self._active += 1
+        ticket.window_entry = [now, ticket.tokens]
+        self._window.append(ticket.window_entry)
+        self._window_tokens += ticket.tokens
+        ticket.granted = True
+        ticket._wake()
+
+    def _fits(self, ticket):
+        limit = self.max_concurrency if ticket.rank == 0 else self.max_concurrency - self.reserved_for_interactive
+        if self._active >= limit:
+            return False
+        if self.tokens_per_minute is None or not self._window_tokens:
+            # 1回で上限を超える呼び出しも、ほかに使用中のトークンがなければ実行する
+            return True
+        return self._window_tokens + ticket.tokens <= self.tokens_per_minute
+
+    def _expire_window(self, now):
+        while self._window and now - self._window[0][0] >= 60:
+            self._window_tokens -= self._window.popleft()[1]
+
+    def _retry_after(self, tokens=0):
+        """再試行までの目安（秒）。トークンの上限で待たされていれば、最も古い割り当てが枠から外れるまでの時間"""
+        if self.tokens_per_minute is not None and self._window and self._window_tokens + tokens > self.tokens_per_minute:
+            return max(1, math.ceil(60 - (time.monotonic() - self._window[0][0])))
+        return 1
+
+    def _queue_full(self, priority):
+        return LLMOverloaded(
+            "LLMの呼び出しが混み合っています。しばらくしてから再度お試しください。",
+            status=429, retry_after=self._retry_after()
+        )
+
+    def _update_gauges(self):
+        for priority, count in self._queued.items():
+            QUEUE_DEPTH.set(count, priority=priority)
+        IN_FLIGHT.set(self._active)
+        WINDOW_TOKENS.set(self._window_tokens)
+
+
+def _parse_limits(text, cast):
+    """'interactive=64,batch=256' 形式の設定を辞書にする"""
+    limits = {}
+    for part in filter(None, (text or "").split(",")):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in PRIORITIES:
+            raise ValueError(f"不明な優先度'{name}'です。{', '.join(PRIORITIES)} のいずれかを指定してください。")
+        limits[name] = cast(value)
+    return limits
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def create_llm_scheduler():
+    """環境変数の設定に従ってLLM呼び出しのスケジューラーを作成する
+
+    LLM_MAX_CONCURRENCY: 同時に実行するLLM呼び出しの上限（既定8、0で無効）
+    LLM_TOKENS_PER_MINUTE: 1分あたりのトークン数の上限（既定0で無制限）
+    LLM_RESERVED_FOR_INTERACTIVE: 対話の呼び出しだけが使える枠の数（既定は上限の1/4）
+    LLM_QUEUE_LIMITS, LLM_QUEUE_TIMEOUTS: 優先度ごとの待ち行列の上限と待ち時間の上限（例: interactive=64,batch=256）
+    """
+    max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    if max_concurrency <= 0:
+        return None
+    reserved = os.getenv("LLM_RESERVED_FOR_INTERACTIVE")
+    return LLMScheduler(
+        max_concurrency=max_concurrency,
+        tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+        reserved_for_interactive=int(reserved) if reserved else None,
+        queue_limits=_parse_limits(os.getenv("LLM_QUEUE_LIMITS"), int),
+        queue_timeouts=_parse_limits(os.getenv("LLM_QUEUE_TIMEOUTS"), float)
+    )
+
+
+def get_llm_scheduler():
+    """全エージェントで共有するLLM呼び出しのスケジューラーを取得する（無効ならNone）"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = create_llm_scheduler() or False
+        return _scheduler or None
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from langchain.schema import BaseMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+from utils.helpers import estimate_tokens
+from utils.llm_scheduler import llm_priority
+
+logger = logging.getLogger(__name__)
+
+# 古い会話の要約は応答処理とは別スレッドで行う
+_summary_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory-summary")
+
+
+def count_message_tokens(messages):
+    """メッセージ列のおおよそのトークン数を数える"""
+    return sum(estimate_tokens(message.content) for message in messages if isinstance(message.content, str))
+
+
+class TokenCountingBufferMemory(ConversationBufferMemory):
+    """会話全体を保持するメモリ（プロンプトに渡した会話履歴のトークン数を記録する）"""
+
+    last_prompt_tokens: int = 0
+
+    def load_memory_variables(self, inputs):
+        self.last_prompt_tokens = count_message_tokens(self.chat_memory.messages)
+        return super().load_memory_variables(inputs)
+
+
+class BackgroundSummaryBufferMemory(ConversationSummaryBufferMemory):
+    """直近の会話をトークン上限の範囲で保持し、それより古い会話を要約に畳み込むメモリ
+
+    上限を超えた会話は未要約の一覧に移し、要約の更新はバックグラウンドで
+    既存の要約と未要約分だけから差分的に行う。要約が終わるまでは未要約分を
+    そのままプロンプトに含めるため、会話の文脈は失われない。
+    要約に失敗した場合はログに記録し、未要約分は次の会話で再度要約する。
+    """
+
+    pending_messages: List[BaseMessage] = []
+    summarizing: bool = False
+    last_prompt_tokens: int = 0
+    # 会話と要約を読み書きするときのロック（メモリごとに持ち、他のセッションの要約を待たない）
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def load_memory_variables(self, inputs):
+        with self._lock:
+            messages = list(self.pending_messages) + list(self.chat_memory.messages)
+            summary = self.moving_summary_buffer
+        if summary:
+            messages = [self.summary_message_cls(content=summary)] + messages
+        self.last_prompt_tokens = count_message_tokens(messages)
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: self._to_buffer_string(messages)}
+
+    async def aload_memory_variables(self, inputs):
+        return self.load_memory_variables(inputs)
+
+    def prune(self):
+        """上限を超えた古い会話を未要約の一覧に移し、要約をバックグラウンドで開始する"""
+        with self._lock:
+            buffer = self.chat_memory.messages
+            tokens = count_message_tokens(buffer)
+            while buffer and tokens > self.max_token_limit:
+                message = buffer.pop(0)
+                tokens -= count_message_tokens([message])
+                self.pending_messages.append(message)
+            if not self.pending_messages or self.summarizing:
+                return
+            self.summarizing = True
+        _summary_executor.submit(self._fold_pending)
+
+    async def aprune(self):
+        self.prune()
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self.pending_messages = []
+
+    def wait_for_summary(self, timeout=None):
+        """実行中の要約が終わるまで待つ（テストやベンチマーク用）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.summarizing and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.01)
+
+    def _fold_pending(self):
+        """未要約の会話を既存の要約に畳み込む（新たに溜まった分がなくなるまで繰り返す）"""
+        while True:
+            with self._lock:
+                messages = list(self.pending_messages)
+                summary = self.moving_summary_buffer
+                if not messages:
+                    self.summarizing = False
+                    return
+            try:
+                # 要約は応答を待たせないため、対話やバッチの呼び出しより後に回す
+                with llm_priority("background"):
+                    new_summary = self.predict_new_summary(messages, summary)
+            except Exception:
+                # 未要約分は残しておき、次の会話で再度要約する（バックグラウンドの例外は誰も受け取らないため記録する）
+                logger.exception("会話の要約に失敗しました（未要約のメッセージ%d件）", len(messages))
+                with self._lock:
+                    self.summarizing = False
+                return
+            with self._lock:
+                self.moving_summary_buffer = new_summary
+                del self.pending_messages[:len(messages)]
+
+    def _to_buffer_string(self, messages):
+        return get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
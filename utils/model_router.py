@@ -0,0 +1,237 @@
+import os
+import re
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from utils.helpers import estimate_tokens
+from utils.llm import create_llm, get_llm_cache
+from utils.metrics import REGISTRY
+
+# モデルの階層（fast: 速くて安い, strong: 遅いが高品質）と既定のモデル・温度・料金（USD/100万トークン）
+MODEL_TIERS = {
+    "fast": {"model": "claude-3-haiku-20240307", "temperature": 0.2, "input_price": 0.25, "output_price": 1.25},
+    "strong": {"model": "claude-3-5-sonnet-20241022", "temperature": 0.7, "input_price": 3.0, "output_price": 15.0},
+}
+# プロンプトキャッシュの読み込み・書き込みの料金（通常の入力に対する倍率）
+CACHE_READ_PRICE_RATE = 0.1
+CACHE_WRITE_PRICE_RATE = 1.25
+
+# 役割ごとの割り当て（ReActの途中のステップの階層, 最終回答の階層）。MODEL_ROUTESなどで振り分けを有効にしたときだけ使う。
+# プロファイルの参照やツールの選択など機械的なステップはfastで行い、利用者が読む回答の統合やプランの作成はstrongで行う。
+# "*" は役割の指定がない呼び出し（会話の要約など）に使う。
+DEFAULT_ROUTES = {
+    "*": ("fast", "fast"),
+    "basic": ("fast", "fast"),
+    "advanced": ("fast", "strong"),
+    "coordinator": ("fast", "strong"),
+    "researcher": ("fast", "fast"),
+    "planner": ("fast", "strong"),
+    "budget_manager": ("fast", "fast"),
+}
+
+# 最終回答の階層に切り替えるステップ（役割ごとに、結果を受け取った後に最終回答を書くと見込まれるツール）
+# コーディネーターは旅行プランか予算分析を取得した後に回答をまとめる。タスクの割り当てやプロファイルの参照の後は
+# 次のツールを選ぶだけのため、ステップの階層のままにする。ここにない役割は、ツールの結果を受け取った後のステップを切り替える。
+FINAL_STEP_TOOLS = {
+    "advanced": ("WeatherTool", "HotelTool"),
+    "coordinator": ("GetTravelPlan", "GetBudgetAnalysis"),
+}
+
+# ReActの途中経過に含まれるツールの結果と、ツールの呼び出し（構造化チャット形式とテキスト形式）
+_OBSERVATION = re.compile(r"^Observation:", re.MULTILINE)
+_ACTION = re.compile(r'"action"\s*:\s*"([^"]+)"|^Action:[ \t]*(\S[^\n]*)$', re.MULTILINE)
+
+TIER_SECONDS = REGISTRY.histogram(
+    "travel_agent_llm_tier_call_seconds", "モデルの階層ごとのLLM呼び出しの時間（秒）", ("tier", "role")
+)
+TIER_TOKENS = REGISTRY.counter(
+    "travel_agent_llm_tier_tokens_total", "モデルの階層ごとの入出力トークン数", ("tier", "direction")
+)
+TIER_COST = REGISTRY.counter(
+    "travel_agent_llm_tier_cost_usd_total", "モデルの階層ごとの推定料金（USD）", ("tier",)
+)
+ESCALATIONS = REGISTRY.counter(
+    "travel_agent_llm_escalations_total", "最終回答を書くと見込まれるステップを最終回答の階層で実行した回数", ("role",)
+)
+
+
+def last_observed_action(text):
+    """ReActの途中経過で、最後に結果（Observation）を受け取ったツールの名前（まだなければNone）"""
+    observation = None
+    for observation in _OBSERVATION.finditer(text):
+        pass
+    if observation is None:
+        return None
+    action = None
+    for action in _ACTION.finditer(text, 0, observation.start()):
+        pass
+    if action is None:
+        return None
+    return (action.group(1) or action.group(2)).strip()
+
+
+def parse_routes(spec):
+    """'coordinator=fast/strong,researcher=fast' 形式の割り当てを辞書にする（辞書はそのまま検証する）"""
+    if not spec:
+        return {}
+    items = spec.items() if isinstance(spec, dict) else (part.partition("=")[::2] for part in spec.split(",") if part.strip())
+    routes = {}
+    for role, tiers in items:
+        if not tiers:
+            raise ValueError(f"割り当て'{role.strip()}'に階層がありません。'役割=ステップ/最終回答'の形式で指定してください。")
+        if isinstance(tiers, str):
+            tiers = tiers.strip().split("/")
+        tiers = tuple(tier.strip() for tier in tiers)
+        if len(tiers) == 1:
+            tiers = tiers * 2
+        unknown = [tier for tier in tiers if tier not in MODEL_TIERS]
+        if len(tiers) != 2 or unknown:
+            raise ValueError(
+                f"役割'{role.strip()}'の割り当て'{'/'.join(tiers)}'が不正です。"
+                f"{', '.join(MODEL_TIERS)} を「ステップ/最終回答」の形式で指定してください。"
+            )
+        routes[role.strip()] = tiers
+    return routes
+
+
+def estimate_cost(tier, input_tokens, output_tokens, cache_read=0, cache_write=0):
+    """トークン数から料金（USD）を見積もる"""
+    prices = MODEL_TIERS[tier]
+    uncached = max(0, input_tokens - cache_read - cache_write)
+    input_cost = (uncached + cache_read * CACHE_READ_PRICE_RATE + cache_write * CACHE_WRITE_PRICE_RATE) * prices["input_price"]
+    return (input_cost + output_tokens * prices["output_price"]) / 1_000_000
+
+
+def _usage(messages, result):
+    """応答の使用量（入力, 出力, キャッシュ読み込み, 書き込み）。応答に含まれなければ文字数から見積もる"""
+    generation = result.generations[0]
+    usage = getattr(generation.message, "usage_metadata", None)
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return (usage.get("input_tokens", 0), usage.get("output_tokens", 0),
+                details.get("cache_read") or 0, details.get("cache_creation") or 0)
+    input_tokens = sum(estimate_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
+    return input_tokens, estimate_tokens(generation.text), 0, 0
+
+
+class TieredChatModel(BaseChatModel):
+    """エージェントの役割とステップに応じて、階層の異なるモデルに呼び出しを振り分ける
+
+    for_roleで役割を結び付けたモデルをエージェントに渡す。階層は呼び出しの前にselect_tierで決め、
+    1回のステップでモデルを呼ぶのは1回だけ（応答はそのままストリーミングする）。final_onlyのモデル
+    （pipelineの各段階など、1回の呼び出しで役割の成果物を作る場合）は常に最終回答の階層を使う。
+    """
+
+    tiers: Dict[str, Any]
+    routes: Dict[str, Any]
+    role: Optional[str] = None
+    final_only: bool = False
+
+    @property
+    def _llm_type(self):
+        return "tiered"
+
+    @property
+    def _identifying_params(self):
+        return {
+            "tiers": {name: model._identifying_params for name, model in self.tiers.items()},
+            "route": self.route(),
+            "final_only": self.final_only
+        }
+
+    def for_role(self, role, final_only=False):
+        """役割を結び付けたモデルを返す（階層のモデルは共有する）"""
+        return self.model_copy(update={"role": role, "final_only": final_only})
+
+    def route(self):
+        """この役割の（ステップの階層, 最終回答の階層）"""
+        return self.routes.get(self.role) or self.routes.get("*") or DEFAULT_ROUTES["*"]
+
+    def _combine_llm_outputs(self, llm_outputs):
+        # 応答を生成した階層をコールバック（トレース）に渡す
+        combined = {}
+        for llm_output in llm_outputs:
+            combined.update(llm_output or {})
+        return combined
+
+    def get_num_tokens_from_messages(self, messages, tools=None):
+        return self.tiers[self.route()[0]].get_num_tokens_from_messages(messages, tools=tools)
+
+    def select_tier(self, messages):
+        """呼び出し前に、この呼び出しに使う階層を決める
+
+        最後に結果を受け取ったツールが、この役割で最終回答の前に使うツール（FINAL_STEP_TOOLS）であれば
+        最終回答の階層を使い、それ以外（ツールの結果がまだない、または次のツールを選ぶだけのステップ）は
+        ステップの階層を使う。
+        """
+        step_tier, final_tier = self.route()
+        if self.final_only:
+            return final_tier
+        if step_tier == final_tier or not messages:
+            return step_tier
+        tool = last_observed_action(str(messages[-1].content))
+        final_tools = FINAL_STEP_TOOLS.get(self.role)
+        if tool is None or (final_tools is not None and tool not in final_tools):
+            return step_tier
+        ESCALATIONS.inc(role=self.role or "")
+        return final_tier
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._call(self.select_tier(messages), messages, stop, run_manager, kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await self._acall(self.select_tier(messages), messages, stop, run_manager, kwargs)
+
+    def _call(self, tier, messages, stop, run_manager, kwargs):
+        start = time.perf_counter()
+        result = self.tiers[tier]._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return self._record(tier, messages, result, start)
+
+    async def _acall(self, tier, messages, stop, run_manager, kwargs):
+        start = time.perf_counter()
+        result = await self.tiers[tier]._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return self._record(tier, messages, result, start)
+
+    def _record(self, tier, messages, result, start):
+        """階層ごとの時間・トークン数・料金を記録し、どの階層の応答かを結果に残す"""
+        TIER_SECONDS.observe(time.perf_counter() - start, tier=tier, role=self.role or "")
+        input_tokens, output_tokens, cache_read, cache_write = _usage(messages, result)
+        TIER_TOKENS.inc(input_tokens, tier=tier, direction="input")
+        TIER_TOKENS.inc(output_tokens, tier=tier, direction="output")
+        TIER_COST.inc(estimate_cost(tier, input_tokens, output_tokens, cache_read, cache_write), tier=tier)
+        result.llm_output = dict(result.llm_output or {}, model_tier=tier)
+        return result
+
+
+def llm_for_role(llm, role, final_only=False):
+    """役割に応じたモデルを返す（振り分けを使わないモデルはそのまま返す）"""
+    if isinstance(llm, TieredChatModel):
+        return llm.for_role(role, final_only=final_only)
+    return llm
+
+
+def create_tiered_llm(api_key, routes=None, **kwargs):
+    """役割ごとにモデルの階層を振り分けるチャットモデルを作成する
+
+    routesは役割と階層の割り当て（辞書または'coordinator=fast/strong'形式の文字列）で、
+    環境変数MODEL_ROUTES、DEFAULT_ROUTESの順に補う。routesもMODEL_ROUTESも指定されていない場合、
+    またはMODEL_TIERING=offの場合は、従来どおり既定のモデルと温度の1つのモデルを使う。
+    各階層のモデルはLLM_FAST_MODEL, LLM_STRONG_MODELで変更できる。
+    """
+    env_routes = os.getenv("MODEL_ROUTES")
+    if os.getenv("MODEL_TIERING", "on") == "off" or not (routes or env_routes):
+        return create_llm(api_key, **kwargs)
+    cache = kwargs.pop("cache", None)
+    merged = dict(DEFAULT_ROUTES)
+    merged.update(parse_routes(env_routes))
+    merged.update(parse_routes(routes))
+    used = {tier for tiers in merged.values() for tier in tiers}
+    tiers = {}
+    for name in used:
+        settings = MODEL_TIERS[name]
+        model = os.getenv(f"LLM_{name.upper()}_MODEL", settings["model"])
+        tiers[name] = create_llm(api_key, model=model, temperature=settings["temperature"], cache=False, **kwargs)
+    # 応答キャッシュは振り分けの外側で引く（キーには役割の割り当てが含まれる）
+    return TieredChatModel(tiers=tiers, routes=merged, cache=get_llm_cache() if cache is None else cache)
@@ -0,0 +1,157 @@
+import json
+import os
+import re
+import threading
+from collections import deque
+
+# 既定の語彙（PREFERENCE_VOCABULARY_PATHでJSONファイルから差し替えられる）
+DEFAULT_VOCABULARY = {
+    "destinations": ["東京", "大阪", "京都", "札幌", "那覇", "沖縄", "北海道", "福岡", "名古屋", "広島"],
+    "activities": ["観光", "グルメ", "ショッピング", "温泉", "ハイキング", "ビーチ", "美術館", "博物館"],
+    "travel_styles": {
+        "贅沢": ["贅沢", "高級", "ラグジュアリー"],
+        "節約": ["節約", "安い", "格安", "バジェット"],
+        "アドベンチャー": ["アドベンチャー", "冒険", "アクティブ"],
+        "リラックス": ["リラックス", "のんびり", "ゆっくり"],
+        "文化体験": ["文化", "歴史", "伝統"]
+    }
+}
+
+# 「予算」の直後に続く金額（例: 予算は5万円）
+_BUDGET_TAIL = re.compile(r'[はをが]?(\d+)万?円')
+
+
+class AhoCorasick:
+    """複数のキーワードを1回の走査で見つけるAho-Corasickオートマトン"""
+
+    def __init__(self, keywords):
+        """keywordsは (キーワード, 付加情報) の列"""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for keyword, payload in keywords:
+            self._add(keyword, payload)
+        self._build_failure_links()
+
+    def _add(self, keyword, payload):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(payload)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # 接尾辞として含まれるキーワードも出力に含める
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text):
+        """テキスト中のすべての一致を (一致の終了位置, 付加情報) として返す"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for payload in output[state]:
+                yield index + 1, payload
+
+
+class PreferenceExtractor:
+    """ユーザー入力から旅行先・アクティビティ・予算・旅行スタイルを1回の走査で抽出する"""
+
+    def __init__(self, destinations, activities, travel_styles):
+        keywords = [(dest, ("destinations", dest)) for dest in destinations]
+        keywords += [(act, ("activities", act)) for act in activities]
+        # 複数のスタイルに一致した場合は、語彙の後ろにあるスタイルを優先する
+        for order, (style, style_keywords) in enumerate(travel_styles.items()):
+            keywords += [(keyword, ("travel_style", (order, style))) for keyword in style_keywords]
+        keywords.append(("予算", ("budget", None)))
+        self.automaton = AhoCorasick(keywords)
+
+    @classmethod
+    def from_config(cls, path):
+        """JSONファイルの語彙から作成する（未指定の項目は既定の語彙を使う）"""
+        with open(path, encoding="utf-8") as f:
+            vocabulary = dict(DEFAULT_VOCABULARY, **json.load(f))
+        return cls(vocabulary["destinations"], vocabulary["activities"], vocabulary["travel_styles"])
+
+    def extract(self, text):
+        """抽出結果を辞書で返す"""
+        destinations, activities = {}, {}
+        budget = None
+        style = None
+        for end, (kind, value) in self.automaton.iter_matches(text):
+            if kind == "destinations":
+                destinations[value] = True
+            elif kind == "activities":
+                activities[value] = True
+            elif kind == "travel_style":
+                if style is None or value[0] > style[0]:
+                    style = value
+            elif budget is None:
+                budget = self._parse_budget(text, end)
+        return {
+            "destinations": list(destinations),
+            "activities": list(activities),
+            "budget": budget,
+            "travel_style": style[1] if style else None
+        }
+
+    def apply(self, user_profile, text):
+        """抽出結果でユーザープロファイルを更新し、抽出結果を返す"""
+        preferences = self.extract(text)
+        for dest in preferences["destinations"]:
+            user_profile.update_preference("destinations", dest)
+        for act in preferences["activities"]:
+            user_profile.update_preference("activities", act)
+        if preferences["budget"] is not None:
+            user_profile.update_preference("budget", preferences["budget"])
+        if preferences["travel_style"] is not None:
+            user_profile.update_preference("travel_style", preferences["travel_style"])
+        return preferences
+
+    def _parse_budget(self, text, start):
+        """「予算」の直後の金額を円に換算する（万がなければ千円単位とみなす）"""
+        match = _BUDGET_TAIL.match(text, start)
+        if not match:
+            return None
+        budget = int(match.group(1))
+        if "万" in match.group(0):
+            return budget * 10000
+        return budget * 1000
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_preference_extractor():
+    """全エージェントで共有する抽出器を取得する（初回のみ語彙からオートマトンを構築する）"""
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            path = os.getenv("PREFERENCE_VOCABULARY_PATH")
+            if path:
+                _extractor = PreferenceExtractor.from_config(path)
+            else:
+                _extractor = PreferenceExtractor(
+                    DEFAULT_VOCABULARY["destinations"],
+                    DEFAULT_VOCABULARY["activities"],
+                    DEFAULT_VOCABULARY["travel_styles"]
+                )
+        return _extractor
@@ -0,0 +1,117 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from utils.metrics import REGISTRY
+
+# 先読みの件数（started: 開始, hit: ツールが使った, unused: ターン中に使われなかった, failed: 取得に失敗した）
+PREFETCHES = REGISTRY.counter(
+    "travel_agent_tool_prefetch_total", "ツール結果の先読みの件数", ("tool", "outcome")
+)
+
+# 実行中のターンの先読み（ツールはこれを参照する）
+_current = contextvars.ContextVar("turn_prefetch", default=None)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def prefetch_enabled():
+    """ツール結果の先読みを行うか（環境変数TOOL_PREFETCH=offで無効）"""
+    return os.getenv("TOOL_PREFETCH", "on") != "off"
+
+
+def _get_executor():
+    """先読みを実行するスレッドプールを取得する（初回のみ作成する）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("TOOL_PREFETCH_WORKERS", "4")), thread_name_prefix="tool-prefetch"
+            )
+        return _executor
+
+
+class TurnPrefetch:
+    """1ターンの間だけ有効なツール結果の先読み
+
+    エージェントはターンの開始時に入力から分かる旅行先の天気やホテルの取得をsubmitで始め、
+    最初のLLM呼び出しと並行して進める。activate()の間は、ツールがtakeで先読みの結果を参照する
+    （取得中なら完了を待つ）。先読みにない、または失敗したキーは、ツールが通常どおり取得する。
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._used = set()
+        self._lock = threading.Lock()
+
+    def submit(self, tool, key, compute):
+        """compute()による取得をバックグラウンドで始める（同じキーは1回だけ）"""
+        with self._lock:
+            if (tool, key) in self._futures:
+                return
+            self._futures[(tool, key)] = _get_executor().submit(compute)
+        PREFETCHES.inc(tool=tool, outcome="started")
+
+    def take(self, tool, keys):
+        """先読みに成功したキーと値の辞書を返す"""
+        found = {}
+        for key, future in self._lookup(tool, keys):
+            try:
+                found[key] = future.result()
+            except Exception:
+                PREFETCHES.inc(tool=tool, outcome="failed")
+                continue
+            PREFETCHES.inc(tool=tool, outcome="hit")
+        return found
+
+    async def atake(self, tool, keys):
+        """先読みに成功したキーと値の辞書を返す（非同期版）"""
+        found = {}
+        for key, future in self._lookup(tool, keys):
+            try:
+                found[key] = await asyncio.wrap_future(future)
+            except Exception:
+                PREFETCHES.inc(tool=tool, outcome="failed")
+                continue
+            PREFETCHES.inc(tool=tool, outcome="hit")
+        return found
+
+    def _lookup(self, tool, keys):
+        """先読み済みのキーとFutureの組を返す（使われたものとして記録する）"""
+        matches = []
+        with self._lock:
+            for key in keys:
+                future = self._futures.get((tool, key))
+                if future is not None and (tool, key) not in self._used:
+                    self._used.add((tool, key))
+                    matches.append((key, future))
+        return matches
+
+    @contextmanager
+    def activate(self):
+        """このターンの先読みをツールから参照できるようにする"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+            with self._lock:
+                unused = [tool for tool, key in self._futures if (tool, key) not in self._used]
+            for tool in unused:
+                PREFETCHES.inc(tool=tool, outcome="unused")
+
+
+def take_prefetched(tool, keys):
+    """実行中のターンで先読みされた結果を返す（先読みがなければ空の辞書）"""
+    prefetch = _current.get()
+    return prefetch.take(tool, keys) if prefetch is not None else {}
+
+
+async def atake_prefetched(tool, keys):
+    """実行中のターンで先読みされた結果を返す（非同期版）"""
+    prefetch = _current.get()
+    return await prefetch.atake(tool, keys) if prefetch is not None else {}
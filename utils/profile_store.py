@@ -0,0 +1,46 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class ProfileStore:
+    """ユーザープロファイルをSQLiteに保存する（再起動後も引き継がれる）"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "profile_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self, profile_id):
+        """保存されたプロファイルの辞書を返す（なければNone）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM profiles WHERE profile_id = ?", (profile_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, profile_id, data):
+        """プロファイルの辞書を保存する"""
+        value = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profiles (profile_id, data, updated) VALUES (?, ?, ?)",
+                (profile_id, value, time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, profile_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM profiles WHERE profile_id = ?", (profile_id,))
+            self._conn.commit()
\ No newline at end of file
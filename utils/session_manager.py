@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from utils.helpers import MEMORY_MODES
+
+def agent_options_from_request(data, session_id, user_id=None):
+    """リクエストで指定されたセッション単位のエージェント設定（新しいセッションでのみ有効）
+
+    user_idは認証の仕組みが確認した利用者ID（WSGIのREMOTE_USERなど）で、リクエスト本文のuser_idは使わない
+    （利用者が他人のIDを名乗れてしまうため）。認証されていなければプロファイルはセッションごとに保存する。
+    """
+    options = {
+        # 認証済みの利用者とセッションのIDが重ならないよう、保存先のキーを分ける
+        'user_id': f'user:{user_id}' if user_id else f'session:{session_id}'
+    }
+    memory_mode = data.get('memory_mode')
+    if memory_mode:
+        if memory_mode not in MEMORY_MODES:
+            raise ValueError(f"不明なメモリモード'{memory_mode}'です。{' または '.join(MEMORY_MODES)} を指定してください。")
+        options['memory_mode'] = memory_mode
+    return options
+
+
+class AgentSession:
+    """セッションごとのエージェントと排他制御を保持する"""
+
+    def __init__(self, session_id, agent_type, agent_factory, agent_options=None, store=None, max_history=50):
+        self.session_id = session_id
+        self.agent_type = agent_type
+        self.agent_options = agent_options or {}
+        self.lock = threading.Lock()
+        self.async_lock = asyncio.Lock()
+        self.history = []
+        self.last_access = time.monotonic()
+        # 保存先に記録した最後のターンと、前回の圧縮以降に追加したターン数
+        self.last_turn_id = 0
+        self.turns_since_compaction = 0
+        self._agent_factory = agent_factory
+        self._agent = None
+        self._store = store
+        self._max_history = max_history
+
+    @property
+    def agent(self):
+        """このセッションのエージェント（未作成なら作成する。呼び出し側でlockを保持すること）
+
+        保存先は確認しない。ターンの開始時にはbegin_turnを使う。
+        """
+        if self._agent is None:
+            self.begin_turn()
+        return self._agent
+
+    def begin_turn(self):
+        """ターンの開始時に1回だけ呼び、エージェントを返す（呼び出し側でlockを保持すること）
+
+        初回はエージェントを作成し、保存された会話からメモリを復元する。他のワーカーが同じセッションの
+        会話を進めていた場合は、保存先から読み直す。保存先を確認するのはこの呼び出しのときだけ。
+        """
+        if self._agent is None:
+            self._agent = self._agent_factory(self.agent_type, **self.agent_options)
+            self._rehydrate()
+        elif self._store is not None and self._store.last_turn_id(self.session_id, self.agent_type) != self.last_turn_id:
+            self._agent.memory.clear()
+            self._rehydrate()
+        return self._agent
+
+    def save_profile(self):
+        """このターンで変更されたプロファイルをまとめて保存する（呼び出し側でlockを保持すること）"""
+        profile = getattr(self._agent, "user_profile", None)
+        if profile is not None:
+            profile.save()
+
+    async def abegin_turn(self):
+        """begin_turnの非同期版（エージェントの作成と保存先の読み込みは別スレッドで行う。async_lockを保持すること）"""
+        return await asyncio.to_thread(self.begin_turn)
+
+    def discard_turn(self):
+        """記録しなかったターンをエージェントのメモリから取り除く（呼び出し側でlockを保持すること）
+
+        保存先があれば保存された会話から読み直し、なければメモリの末尾の1往復を取り除く。
+        """
+        if self._agent is None:
+            return
+        # プロファイルの変更は他のセッションとも共有しているため、取り消さずに保存する
+        self.save_profile()
+        memory = self._agent.memory
+        if self._store is not None:
+            memory.clear()
+            self._rehydrate()
+            return
+        messages = memory.chat_memory.messages
+        if len(messages) >= 2 and messages[-2].type == "human" and messages[-1].type == "ai":
+            del messages[-2:]
+
+    def _rehydrate(self):
+        """保存先の直近の会話をエージェントのメモリと履歴に読み込む"""
+        if self._store is None:
+            return
+        turns, self.last_turn_id = self._store.load_turns(self.session_id, self.agent_type, self._max_history)
+        self.history = [{'user': user_input, 'agent': response} for user_input, response in turns]
+        memory = self._agent.memory
+        for user_input, response in turns:
+            memory.chat_memory.add_user_message(user_input)
+            memory.chat_memory.add_ai_message(response)
+        # 要約付きのメモリは上限を超えた古い会話を要約に回す
+        prune = getattr(memory, "prune", None)
+        if prune is not None:
+            prune()
+
+    def touch(self):
+        """最終アクセス時刻を更新する"""
+        self.last_access = time.monotonic()
+
+    def busy(self):
+        """ターンを実行中か（lockまたはasync_lockが保持されている）"""
+        return self.lock.locked() or self.async_lock.locked()
+
+
+class SessionManager:
+    """セッションIDごとにエージェントを割り当て、LRUとTTLで破棄する
+
+    ターンを実行中のセッションは破棄しない（破棄すると同じセッションの次の要求が別のエージェントを作り、
+    2つのターンが同時に進んでしまう）。実行中のセッションが多いときは一時的に上限を超えて保持する。
+    """
+
+    def __init__(self, agent_factory, max_sessions=100, ttl=1800, max_history=50, store=None, compact_interval=20):
+        """storeを指定すると会話を保存先に追記し、破棄されたセッションや他のワーカーの
+        セッションも保存先から復元する（プロセス内にはmax_sessions件だけ保持する）
+        """
+        self.agent_factory = agent_factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_history = max_history
+        self.store = store
+        self.compact_interval = compact_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_session(self, session_id, agent_type, agent_options=None):
+        """セッションを取得する（存在しなければagent_optionsでエージェントを作成する）"""
+        key = (session_id, agent_type)
+        with self._lock:
+            now = time.monotonic()
+            self._evict_expired(now)
+            session = self._sessions.get(key)
+            if session is None:
+                session = AgentSession(
+                    session_id, agent_type, self.agent_factory, agent_options,
+                    store=self.store, max_history=self.max_history
+                )
+                self._sessions[key] = session
+                self._evict_overflow(key)
+            else:
+                self._sessions.move_to_end(key)
+            session.touch()
+            return session
+
+    def record_turn(self, session, user_input, response):
+        """会話履歴を追加し、ターン中に変更されたプロファイルを保存する（古いターンはmax_historyで切り詰める）"""
+        session.history.append({
+            'user': user_input,
+            'agent': response
+        })
+        if len(session.history) > self.max_history:
+            del session.history[:-self.max_history]
+        session.save_profile()
+        if self.store is None:
+            return
+        session.last_turn_id = self.store.append_turn(session.session_id, session.agent_type, user_input, response)
+        # 保存先の古いターンはまとめて削除する（追記のたびに書き換えない）
+        session.turns_since_compaction += 1
+        if session.turns_since_compaction >= self.compact_interval:
+            self.store.compact(session.session_id, session.agent_type, self.max_history)
+            session.turns_since_compaction = 0
+
+    async def arecord_turn(self, session, user_input, response):
+        """record_turnの非同期版（保存先への書き込みは別スレッドで行う）"""
+        await asyncio.to_thread(self.record_turn, session, user_input, response)
+
+    def remove(self, session_id):
+        """指定されたセッションIDのセッションをすべて破棄する（保存された会話も削除する）"""
+        with self._lock:
+            for key in [k for k in self._sessions if k[0] == session_id]:
+                del self._sessions[key]
+        if self.store is not None:
+            self.store.delete(session_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict_expired(self, now):
+        """TTLを超えてアクセスされていないセッションを破棄する（実行中のセッションは残す）"""
+        # OrderedDictは最終アクセス順に並んでいるため、先頭からTTL内のセッションまで確認すればよい
+        for key, session in list(self._sessions.items()):
+            if now - session.last_access < self.ttl:
+                break
+            if not session.busy():
+                del self._sessions[key]
+
+    def _evict_overflow(self, keep):
+        """上限を超えた分を最も古いセッションから破棄する（実行中のセッションと作成したばかりのkeepは飛ばす）"""
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        idle = []
+        for key, session in self._sessions.items():
+            if key != keep and not session.busy():
+                idle.append(key)
+                if len(idle) == excess:
+                    break
+        for key in idle:
+            del self._sessions[key]
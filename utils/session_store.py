@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SessionStore:
+    """会話のターンを保存する先の共通インターフェース
+
+    ターンは追記のみで保存し、セッション（session_id, agent_type）ごとに増加するturn_idを返す。
+    """
+
+    def append_turn(self, session_id, agent_type, user_input, response):
+        """ターンを追記し、そのturn_idを返す"""
+        raise NotImplementedError
+
+    def load_turns(self, session_id, agent_type, limit):
+        """直近limit件のターン [(ユーザー入力, 応答)] と最後のturn_id（なければ0）を返す"""
+        raise NotImplementedError
+
+    def last_turn_id(self, session_id, agent_type):
+        """最後のturn_idを返す（なければ0）"""
+        raise NotImplementedError
+
+    def compact(self, session_id, agent_type, keep):
+        """直近keep件より古いターンを削除する"""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        """セッションIDのすべてのターンを削除する"""
+        raise NotImplementedError
+
+
+class SQLiteSessionStore(SessionStore):
+    """会話のターンをSQLiteに保存する（同じファイルを使う複数のワーカーで共有できる）"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_turns ("
+            "turn_id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, agent_type TEXT NOT NULL, "
+            "user_input TEXT NOT NULL, response TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS session_turns_session ON session_turns (session_id, agent_type, turn_id)"
+        )
+        self._conn.commit()
+
+    def append_turn(self, session_id, agent_type, user_input, response):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO session_turns (session_id, agent_type, user_input, response, created) VALUES (?, ?, ?, ?, ?)",
+                (session_id, agent_type, user_input, response, time.time())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def load_turns(self, session_id, agent_type, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT turn_id, user_input, response FROM session_turns "
+                "WHERE session_id = ? AND agent_type = ? ORDER BY turn_id DESC LIMIT ?",
+                (session_id, agent_type, limit)
+            ).fetchall()
+        rows.reverse()
+        return [(user_input, response) for _, user_input, response in rows], (rows[-1][0] if rows else 0)
+
+    def last_turn_id(self, session_id, agent_type):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(turn_id) FROM session_turns WHERE session_id = ? AND agent_type = ?",
+                (session_id, agent_type)
+            ).fetchone()
+        return row[0] or 0
+
+    def compact(self, session_id, agent_type, keep):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM session_turns WHERE session_id = ? AND agent_type = ? AND turn_id < ("
+                "SELECT MIN(turn_id) FROM (SELECT turn_id FROM session_turns "
+                "WHERE session_id = ? AND agent_type = ? ORDER BY turn_id DESC LIMIT ?))",
+                (session_id, agent_type, session_id, agent_type, keep)
+            )
+            self._conn.commit()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+
+class KeyValueSessionStore(SessionStore):
+    """会話のターンを外部のKVS（Redis互換のリスト操作）に保存する
+
+    clientには incr, get, rpush, lrange, ltrim, delete, scan_iter を持つもの（例: redis.Redis）を渡す。
+    """
+
+    def __init__(self, client, prefix="travel-agent:session:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, session_id, agent_type):
+        return f"{self.prefix}{session_id}:{agent_type}"
+
+    def append_turn(self, session_id, agent_type, user_input, response):
+        key = self._key(session_id, agent_type)
+        turn_id = int(self.client.incr(f"{key}:seq"))
+        entry = json.dumps({"id": turn_id, "user": user_input, "agent": response}, ensure_ascii=False)
+        self.client.rpush(f"{key}:turns", entry)
+        return turn_id
+
+    def load_turns(self, session_id, agent_type, limit):
+        entries = [json.loads(entry) for entry in self.client.lrange(f"{self._key(session_id, agent_type)}:turns", -limit, -1)]
+        return [(entry["user"], entry["agent"]) for entry in entries], (entries[-1]["id"] if entries else 0)
+
+    def last_turn_id(self, session_id, agent_type):
+        return int(self.client.get(f"{self._key(session_id, agent_type)}:seq") or 0)
+
+    def compact(self, session_id, agent_type, keep):
+        self.client.ltrim(f"{self._key(session_id, agent_type)}:turns", -keep, -1)
+
+    def delete(self, session_id):
+        keys = list(self.client.scan_iter(f"{self.prefix}{session_id}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def create_session_store(backend=None):
+    """環境変数の設定に従って会話の保存先を作成する
+
+    SESSION_STORE: sqlite（既定, SESSION_DB_PATH）, redis（REDIS_URL, redisパッケージが必要）, off
+    """
+    backend = backend or os.getenv("SESSION_STORE", "sqlite")
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_DB_PATH", ".cache/sessions.sqlite"))
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError as e:
+            raise ValueError("SESSION_STORE=redisにはredisパッケージが必要です。") from e
+        return KeyValueSessionStore(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    raise ValueError(f"不明なSESSION_STOREの設定'{backend}'です。sqlite, redis, off のいずれかを指定してください。")
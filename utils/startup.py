@@ -0,0 +1,81 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# 経過時間の基準（アプリの先頭で読み込まれたときの時刻）
+STARTED = time.perf_counter()
+
+
+class StartupTimings:
+    """モジュールの遅延読み込みとエージェントの作成にかかった時間を記録する"""
+
+    def __init__(self):
+        self._imports = {}
+        # エージェント種別ごとの [回数, 合計, 初回, 最大]
+        self._constructions = {}
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure_import(self, module_name):
+        """モジュールの読み込み時間を記録する（読み込み済みなら初回の値を残す）"""
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._imports.setdefault(module_name, elapsed)
+
+    @contextmanager
+    def measure_construction(self, agent_type):
+        """エージェントの作成時間を記録する"""
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stats = self._constructions.get(agent_type)
+            if stats is None:
+                self._constructions[agent_type] = [1, elapsed, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[3] = max(stats[3], elapsed)
+
+    def mark(self, name):
+        """基準時刻からの経過時間を記録する（例: アプリの読み込み完了）"""
+        with self._lock:
+            self._marks.setdefault(name, time.perf_counter() - STARTED)
+
+    def as_dict(self):
+        """記録をミリ秒単位の辞書で返す"""
+        with self._lock:
+            return {
+                "marks_ms": {name: round(seconds * 1000, 1) for name, seconds in self._marks.items()},
+                "imports_ms": {name: round(seconds * 1000, 1) for name, seconds in self._imports.items()},
+                "constructions": {
+                    agent_type: {
+                        "count": count,
+                        "first_ms": round(first * 1000, 1),
+                        "mean_ms": round(total / count * 1000, 1),
+                        "max_ms": round(maximum * 1000, 1)
+                    }
+                    for agent_type, (count, total, first, maximum) in self._constructions.items()
+                }
+            }
+
+    def format_report(self):
+        """起動時間のレポートを文字列で返す"""
+        data = self.as_dict()
+        lines = ["起動時間レポート:"]
+        for name, ms in data["marks_ms"].items():
+            lines.append(f"  {name}: 起動から{ms:.1f}ms")
+        for name, ms in data["imports_ms"].items():
+            lines.append(f"  読み込み {name}: {ms:.1f}ms")
+        for agent_type, stats in data["constructions"].items():
+            lines.append(
+                f"  作成 {agent_type}: 初回{stats['first_ms']:.1f}ms / 平均{stats['mean_ms']:.1f}ms（{stats['count']}回）"
+            )
+        return "\n".join(lines)
+
+
+# プロセス全体で共有する記録
+startup_timings = StartupTimings()
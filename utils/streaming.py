@@ -0,0 +1,197 @@
+import asyncio
+import json
+import queue
+import re
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# ReActの出力中で最終回答が始まる位置（"action": "Final Answer" の後の "action_input": "）
+_FINAL_ANSWER_START = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+_JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', '\\': '\\', '/': '/'}
+
+
+class FinalAnswerParser:
+    """LLMのトークン列から最終回答の文字列部分だけを逐次取り出す"""
+
+    def __init__(self, react=True):
+        self.react = react
+        self._buffer = ""
+        self._in_answer = not react
+        self._done = False
+        self._escape = ""
+
+    def feed(self, token):
+        """トークンを追加し、新たに確定した最終回答の文字列を返す"""
+        if self._done:
+            return ""
+        if not self._in_answer:
+            self._buffer += token
+            match = _FINAL_ANSWER_START.search(self._buffer)
+            if not match:
+                return ""
+            self._in_answer = True
+            token = self._buffer[match.end():]
+            self._buffer = ""
+        if not self.react:
+            return token
+        return self._decode(token)
+
+    def _decode(self, text):
+        """JSON文字列のエスケープを解除し、閉じ引用符で打ち切る"""
+        out = []
+        for char in text:
+            if self._escape:
+                self._escape += char
+                if self._escape[1] == 'u':
+                    if len(self._escape) == 6:
+                        try:
+                            out.append(chr(int(self._escape[2:], 16)))
+                        except ValueError:
+                            pass
+                        self._escape = ""
+                    continue
+                out.append(_JSON_ESCAPES.get(char, char))
+                self._escape = ""
+            elif char == '\\':
+                self._escape = char
+            elif char == '"':
+                self._done = True
+                break
+            else:
+                out.append(char)
+        return "".join(out)
+
+
+class StreamingEventHandler(BaseCallbackHandler):
+    """エージェントの実行中イベントをキューに積むコールバック
+
+    eventsはput(event)を持つキュー（既定はqueue.Queue）。
+    """
+
+    def __init__(self, react=True, events=None):
+        self.events = events if events is not None else queue.Queue()
+        self.react = react
+        self._parsers = {}
+        self._tools = {}
+        self._stages = set()
+        self._lock = threading.Lock()
+
+    def put(self, event_type, **data):
+        """イベントをキューに追加する"""
+        self.events.put({"type": event_type, **data})
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._parsers[run_id] = FinalAnswerParser(self.react)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._parsers[run_id] = FinalAnswerParser(self.react)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        # ツール（サブエージェントを含む）やpipelineモードの段階の実行中に流れてくるトークンは最終回答ではない
+        with self._lock:
+            if self._tools or self._stages:
+                return
+        parser = self._parsers.get(run_id)
+        if parser is None:
+            return
+        text = parser.feed(token)
+        if text:
+            self.put("token", text=text)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._parsers.pop(run_id, None)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name", "")
+        with self._lock:
+            depth = len(self._tools)
+            self._tools[run_id] = name
+        self.put("tool_start", tool=name, input=input_str, depth=depth)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        with self._lock:
+            name = self._tools.pop(run_id, "")
+            depth = len(self._tools)
+        self.put("tool_end", tool=name, depth=depth)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            name = self._tools.pop(run_id, "")
+            depth = len(self._tools)
+        self.put("tool_error", tool=name, error=str(error), depth=depth)
+
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        # pipelineモードの段階の開始と終了（utils.tracing.trace_eventで記録される）
+        if name == "stage_start":
+            with self._lock:
+                self._stages.add(data["stage"])
+            self.put("stage_start", stage=data["stage"])
+        elif name == "stage_end":
+            with self._lock:
+                self._stages.discard(data["stage"])
+            self.put("stage_end", stage=data["stage"], status=data["status"])
+
+
+def format_sse(event):
+    """イベントをServer-Sent Events形式の文字列にする"""
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def stream_agent_response(run, react=True):
+    """run(handler)を別スレッドで実行し、発生したイベントを順に返すジェネレーター
+
+    runはエージェントを決めたら、その応答の形式（ReActか）をhandler.reactに設定してからhandlerをコールバックに渡す。
+    """
+    handler = StreamingEventHandler(react=react)
+
+    def worker():
+        try:
+            response = run(handler)
+            handler.put("done", response=response)
+        except Exception as e:
+            handler.put("error", error=str(e))
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        event = handler.events.get()
+        yield event
+        if event["type"] in ("done", "error"):
+            break
+
+
+
+class _LoopQueue:
+    """どのスレッドからでも、イベントループのasyncio.Queueにイベントを積めるキュー"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, event):
+        # コールバックはイベントループのスレッドでも、LangChainの別スレッドでも呼ばれうる
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+
+async def astream_agent_response(run, react=True):
+    """stream_agent_responseの非同期版（runはawaitできる関数で、イベントループ上で実行する）
+
+    クライアントが切断しても実行は取り消さない（同期版と同じく、ターンは最後まで実行して記録する）。
+    """
+    events = _LoopQueue(asyncio.get_running_loop())
+    handler = StreamingEventHandler(react=react, events=events)
+
+    async def worker():
+        try:
+            response = await run(handler)
+            handler.put("done", response=response)
+        except Exception as e:
+            handler.put("error", error=str(e))
+
+    task = asyncio.ensure_future(worker())
+    while True:
+        event = await events.queue.get()
+        yield event
+        if event["type"] in ("done", "error"):
+            break
+    await task
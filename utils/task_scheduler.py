@@ -0,0 +1,83 @@
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+class TaskScheduler:
+    """依存関係を宣言したタスクを、依存が解決したものから並列に実行する"""
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.tasks = {}
+        self.errors = {}
+
+    def add_task(self, name, func, depends_on=()):
+        """タスクを登録する（funcは依存タスクの結果の辞書を受け取る）"""
+        self.tasks[name] = (func, tuple(depends_on))
+
+    def run(self):
+        """すべてのタスクを実行し、タスク名と結果の辞書を返す
+
+        失敗したタスクの例外はerrorsに記録し、それに依存するタスクは実行しない。
+        """
+        self._validate()
+        results = {}
+        self.errors = {}
+        pending = dict(self.tasks)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # 依存先が失敗したタスクは実行せずに打ち切る（連鎖的に伝播させる）
+                skipped = True
+                while skipped:
+                    skipped = False
+                    for name, (_, deps) in list(pending.items()):
+                        failed = [dep for dep in deps if dep in self.errors]
+                        if failed:
+                            self.errors[name] = RuntimeError(f"依存タスク{', '.join(failed)}が失敗しました。")
+                            del pending[name]
+                            skipped = True
+
+                # 依存がすべて完了したタスクを投入する
+                for name, (func, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        inputs = {dep: results[dep] for dep in deps}
+                        # 呼び出し元のコンテキスト（コールバックの設定など）をタスクに引き継ぐ
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, func, inputs)] = name
+                        del pending[name]
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        self.errors[name] = e
+
+        return results
+
+    def _validate(self):
+        """未登録の依存先や循環依存がないことを確認する"""
+        for name, (_, deps) in self.tasks.items():
+            for dep in deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"タスク'{name}'の依存先'{dep}'が登録されていません。")
+
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"タスク'{name}'に循環依存があります。")
+            visiting.add(name)
+            for dep in self.tasks[name][1]:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.tasks:
+            visit(name)
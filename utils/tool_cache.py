@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class ToolResultCache:
+    """ツールの取得結果をTTL付きで保持し、同時の同一取得を1回にまとめる
+
+    compute関数がNoneを返した場合は「見つからなかった」結果として
+    negative_ttlの間だけキャッシュする。ttl_forを指定すると値ごとにTTLを決められる
+    （Noneを返せば通常のTTL、0以下なら保存せず、同時に待っていた呼び出しにだけ返す）。
+    """
+
+    def __init__(self, ttl=300, negative_ttl=60, max_entries=1024, ttl_for=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.ttl_for = ttl_for
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """キャッシュから取得し、なければcompute()で取得する"""
+        future, leader = self._begin(key)
+        if not leader:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, value=value)
+        return value
+
+    async def aget_or_compute(self, key, compute):
+        """キャッシュから取得し、なければawait compute()で取得する（非同期版）"""
+        future, leader = self._begin(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            value = await compute()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, value=value)
+        return value
+
+    def get_or_compute_many(self, keys, compute_many):
+        """複数キーをまとめて取得する（未取得のキーだけをcompute_many(keys)で一括取得する）"""
+        futures, leaders = self._begin_many(keys)
+        if leaders:
+            try:
+                values = compute_many(leaders)
+            except BaseException as e:
+                for key in leaders:
+                    self._finish(key, futures[key], error=e)
+                raise
+            for key in leaders:
+                self._finish(key, futures[key], value=values.get(key))
+        return {key: futures[key].result() for key in keys}
+
+    async def aget_or_compute_many(self, keys, compute_many):
+        """複数キーをまとめて取得する（非同期版）"""
+        futures, leaders = self._begin_many(keys)
+        if leaders:
+            try:
+                values = await compute_many(leaders)
+            except BaseException as e:
+                for key in leaders:
+                    self._finish(key, futures[key], error=e)
+                raise
+            for key in leaders:
+                self._finish(key, futures[key], value=values.get(key))
+        return {key: await asyncio.wrap_future(futures[key]) for key in keys}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _begin(self, key):
+        """キャッシュ済みまたは取得中のFutureを返す（自分が取得する場合はleader=True）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    future = Future()
+                    future.set_result(value)
+                    return future, False
+                del self._entries[key]
+            future = self._inflight.get(key)
+            if future is not None:
+                # 同じキーを取得中の呼び出しがあれば、その結果を待つ
+                self.coalesced += 1
+                return future, False
+            self.misses += 1
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _begin_many(self, keys):
+        """キーごとのFutureと、自分が取得すべきキーの一覧を返す"""
+        futures, leaders = {}, []
+        for key in dict.fromkeys(keys):
+            futures[key], leader = self._begin(key)
+            if leader:
+                leaders.append(key)
+        return futures, leaders
+
+    def _ttl(self, value):
+        if value is None:
+            return self.negative_ttl
+        ttl = self.ttl_for(value) if self.ttl_for is not None else None
+        return self.ttl if ttl is None else ttl
+
+    def _finish(self, key, future, value=None, error=None):
+        """取得結果を保存し、待っている呼び出しに通知する"""
+        with self._lock:
+            self._inflight.pop(key, None)
+            ttl = self._ttl(value) if error is None else 0
+            if ttl > 0:
+                self._entries[key] = (time.monotonic() + ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
@@ -0,0 +1,359 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import ensure_config, get_callback_manager_for_config
+
+from utils.helpers import estimate_tokens
+from utils.metrics import REGISTRY
+
+# エージェントの役割を示すメタデータのキー（initialize_agentやLLMChainのmetadataに指定する）
+AGENT_ROLE_KEY = "agent_role"
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "travel_agent_request_seconds", "チャットリクエスト全体の処理時間（秒）", ("agent_type", "status")
+)
+AGENT_RUN_SECONDS = REGISTRY.histogram(
+    "travel_agent_agent_run_seconds", "エージェント（サブエージェントを含む）1回の実行時間（秒）", ("agent", "status")
+)
+ITERATION_SECONDS = REGISTRY.histogram(
+    "travel_agent_react_iteration_seconds", "ReActの1ステップ（LLMの判断とツール実行）の時間（秒）", ("agent",)
+)
+ITERATIONS = REGISTRY.counter(
+    "travel_agent_react_iterations_total", "ReActのステップ数", ("agent",)
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "travel_agent_llm_call_seconds", "LLM呼び出しの時間（秒）", ("agent", "status")
+)
+LLM_TOKENS = REGISTRY.counter(
+    "travel_agent_llm_tokens_total", "LLMの入出力トークン数", ("agent", "direction")
+)
+LLM_CACHE_TOKENS = REGISTRY.counter(
+    "travel_agent_llm_prompt_cache_tokens_total",
+    "入力トークンのうちプロンプトキャッシュから読み込んだ（read）・書き込んだ（write）トークン数", ("agent", "kind")
+)
+TOOL_SECONDS = REGISTRY.histogram(
+    "travel_agent_tool_call_seconds", "ツール呼び出しの時間（秒）", ("tool", "status")
+)
+
+# 直近のトレース（/api/tracesで参照する）
+_recent_traces = deque(maxlen=int(os.getenv("TRACE_BUFFER_SIZE", "100")))
+_export_lock = threading.Lock()
+
+
+class Span:
+    """トレース中の1区間（LLM呼び出し、ツール呼び出し、ReActのステップなど）"""
+
+    __slots__ = ("kind", "name", "start", "end", "status", "attributes", "children", "agent", "iteration", "iterations")
+
+    def __init__(self, kind, name, agent=None, **attributes):
+        self.kind = kind
+        self.name = name
+        self.agent = agent
+        self.start = time.perf_counter()
+        self.end = None
+        self.status = "ok"
+        self.attributes = attributes
+        self.children = []
+        # エージェントの区間が現在実行中のReActステップと、その数
+        self.iteration = None
+        self.iterations = 0
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def finish(self, status=None):
+        if self.end is None:
+            self.end = time.perf_counter()
+            if status:
+                self.status = status
+        return self.duration
+
+    def to_dict(self, origin):
+        data = {
+            "kind": self.kind,
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+        }
+        if self.agent:
+            data["agent"] = self.agent
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """LangChainのコールバックからスパンの木を組み立て、メトリクスを記録する
+
+    エージェント（metadataにagent_roleを持つチェーン）の下に、ReActのステップごとの区間を作り、
+    その中にLLM呼び出しとツール呼び出しを並べる。ツールから呼ばれたサブエージェントは
+    ツールの区間の子になる。それ以外のチェーンは木に含めない。
+    """
+
+    # 非同期実行時もイベントの順序を保つため、イベントループ上で直接呼ばせる
+    run_inline = True
+
+    def __init__(self, root):
+        self.root = root
+        self._spans = {}
+        # 木に含めないチェーンのrun_id（親の区間を引き継ぐ）
+        self._passthrough = set()
+        self._lock = threading.Lock()
+
+    def _parent(self, parent_run_id):
+        """親の区間（木に含めないチェーンは親をたどる）"""
+        return self._spans.get(parent_run_id, self.root) if parent_run_id else self.root
+
+    def _agent_of(self, span):
+        return span.agent or "unknown"
+
+    def _start(self, run_id, parent_run_id, span):
+        parent = self._parent(parent_run_id)
+        if span.agent is None:
+            span.agent = parent.agent
+        # エージェント直下のLLM・ツール呼び出しは現在のReActステップの下に置く
+        if parent.kind == "agent" and span.kind in ("llm", "tool"):
+            if span.kind == "llm" and (parent.iteration is None or parent.iteration.attributes.get("decided")):
+                self._next_iteration(parent)
+            if parent.iteration is not None:
+                parent = parent.iteration
+        parent.children.append(span)
+        self._spans[run_id] = span
+
+    def _next_iteration(self, agent_span):
+        self._finish_iteration(agent_span)
+        agent_span.iterations += 1
+        iteration = Span("iteration", f"step {agent_span.iterations}", agent=agent_span.agent)
+        agent_span.iteration = iteration
+        agent_span.children.append(iteration)
+
+    def _finish_iteration(self, agent_span):
+        iteration = agent_span.iteration
+        if iteration is None:
+            return
+        agent_span.iteration = None
+        iteration.attributes.pop("decided", None)
+        ITERATION_SECONDS.observe(iteration.finish(), agent=self._agent_of(agent_span))
+        ITERATIONS.inc(agent=self._agent_of(agent_span))
+
+    # チェーン（エージェント）
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        with self._lock:
+            role = (metadata or {}).get(AGENT_ROLE_KEY)
+            parent = self._parent(parent_run_id)
+            # 実行時の設定で指定した役割は子のチェーンにも引き継がれるため、同じ役割の入れ子は木に含めない
+            if role and not (parent.kind == "agent" and parent.name == role):
+                self._start(run_id, parent_run_id, Span("agent", role, agent=role))
+            else:
+                # 木に含めないチェーンは親の区間をそのまま引き継ぐ
+                self._spans[run_id] = parent
+                self._passthrough.add(run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_chain(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_chain(run_id, "error")
+
+    def _end_chain(self, run_id, status):
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+            if run_id in self._passthrough:
+                self._passthrough.discard(run_id)
+                return
+            if span is None or span.kind != "agent":
+                return
+            self._finish_iteration(span)
+            span.attributes["iterations"] = span.iterations
+            AGENT_RUN_SECONDS.observe(span.finish(status), agent=span.agent, status=status)
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        with self._lock:
+            span = self._spans.get(run_id)
+            if span is not None and span.iteration is not None:
+                span.iteration.attributes["action"] = action.tool
+                span.iteration.attributes["decided"] = True
+
+    def on_agent_finish(self, finish, *, run_id, **kwargs):
+        with self._lock:
+            span = self._spans.get(run_id)
+            if span is not None and span.kind == "agent":
+                if span.iteration is not None:
+                    span.iteration.attributes["action"] = "Final Answer"
+                self._finish_iteration(span)
+
+    # LLM
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        prompt_tokens = sum(
+            estimate_tokens(message.content) for batch in messages for message in batch if isinstance(message.content, str)
+        )
+        self._start_llm(serialized, run_id, parent_run_id, prompt_tokens, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start_llm(serialized, run_id, parent_run_id, sum(estimate_tokens(p) for p in prompts), kwargs)
+
+    def _start_llm(self, serialized, run_id, parent_run_id, prompt_tokens, kwargs):
+        name = kwargs.get("name") or ((serialized or {}).get("id") or ["llm"])[-1]
+        with self._lock:
+            self._start(run_id, parent_run_id, Span("llm", name, estimated_input_tokens=prompt_tokens))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+            if span is None:
+                return
+            input_tokens, output_tokens, estimated = self._usage(response, span)
+            span.attributes.pop("estimated_input_tokens", None)
+            span.attributes.update(input_tokens=input_tokens, output_tokens=output_tokens)
+            if estimated:
+                span.attributes["estimated"] = True
+            cache_read, cache_write = self._cache_usage(response)
+            if cache_read or cache_write:
+                span.attributes.update(cache_read_tokens=cache_read, cache_write_tokens=cache_write)
+            tier = (response.llm_output or {}).get("model_tier")
+            if tier:
+                # utils.model_routerで振り分けた場合の、応答を生成したモデルの階層
+                span.attributes["model_tier"] = tier
+            agent = self._agent_of(span)
+            LLM_SECONDS.observe(span.finish("ok"), agent=agent, status="ok")
+            LLM_TOKENS.inc(input_tokens, agent=agent, direction="input")
+            LLM_TOKENS.inc(output_tokens, agent=agent, direction="output")
+            LLM_CACHE_TOKENS.inc(cache_read, agent=agent, kind="read")
+            LLM_CACHE_TOKENS.inc(cache_write, agent=agent, kind="write")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+            if span is None:
+                return
+            span.attributes["error"] = str(error)
+            LLM_SECONDS.observe(span.finish("error"), agent=self._agent_of(span), status="error")
+
+    def _usage(self, response, span):
+        """応答に含まれる使用量を返す（なければ文字数から見積もる）"""
+        generations = [generation for batch in response.generations for generation in batch]
+        input_tokens = output_tokens = 0
+        found = False
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+                found = True
+        if found:
+            return input_tokens, output_tokens, False
+        usage = (response.llm_output or {}).get("usage") or {}
+        if usage.get("input_tokens") is not None:
+            return usage.get("input_tokens", 0), usage.get("output_tokens", 0), False
+        output_tokens = sum(estimate_tokens(generation.text) for generation in generations)
+        return span.attributes.get("estimated_input_tokens", 0), output_tokens, True
+
+    @staticmethod
+    def _cache_usage(response):
+        """入力トークンのうちプロンプトキャッシュから読み込んだ分と書き込んだ分を返す"""
+        cache_read = cache_write = 0
+        for batch in response.generations:
+            for generation in batch:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                details = usage.get("input_token_details") or {}
+                cache_read += details.get("cache_read") or 0
+                cache_write += details.get("cache_creation") or 0
+        return cache_read, cache_write
+
+    # ツール
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        with self._lock:
+            self._start(run_id, parent_run_id, Span("tool", name, input=input_str[:200]))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, "error", error=str(error))
+
+    def _end_tool(self, run_id, status, **attributes):
+        with self._lock:
+            span = self._spans.pop(run_id, None)
+            if span is None:
+                return
+            span.attributes.update(attributes)
+            TOOL_SECONDS.observe(span.finish(status), tool=span.name, status=status)
+
+    # 出来事（trace_eventで記録する、時間を持たない区間）
+
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        with self._lock:
+            parent = self._spans.get(run_id, self.root)
+            span = Span("event", name, agent=parent.agent, **(data if isinstance(data, dict) else {"data": data}))
+            span.finish()
+            parent.children.append(span)
+
+
+class Trace:
+    """1リクエスト分のトレース"""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.timestamp = time.time()
+        self.root = Span("request", name, **attributes)
+        self.handler = TracingCallbackHandler(self.root)
+
+    def finish(self, status="ok"):
+        """トレースを終了し、リクエストのメトリクスを記録して保存する"""
+        REQUEST_SECONDS.observe(
+            self.root.finish(status), agent_type=self.root.attributes.get("agent_type", ""), status=status
+        )
+        data = self.to_dict()
+        _recent_traces.append(data)
+        path = os.getenv("TRACE_LOG_PATH")
+        if path:
+            line = json.dumps(data, ensure_ascii=False)
+            with _export_lock, open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return data
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "timestamp": self.timestamp, **self.root.to_dict(self.root.start)}
+
+
+@contextmanager
+def trace_request(name, **attributes):
+    """リクエストをトレースする（例外が発生した場合はstatusをerrorにする）"""
+    trace = Trace(name, **attributes)
+    try:
+        yield trace
+    except BaseException:
+        trace.finish("error")
+        raise
+    trace.finish("ok")
+
+
+def trace_event(name, data, callbacks=None):
+    """実行中のトレースに出来事（成果物の再利用など）を記録する
+
+    チェーンやツールの実行中ならその区間の子に、そうでなければcallbacksのトレースの直下に置く。
+    """
+    config = ensure_config()
+    if config.get("callbacks") is None:
+        config["callbacks"] = callbacks
+    manager = get_callback_manager_for_config(config)
+    manager.on_custom_event(name, data, run_id=manager.parent_run_id)
+
+
+def get_recent_traces(limit=20):
+    """直近のトレースを新しい順に返す"""
+    return list(reversed(_recent_traces))[:limit]